@@ -1,156 +1,68 @@
 import sys
-import os
 import time
-import tempfile
-from pathlib import Path
+import json
+import multiprocessing
 from datetime import datetime
-from typing import Generator
-from dotenv import load_dotenv
-from decimal import Decimal
+from functools import partial
+
+# Mốc bắt đầu để đo thời gian khởi động (xem bench_startup.py)
+STARTED = time.perf_counter()
 
 # PyQt5
-from PyQt5.QtCore import QDate
-from PyQt5.QtGui import QColor, QPixmap
+from PyQt5.QtCore import Qt, QDate, QTimer
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QMessageBox, QFileDialog, QTableWidgetItem
+    QApplication, QMainWindow, QMessageBox, QFileDialog, QVBoxLayout, QLineEdit, QCompleter, QShortcut
 )
+from PyQt5.QtGui import QKeySequence
 from PyQt5.QtMultimedia import QSound
-from PyQt5.uic import loadUiType
-from PyQt5.QtWebEngineWidgets import QWebEngineView
 
 # SQL & Database
-import pyodbc
-from sqlalchemy import create_engine, VARCHAR, NVARCHAR, INTEGER, DATE, DECIMAL
-from sqlalchemy.engine import URL, Engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-
-# Excel & Pandas
-import pandas as pd
-from pandas import DataFrame
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font, PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-
-# PDF & QR Code
-import qrcode
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from reportlab.lib.pagesizes import A4
-
-# Windows API (chỉ dùng khi chạy trên Windows)
-import win32print
-import win32api
+from config import settings
+from database import thong_ke_pool
+from workers import TaskManager, run_query
+from tracing import tracer
+from query_builder import build_search, TRANG_THAI_NHAP_KHO
+from aggregates import GROUPINGS, summary_query, summary_rows, detail_query
+from scan_engine import (
+    ScanEngine, ScanResult, validate_scan, is_location_code, QUEUED, XA_VAI, XUAT_KHO, CHUYEN_VI_TRI
+)
+from scan_journal import ScanJournal, SENDING, replay
+from burst_scan import BurstSession, eligible_query, flush_batch
+from delta_refresh import fetch_changes, run_query_with_mark
+from location_index import LocationIndex, located_query, index_rows
+from stock_filter import StockSnapshot, stock_query
+from repository import SqlServerStore
+from query_cache import QueryCache, estimate_size, kinds_for_action, kinds_for_states, ALL_KINDS
+from table_models import (
+    RollTableModel, StockSummaryModel, build_result, COT_ID, COT_SO_YARD, COT_TRANG_THAI,
+    HEADERS_NHAP_KHO, HEADERS_XA_VAI, HEADERS_XUAT_KHO, HEADERS_TON_KHO
+)
+
+# Excel (bulk_import, exporter), PDF & QR Code (labels), sơ đồ kho (warehouse_map,
+# plotly, QtWebEngine) và Windows API được
+# import khi dùng lần đầu để màn hình đăng nhập hiện lên nhanh
 
 # Load UI
 import qdarkstyle
 import resources_rc
+from ui_loader import load_ui
 
-# Đăng ký font Unicode cho ReportLab
-pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
-pdfmetrics.registerFont(TTFont('Arial-Bold', 'arialbd.ttf'))
-
-def get_resource_path(relative_path):
-    """Trả về đường dẫn đầy đủ đến tài nguyên."""
-    if getattr(sys, 'frozen', False):  # Kiểm tra nếu đang chạy file .exe
-        base_path = sys._MEIPASS
-    else:  # Nếu đang chạy bằng Python gốc
-        base_path = os.path.abspath(".")
-    return os.path.join(base_path, relative_path)
-
-def connect_to_db(): 
-    BASE_DIR = Path(__file__).resolve().parent
-    env_file = get_resource_path(".env")
-    load_dotenv(env_file)
-    try:
-        connection = pyodbc.connect(
-        'DRIVER={SQL Server};'
-        f'SERVER={os.getenv("SERVER")};'
-        f'DATABASE={os.getenv("DB")};'
-        f'UID={os.getenv("UID")};'
-        f'PWD={os.getenv("PASSWORD")}'
-    )
-        # connection = sqlite3.connect(db_file)
-        return connection
-    except pyodbc.Error as e:
-        print(f"Lỗi khi kết nối tới máy chủ: {e}")
-        return None
-
-def table_to_dataframe(table_widget,headers):
-        rows = table_widget.rowCount()
-        columns = table_widget.columnCount()
-        
-        # Lấy tiêu đề cột
-        # headers = [table_widget.horizontalHeaderItem(i).text() for i in range(columns)]
-        
-        # Lấy dữ liệu từ bảng
-        data = []
-        for row in range(rows):
-            row_data = []
-            for column in range(columns):
-                item = table_widget.item(row, column)
-                row_data.append(item.text() if item else '')  # Lấy text từ ô, nếu không có thì gán chuỗi rỗng
-            data.append(row_data)
-        
-        # Tạo DataFrame
-        df = pd.DataFrame(data, columns=headers)
-        return df
-    
-ui, _ = loadUiType(get_resource_path('Fb_Whs.ui'))
-
-#config URL cho engine
-BASE_DIR = Path(__file__).resolve().parent
-env_file = get_resource_path(".env")
-load_dotenv(env_file)
-
-class Settings():
-    API_PREFIX = ''
-    DATABASE_1_URL = URL.create(
-        "mssql+pyodbc",
-        username=os.getenv("UID"),
-        password=os.getenv("PASSWORD"),
-        host=os.getenv("SERVER"),
-        port=1433,
-        database=os.getenv("DB"),
-        query={
-           "driver": "ODBC Driver 17 for SQL Server",
-           "TrustServerCertificate": "yes" 
-        }
+def gui_may_in(path):
+    # Gửi lệnh in trực tiếp tới máy in mặc định (Windows API, chỉ dùng khi chạy trên Windows)
+    import win32print
+    import win32api
+    printer_name = win32print.GetDefaultPrinter()
+    win32api.ShellExecute(
+        0,
+        "print",
+        path,
+        None,
+        ".",
+        0
     )
 
-settings = Settings()
-#tạo engine để kêt nối database
-engine_1 = create_engine(settings.DATABASE_1_URL, pool_pre_ping=True)
-SessionLocal_1 = sessionmaker(autocommit=False, autoflush=False, bind=engine_1)
-
-Base = declarative_base()
-
-def get_db_1() -> Generator:
-    try:
-        db = SessionLocal_1()
-        yield db
-    finally:
-        db.close()
-#hàm import to sql       
-def import_to_sql(df: DataFrame, table_name: str, dtype: dict, engine: Engine):
-    # Show processing message
-    processing_message = QMessageBox()
-    processing_message.setWindowTitle("Đang xử lý")
-    processing_message.setText("Đang xử lý dữ liệu, vui lòng chờ...")
-    # processing_message.setStandardButtons(QMessageBox.NoButton)
-    processing_message.setModal(True)
-    processing_message.show()
-    QApplication.processEvents()  # Ensure UI updates during processing
-    time.sleep(0.01)  # Simulate processing time
-    try:
-        with engine.connect() as connection:
-            df.to_sql(name=table_name, con=connection, if_exists="append", index=False, dtype=dtype)
-            
-        processing_message.close()
-    except Exception as e:
-        processing_message.close()
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+# Dùng module giao diện biên dịch sẵn (python ui_loader.py), nếu không có thì đọc Fb_Whs.ui
+ui = load_ui()
 
 class MainApp(QMainWindow,ui):
     def __init__(self):
@@ -160,7 +72,72 @@ class MainApp(QMainWindow,ui):
         self.tabWidget.setCurrentIndex(0)
         self.tabWidget.tabBar().setVisible(False)
         self.menuBar.setVisible(False)
+        # Quản lý truy vấn chạy nền (mỗi tab tìm kiếm một khóa)
+        self.tac_vu = TaskManager(self)
+        # Bộ nhớ đệm kết quả tìm kiếm theo (tab, bộ lọc, nhà máy)
+        self.bo_nho_tim_kiem = QueryCache()
+        # Trạm quét dùng kết nối giữ sẵn, mỗi lần quét một câu UPDATE có điều kiện
+        self.quet = ScanEngine()
+        # Truy vấn nhân viên và cuộn vải (đăng nhập, xóa) qua lớp kho dữ liệu (repository.py)
+        self.kho_du_lieu = SqlServerStore(self.quet)
+        # Nhật ký quét offline: mọi lần quét được ghi cục bộ trước, đồng bộ nền khi có kết nối
+        self.nhat_ky_quet = ScanJournal()
+        self.nhat_ky_quet.purge()
+        self.dong_bo = ScanEngine()  # kết nối riêng cho việc đồng bộ lại, không tranh với trạm quét
+        self.ngoai_tuyen = False
+        self.loi_dong_bo_gan_nhat = None  # lỗi máy chủ (không phải mất kết nối) của lượt đồng bộ trước
+        self.bat_dau = datetime.now()
+        self.timer_dong_bo = QTimer(self)
+        self.timer_dong_bo.timeout.connect(self.dong_bo_nhat_ky_quet)
+        self.timer_dong_bo.start(settings.SCAN_REPLAY_INTERVAL_MS)
+        # Quét nhanh (xả vải, xuất kho): kiểm tra tại máy, gửi lên máy chủ theo lô
+        self.quet_lo = ScanEngine()
+        self.phien_quet_nhanh = {}
+        self.timer_quet_nhanh = QTimer(self)
+        self.timer_quet_nhanh.timeout.connect(self.gui_tat_ca_lo_quet_nhanh)
+        self.timer_quet_nhanh.start(settings.BURST_FLUSH_MS)
+        # Bảng của tab đang mở định kỳ lấy các dòng thay đổi kể từ lần tải trước (cả từ máy khác)
+        self.timer_thay_doi = QTimer(self)
+        self.timer_thay_doi.timeout.connect(self.lam_moi_bang_dang_xem)
+        if settings.DELTA_REFRESH_MS > 0:
+            self.timer_thay_doi.start(settings.DELTA_REFRESH_MS)
+        # Chỉ mục vị trí trong bộ nhớ (ID -> vị trí, vị trí -> các ID), cập nhật cùng chu kỳ
+        self.chi_muc_vi_tri = LocationIndex()
+        self.timer_thay_doi.timeout.connect(self.lam_moi_chi_muc_vi_tri)
+        # Bảng kết quả dùng model dạng cột thay cho QTableWidgetItem từng ô
+        self.model_nhap_kho = RollTableModel(HEADERS_NHAP_KHO, self)
+        self.model_xa_vai = RollTableModel(HEADERS_XA_VAI, self)
+        self.model_xuat_kho = RollTableModel(HEADERS_XUAT_KHO, self)
+        self.model_ton_kho = RollTableModel(HEADERS_TON_KHO, self)
+        self.tableWidget.setModel(self.model_nhap_kho)
+        self.tableWidget_2.setModel(self.model_xa_vai)
+        self.tableWidget_5.setModel(self.model_xuat_kho)
+        self.tableWidget_6.setModel(self.model_ton_kho)
+        # Cây tổng hợp tồn kho (số cuộn, số yard theo nhóm do máy chủ tính)
+        self.model_tong_hop = StockSummaryModel(self)
+        self.treeView_6.setModel(self.model_tong_hop)
+        self.treeView_6.expanded.connect(self.mo_rong_nhom_ton_kho)
+        self.cb401.addItems([name for name, _ in GROUPINGS])
+        self.cb401.currentIndexChanged.connect(self.tai_tong_hop_ton_kho)
+        self.bo_loc_ton_kho = None
+        # Tồn kho của nhà máy tải một lần vào bộ nhớ, các ô lọc lọc ngay tại máy khi gõ
+        self.ton_kho_cuc_bo = None
+        for o_loc in (self.tb401, self.tb402, self.tb403, self.tb404, self.tb405):
+            o_loc.textChanged.connect(self.loc_ton_kho)
+        # Sơ đồ kho (heatmap theo vị trí), tạo khi mở tab sơ đồ lần đầu
+        self.so_do_kho = {}
         
+        # Ô tìm nhanh trên thanh menu: vị trí của một cuộn hoặc các cuộn tại một vị trí
+        self.tb_tim_nhanh = QLineEdit(self.menuBar)
+        self.tb_tim_nhanh.setPlaceholderText("Tìm nhanh: ID cuộn hoặc mã vị trí")
+        self.tb_tim_nhanh.setClearButtonEnabled(True)
+        self.tb_tim_nhanh.setMinimumWidth(250)
+        self.tb_tim_nhanh.returnPressed.connect(self.tim_nhanh)
+        self.menuBar.setCornerWidget(self.tb_tim_nhanh, Qt.TopRightCorner)
+        # Tab chẩn đoán (ẩn): thời gian các thao tác, mở bằng Ctrl+Shift+D sau khi đăng nhập
+        self.chan_doan = None
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_chan_doan_tab)
+
         # self.toolBar.setVisible(False)
         self.bt001.clicked.connect(self.login)
         self.menu11.triggered.connect(self.show_nhap_kho_tab)
@@ -204,6 +181,8 @@ class MainApp(QMainWindow,ui):
         self.tb501.returnPressed.connect(self.handle_scan_xa_vai)  # Xử lý khi nhấn Enter
         self.tb601.returnPressed.connect(self.handle_scan_xuat_kho)  # Xử lý khi nhấn Enter
         self.tb701.returnPressed.connect(self.handle_scan_chuyen_vi_tri)  # Xử lý khi nhấn Enter
+        self.cb501.toggled.connect(partial(self.bat_tat_quet_nhanh, XA_VAI))
+        self.cb601.toggled.connect(partial(self.bat_tat_quet_nhanh, XUAT_KHO))
         ####
         # self.tableWidget.cellChanged.connect(self.cap_nhat_QR)
 
@@ -212,18 +191,13 @@ class MainApp(QMainWindow,ui):
         un = self.tb001.text()
         pw = self.tb002.text()
         
-        connection = connect_to_db()
-        if connection is None:
+        try:
+            with tracer.span("login"):
+                result = self.kho_du_lieu.authenticate(fty, un, pw)
+        except ConnectionError:
             self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
             return
-        cursor = connection.cursor()
-        cursor.execute("""
-                SELECT macongty, masothe, hoten, phongban, Kho 
-                FROM HR.DBO.NHANVIEN 
-                WHERE macongty = ? AND masothe = ? AND matkhau = ? AND Kho IS NOT NULL
-            """, (fty, un, pw))
-        result = cursor.fetchone()
-             
+
         if result:
             self.menuBar.setVisible(True)
             self.tabWidget.setCurrentIndex(1)
@@ -244,196 +218,454 @@ class MainApp(QMainWindow,ui):
             self.progressBar_6.setValue(0)  # Khởi tạo giá trị là 0
             self.progressBar_6.setMinimum(0)
             self.progressBar_6.setMaximum(100)
+            self.tai_chi_muc_vi_tri()
         else:
             QSound.play(":/sounds/sounds/error.wav") # Phát âm thanh lỗi
             self.lb002.setText("Tài khoản hoặc mật khẩu không đúng!")
     def search_nhap_kho(self):
-        tu_ngay = self.de101.date().toString("yyyy-MM-dd")
-        den_ngay = self.de102.date().toString("yyyy-MM-dd")
-        style = self.tb101.text()
-        mo = self.tb102.text()
-        lot = self.tb103.text()
-        mau = self.tb104.text()
-        vitri = self.tb105.text()
+        filters = {
+            'tu_ngay': self.de101.date().toPyDate(),
+            'den_ngay': self.de102.date().toPyDate(),
+            'STYLE': self.tb101.text(),
+            'MO': self.tb102.text(),
+            'LOT': self.tb103.text(),
+            'MAU': self.tb104.text(),
+            'VI_TRI': self.tb105.text(),
+        }
         nha_may = self.lb000.text()
         
-        connection = connect_to_db()
-        if connection is None:
-            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
-            return
-        cursor = connection.cursor()
-        cursor.execute(f"""
-                SELECT NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
-                CONVERT(VARCHAR, THOI_GIAN_XA, 120) AS THOI_GIAN_XA,
-                CONVERT(VARCHAR, THOI_GIAN_XUAT_KHO, 120) AS THOI_GIAN_XUAT_KHO,
-                TRANG_THAI
-                FROM DANH_SACH_CUON_VAI
-                WHERE NGAY_NHAN BETWEEN '{tu_ngay}' AND '{den_ngay}' 
-                AND STYLE LIKE '%{style}%'
-                AND MO LIKE '%{mo}%'
-                AND LOT LIKE '%{lot}%'
-                AND MAU LIKE '%{mau}%'
-                AND ISNULL(VI_TRI,'') LIKE '%{vitri}%'
-                AND NHA_MAY LIKE '%{nha_may}%'
-            """)
-        results = cursor.fetchall()
-        # Xóa dữ liệu cũ trong TableWidget
-        self.tableWidget.setRowCount(0)
-        
-        # Hiển thị dữ liệu trong TableWidget
-        for row_idx, row_data in enumerate(results):
-            self.tableWidget.insertRow(row_idx)
-            for col_idx, value in enumerate(row_data):
-                item = QTableWidgetItem(str(value) if value is not None else "")
-                self.tableWidget.setItem(row_idx, col_idx, item)
-            
-            # Cập nhật progress bar
-            self.progressBar.setValue(int((row_idx + 1) * 100 / len(results)))
-        
-        # Gọi hàm tổng số dòng
-        self.tong_so_dong()
+        query = build_search('nhap_kho', filters, nha_may)
+        # Chạy truy vấn ở luồng nền, kết quả trả về qua signal
+        self.chay_tim_kiem("nhap_kho", query, self.model_nhap_kho, self.progressBar, self.tong_so_dong,
+                           cache_key=QueryCache.key('nhap_kho', filters, nha_may))
         
     def search_xa_vai(self):
-        tu_ngay = self.de201.date().toString("yyyy-MM-dd")
-        den_ngay = self.de202.date().toString("yyyy-MM-dd")
-        style = self.tb201.text()
-        mo = self.tb202.text()
-        lot = self.tb203.text()
-        mau = self.tb204.text()
-        vitri = self.tb205.text()
+        filters = {
+            'tu_ngay': self.de201.date().toPyDate(),
+            'den_ngay': self.de202.date().toPyDate(),
+            'STYLE': self.tb201.text(),
+            'MO': self.tb202.text(),
+            'LOT': self.tb203.text(),
+            'MAU': self.tb204.text(),
+            'VI_TRI': self.tb205.text(),
+        }
         nha_may = self.lb000.text()
         
-        connection = connect_to_db()
-        if connection is None:
-            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
-            return
-        cursor = connection.cursor()
-        sql = f"""
-                SELECT NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
-                CONVERT(VARCHAR, THOI_GIAN_XA, 120) AS THOI_GIAN_XA,
-                CAST(DATEDIFF(MINUTE,THOI_GIAN_XA,GETDATE())/60.0 AS DEC(10,2)) AS SO_GIO
-                FROM DANH_SACH_CUON_VAI
-                WHERE (CAST(THOI_GIAN_XA AS DATE) BETWEEN '{tu_ngay}' AND '{den_ngay}')
-                AND STYLE LIKE '%{style}%'
-                AND MO LIKE '%{mo}%'
-                AND LOT LIKE '%{lot}%'
-                AND MAU LIKE '%{mau}%'
-                AND ISNULL(VI_TRI,'') LIKE '%{vitri}%'
-                AND NHA_MAY LIKE '%{nha_may}%'
-                AND TRANG_THAI = N'Xả vải'
-            """
-        cursor.execute(sql)
-        results = cursor.fetchall()
-        # Xóa dữ liệu cũ trong TableWidget
-        self.tableWidget_2.setRowCount(0)
-        
-        # Hiển thị dữ liệu trong TableWidget
-        for row_idx, row_data in enumerate(results):
-            self.tableWidget_2.insertRow(row_idx)
-            so_gio = row_data[12]
-            for col_idx, value in enumerate(row_data):
-                item = QTableWidgetItem(str(value) if value is not None else "")
-                self.tableWidget_2.setItem(row_idx, col_idx, item)
-                if so_gio >= 24:
-                    item.setBackground(QColor("#008a10"))          
-            # Cập nhật progress bar
-            self.progressBar_2.setValue(int((row_idx + 1) * 100 / len(results)))
-        
-        # Gọi hàm tổng số dòng
-        self.tong_so_dong_xa_vai()
+        query = build_search('xa_vai', filters, nha_may)
+        # Đánh dấu cuộn vải đã xả quá 24 giờ (cột SO_GIO)
+        self.chay_tim_kiem("xa_vai", query, self.model_xa_vai, self.progressBar_2, self.tong_so_dong_xa_vai,
+                           hours_col=12, cache_key=QueryCache.key('xa_vai', filters, nha_may))
     
     def search_xuat_kho(self):
-        tu_ngay = self.de301.date().toString("yyyy-MM-dd")
-        den_ngay = self.de302.date().toString("yyyy-MM-dd")
-        style = self.tb301.text()
-        mo = self.tb302.text()
-        lot = self.tb303.text()
-        mau = self.tb304.text()
+        filters = {
+            'tu_ngay': self.de301.date().toPyDate(),
+            'den_ngay': self.de302.date().toPyDate(),
+            'STYLE': self.tb301.text(),
+            'MO': self.tb302.text(),
+            'LOT': self.tb303.text(),
+            'MAU': self.tb304.text(),
+        }
         nha_may = self.lb000.text()
         
-        connection = connect_to_db()
-        if connection is None:
-            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
-            return
-        cursor = connection.cursor()
-        sql = f"""
-                SELECT NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
-                CONVERT(VARCHAR, THOI_GIAN_XA, 120) AS THOI_GIAN_XA,
-                CONVERT(VARCHAR, THOI_GIAN_XUAT_KHO, 120) AS THOI_GIAN_XUAT_KHO 
-                FROM DANH_SACH_CUON_VAI
-                WHERE (CAST(THOI_GIAN_XUAT_KHO AS DATE) BETWEEN '{tu_ngay}' AND '{den_ngay}')
-                AND STYLE LIKE '%{style}%'
-                AND MO LIKE '%{mo}%'
-                AND LOT LIKE '%{lot}%'
-                AND MAU LIKE '%{mau}%'
-                AND NHA_MAY LIKE '%{nha_may}%'
-                AND TRANG_THAI = N'Xuất kho'
-            """
-        cursor.execute(sql)
-        results = cursor.fetchall()
-        # Xóa dữ liệu cũ trong TableWidget
-        self.tableWidget_5.setRowCount(0)
-        
-        # Hiển thị dữ liệu trong TableWidget
-        for row_idx, row_data in enumerate(results):
-            self.tableWidget_5.insertRow(row_idx)
-            for col_idx, value in enumerate(row_data):
-                item = QTableWidgetItem(str(value) if value is not None else "")
-                self.tableWidget_5.setItem(row_idx, col_idx, item)
-            
-            # Cập nhật progress bar
-            self.progressBar_5.setValue(int((row_idx + 1) * 100 / len(results)))
-        
-        # Gọi hàm tổng số dòng
-        self.tong_so_dong_xuat_kho()   
+        query = build_search('xuat_kho', filters, nha_may)
+        self.chay_tim_kiem("xuat_kho", query, self.model_xuat_kho, self.progressBar_5, self.tong_so_dong_xuat_kho,
+                           cache_key=QueryCache.key('xuat_kho', filters, nha_may))
     
+    def bo_loc_o_ton_kho(self):
+        return {
+            'STYLE': self.tb401.text(),
+            'MO': self.tb402.text(),
+            'LOT': self.tb403.text(),
+            'MAU': self.tb404.text(),
+            'VI_TRI': self.tb405.text(),
+        }
+
     def search_ton_kho(self):
-        style = self.tb401.text()
-        mo = self.tb402.text()
-        lot = self.tb403.text()
-        mau = self.tb404.text()
-        vitri = self.tb405.text()
+        filters = self.bo_loc_o_ton_kho()
         nha_may = self.lb000.text()
         
-        connection = connect_to_db()
-        if connection is None:
-            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
+        ton_kho = self.ton_kho_cuc_bo
+        if ton_kho is not None and ton_kho.nha_may == nha_may:
+            # Đã có tồn kho trong bộ nhớ: lọc tại máy ngay rồi lấy các thay đổi mới nhất,
+            # hoặc tải lại toàn bộ nếu máy chủ không trả được thay đổi (không có mốc)
+            self.loc_ton_kho()
+            if ton_kho.row_version is not None:
+                self.lam_moi_ton_kho_cuc_bo()
+            else:
+                self.tai_ton_kho_cuc_bo(nha_may)
+        else:
+            query = build_search('ton_kho', filters, nha_may)
+            # Tổng số yard lấy cùng câu COUNT nên có ngay cả khi bảng mới tải trang đầu
+            self.chay_tim_kiem("ton_kho", query, self.model_ton_kho, self.progressBar_6, self.tong_so_dong_ton_kho,
+                               on_count=lambda ket_qua: self.lb44.setText(f"{ket_qua[1] or 0:,.0f}"),
+                               cache_key=QueryCache.key('ton_kho', filters, nha_may))
+            # Trong lúc đó tải toàn bộ tồn kho, xong thì chuyển sang lọc tại máy
+            self.tai_ton_kho_cuc_bo(nha_may)
+        self.bo_loc_ton_kho = (filters, nha_may)
+        self.tai_tong_hop_ton_kho()
+
+    def tai_ton_kho_cuc_bo(self, nha_may):
+        """Tải toàn bộ tồn kho của nhà máy vào bộ nhớ (ở luồng nền, chỉ mục các cột lọc dựng luôn ở đó)."""
+        if self.tac_vu.is_running("ton_kho_cuc_bo"):
             return
-        cursor = connection.cursor()
-        sql = f"""
-                SELECT NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
-                CONVERT(VARCHAR, THOI_GIAN_XA, 120) AS THOI_GIAN_XA,
-                CONVERT(VARCHAR, THOI_GIAN_XUAT_KHO, 120) AS THOI_GIAN_XUAT_KHO 
-                FROM DANH_SACH_CUON_VAI
-                WHERE STYLE LIKE '%{style}%'
-                AND MO LIKE '%{mo}%'
-                AND LOT LIKE '%{lot}%'
-                AND MAU LIKE '%{mau}%'
-                AND ISNULL(VI_TRI,'') LIKE '%{vitri}%'
-                AND NHA_MAY LIKE '%{nha_may}%'
-                AND TRANG_THAI = N'Nhập kho'
-            """
-        cursor.execute(sql)
-        results = cursor.fetchall()
-        # Xóa dữ liệu cũ trong TableWidget
-        self.tableWidget_6.setRowCount(0)
-        
-        # Hiển thị dữ liệu trong TableWidget
-        tong_so_yards = Decimal('0')
-        for row_idx, row_data in enumerate(results):
-            self.tableWidget_6.insertRow(row_idx)
-            for col_idx, value in enumerate(row_data):
-                item = QTableWidgetItem(str(value) if value is not None else "")
-                self.tableWidget_6.setItem(row_idx, col_idx, item)
-                if col_idx == 8:
-                    tong_so_yards += Decimal(value)  # Cộng giá trị vào tổng
-            
-            # Cập nhật progress bar
-            self.progressBar_6.setValue(int((row_idx + 1) * 100 / len(results)))
-        
-        # Gọi hàm tổng số dòng
-        self.tong_so_dong_ton_kho()   
+        sql, params = stock_query(nha_may).all()
+        self.tac_vu.submit("ton_kho_cuc_bo", run_query_with_mark, sql, params, shape=StockSnapshot.from_rows,
+                           on_result=partial(self.nap_ton_kho_cuc_bo, nha_may),
+                           on_error=self.loi_ton_kho_cuc_bo)
+
+    def nap_ton_kho_cuc_bo(self, nha_may, ton_kho):
+        if nha_may != self.lb000.text():
+            return  # đã đăng xuất hoặc đổi nhà máy
+        ton_kho.nha_may = nha_may
+        self.ton_kho_cuc_bo = ton_kho
+        self.loc_ton_kho()
+
+    def loc_ton_kho(self):
+        """Lọc tồn kho trong bộ nhớ theo các ô lọc (gọi mỗi khi ô lọc thay đổi, không truy vấn máy chủ)."""
+        ton_kho = self.ton_kho_cuc_bo
+        if ton_kho is None or ton_kho.nha_may != self.lb000.text():
+            return
+        with tracer.span("filter.ton_kho") as span:
+            rows, tong_so_yards = ton_kho.filter(self.bo_loc_o_ton_kho())
+            span.set(rows=len(rows))
+        # Bỏ lượt tìm trên máy chủ (trang, câu COUNT, lấy thay đổi) nếu còn đang chạy
+        for key in ("ton_kho", "ton_kho_count", "ton_kho_thay_doi"):
+            self.tac_vu.cancel(key)
+        model = self.model_ton_kho
+        with tracer.span("render.ton_kho", rows=len(rows)):
+            model.set_result(ton_kho.result(rows, tong_so_yards))
+        model.query = None
+        model.page_loader = None
+        model.total = len(rows)
+        model.row_version = ton_kho.row_version
+        model.refresh_changes = self.lam_moi_ton_kho_cuc_bo
+        self.tong_so_dong_ton_kho(len(rows))
         self.lb44.setText(f"{tong_so_yards:,.0f}")
+        self.progressBar_6.setValue(100)
+
+    def lam_moi_ton_kho_cuc_bo(self):
+        """Gộp các cuộn thay đổi (kể cả từ máy khác) vào tồn kho trong bộ nhớ rồi lọc lại (gọi theo chu kỳ)."""
+        ton_kho = self.ton_kho_cuc_bo
+        if ton_kho is None or ton_kho.row_version is None or self.tac_vu.is_running("ton_kho_cuc_bo"):
+            return
+        # Ảnh chụp mới (kèm chỉ mục) được dựng ở luồng nền, giao diện chỉ việc thay
+        self.tac_vu.submit("ton_kho_cuc_bo", fetch_changes, stock_query(ton_kho.nha_may), ton_kho.row_version,
+                           shape=ton_kho.merged, on_result=partial(self.cap_nhat_ton_kho_cuc_bo, ton_kho),
+                           on_error=self.loi_ton_kho_cuc_bo)
+
+    def cap_nhat_ton_kho_cuc_bo(self, ton_kho, changes):
+        if self.ton_kho_cuc_bo is not ton_kho:
+            return  # đã tải lại hoặc đăng xuất
+        moi = changes.result.without(changes.deleted)
+        moi.nha_may = ton_kho.nha_may
+        moi.row_version = changes.row_version
+        self.ton_kho_cuc_bo = moi
+        if moi is not ton_kho:
+            self.loc_ton_kho()
+
+    def loi_ton_kho_cuc_bo(self, e):
+        if isinstance(e, ConnectionError):
+            return  # lượt tìm/chu kỳ sau thử lại
+        if self.ton_kho_cuc_bo is not None:
+            # Thường do máy chủ chưa có cột ROW_VER: lượt tìm sau (search_ton_kho) tải lại toàn bộ
+            self.ton_kho_cuc_bo.row_version = None
+        self.lb003.setText(f"Lỗi tải tồn kho vào bộ nhớ: {e}")
+
+    def tai_tong_hop_ton_kho(self):
+        """Tải cấp nhóm đầu tiên của cây tổng hợp tồn kho trong một lần truy vấn."""
+        if self.bo_loc_ton_kho is None:
+            return
+        filters, nha_may = self.bo_loc_ton_kho
+        levels = GROUPINGS[max(self.cb401.currentIndex(), 0)][1]
+        self.model_tong_hop.reset(levels)
+        generation = self.model_tong_hop.generation
+        sql, params = summary_query('ton_kho', filters, nha_may, levels[:1])
+
+        def on_result(rows):
+            if generation == self.model_tong_hop.generation:
+                self.model_tong_hop.add_groups(None, rows)
+
+        self.tac_vu.submit("ton_kho_tong_hop", run_query, sql, params,
+                           shape=partial(summary_rows, group_by=levels[:1]),
+                           on_result=on_result,
+                           on_error=self.bao_loi_truy_van)
+
+    def mo_rong_nhom_ton_kho(self, index):
+        """Khi mở một nhóm: tải nhóm con, hoặc danh sách cuộn vải nếu là cấp cuối."""
+        item = self.model_tong_hop.itemFromIndex(index.sibling(index.row(), 0))
+        if not hasattr(item, 'path') or item.loaded:
+            return
+        item.loaded = True
+        filters, nha_may = self.bo_loc_ton_kho
+        model = self.model_tong_hop
+        generation = model.generation
+        key = f"ton_kho_nhom_{generation}_{id(item)}"
+
+        if model.is_leaf_level(item):
+            sql, params = detail_query('ton_kho', filters, nha_may, item.path).all()
+            shape = lambda rows: build_result(rows, self.model_ton_kho.headers)['df']
+            add = model.add_rolls
+        else:
+            group_by = [model.levels[len(item.path)]]
+            sql, params = summary_query('ton_kho', filters, nha_may, group_by, parent=item.path)
+            shape = partial(summary_rows, group_by=group_by)
+            add = model.add_groups
+
+        def on_result(ket_qua):
+            if generation == model.generation:
+                add(item, ket_qua)
+
+        def on_error(e):
+            item.loaded = False
+            self.bao_loi_truy_van(e)
+
+        self.tac_vu.submit(key, run_query, sql, params, shape=shape,
+                           on_result=on_result, on_error=on_error)
+
+    def chay_tim_kiem(self, key, query, model, progress_bar, cap_nhat_tong, hours_col=None, on_count=None,
+                      cache_key=None):
+        """Tải trang đầu và đếm tổng số dòng ở luồng nền; các trang sau tải khi cuộn bảng.
+
+        Lượt tìm mới trên cùng tab sẽ hủy lượt cũ (kể cả trang đang tải dở).
+        Trang và số dòng đã có trong bộ nhớ đệm (cache_key) được hiển thị ngay,
+        không chạy lại truy vấn. Sau đó model.refresh_changes() chỉ lấy các dòng
+        thay đổi kể từ mốc rowversion của trang đầu và gộp vào bảng.
+        """
+        progress_bar.setValue(0)
+        self.tac_vu.cancel(f"{key}_thay_doi")
+        model.query = query
+        model.total = None
+        model.row_version = None
+        model.set_has_more(False)
+        shape = partial(build_result, headers=model.headers, hours_col=hours_col)
+        cache = self.bo_nho_tim_kiem
+
+        def run_cached(task_key, part, sql, params, on_result, shape, fn=run_query, **kwargs):
+            cached = cache.get(cache_key, part) if cache_key is not None else None
+            if cached is not None:
+                # Hủy truy vấn cũ của tab để kết quả của nó không ghi đè kết quả lấy từ bộ nhớ đệm
+                self.tac_vu.cancel(task_key)
+                on_result(cached)
+                return
+            generation = cache.generation
+
+            def shape_sized(rows, **shape_kwargs):
+                # Ước lượng dung lượng ngay ở luồng nền
+                ket_qua = shape(rows, **shape_kwargs)
+                return ket_qua, estimate_size(ket_qua)
+
+            def store(sized):
+                ket_qua, size = sized
+                if cache_key is not None:
+                    cache.put(cache_key, part, ket_qua, generation, size=size)
+                on_result(ket_qua)
+
+            self.tac_vu.submit(task_key, fn, sql, params, shape=shape_sized, on_result=store, **kwargs)
+
+        def on_first_page(ket_qua):
+            with tracer.span(f"render.{key}", rows=len(ket_qua['df'])):
+                model.set_result(ket_qua, has_more=len(ket_qua['df']) == query.page_size)
+            model.row_version = ket_qua.get('row_version')
+            progress_bar.setValue(100)
+
+        def on_page(ket_qua):
+            if model.query is query:
+                with tracer.span(f"render.{key}", rows=len(ket_qua['df'])):
+                    model.append_result(ket_qua, has_more=len(ket_qua['df']) == query.page_size)
+
+        def on_page_error(e):
+            model.set_has_more(False)
+            self.bao_loi_truy_van(e)
+
+        def load_next_page():
+            after = model.last_value(COT_ID)
+            sql, params = query.page(after=after)
+            run_cached(key, ('page', after), sql, params, on_page, shape, on_error=on_page_error)
+
+        def on_count_result(ket_qua):
+            if model.query is query:
+                model.total = ket_qua[0]
+            cap_nhat_tong(ket_qua[0])
+            if on_count:
+                on_count(ket_qua)
+
+        def load_count():
+            sql, params = query.count()
+            run_cached(f"{key}_count", 'count', sql, params, on_count_result, lambda rows: rows[0])
+
+        def refresh_changes(on_unavailable=None):
+            # Bỏ qua khi trang đang tải hoặc lần làm mới trước chưa xong, chu kỳ sau làm tiếp.
+            # on_unavailable() được gọi khi máy chủ không trả được thay đổi; trả về False nếu không gửi
+            task_key = f"{key}_thay_doi"
+            if model.row_version is None or self.tac_vu.is_running(key) or self.tac_vu.is_running(task_key):
+                return False
+            self.tac_vu.submit(task_key, fetch_changes, query, model.row_version, shape=shape,
+                               on_result=on_changes, on_error=partial(on_changes_error, on_unavailable))
+            return True
+
+        def on_changes(changes):
+            if model.query is not query:
+                return
+            model.row_version = changes.row_version
+            if not len(changes):
+                return
+            model.merge_changes(changes.result, changes.matches, changes.deleted)
+            # Kết quả đã lưu của tab không còn đúng
+            self.lam_moi_bo_nho_tim_kiem((key,))
+            if model.has_more():
+                load_count()
+            else:
+                # Bảng đã tải đủ: tính lại tổng ngay trên bảng, không cần câu COUNT
+                rows = model.rowCount()
+                on_count_result((rows, model.column_sum(COT_SO_YARD)) if query.sum_column else (rows,))
+
+        def on_changes_error(on_unavailable, e):
+            if isinstance(e, ConnectionError):
+                return  # giữ mốc, chu kỳ sau thử lại
+            # Thường do máy chủ chưa có cột ROW_VER (chưa chạy migrate.py): tắt tới lượt tìm sau
+            model.row_version = None
+            self.lb003.setText(f"Lỗi làm mới bảng {key} theo thay đổi: {e}")
+            if on_unavailable is not None:
+                on_unavailable()
+
+        model.page_loader = load_next_page
+        model.refresh_changes = refresh_changes
+        sql, params = query.page()
+        # Trang đầu kèm mốc rowversion đọc ngay trước truy vấn
+        run_cached(key, ('page', None), sql, params, on_first_page, shape, fn=run_query_with_mark,
+                   on_error=self.bao_loi_truy_van, on_progress=progress_bar.setValue)
+        # Câu COUNT chạy song song, cho số dòng trên nhãn tổng
+        load_count()
+
+    def lam_moi_bang_dang_xem(self):
+        """Gộp các dòng thay đổi vào bảng kết quả (hoặc làm mới sơ đồ kho) của tab đang mở (gọi theo chu kỳ)."""
+        tab = self.tabWidget.currentIndex()
+        if tab in self.so_do_kho:
+            self.tai_so_do_kho()
+            return
+        model = {1: self.model_nhap_kho, 2: self.model_xa_vai,
+                 3: self.model_xuat_kho, 4: self.model_ton_kho}.get(tab)
+        if model is not None and model.refresh_changes is not None:
+            model.refresh_changes()
+
+    def lam_moi_nhap_kho(self):
+        # Bảng đã có mốc rowversion thì chỉ lấy các dòng thay đổi thay vì tìm lại toàn bộ;
+        # không lấy được thay đổi (vd. máy chủ chưa có cột ROW_VER) thì tìm lại toàn bộ
+        model = self.model_nhap_kho
+        if model.refresh_changes is None or not model.refresh_changes(on_unavailable=self.search_nhap_kho):
+            self.search_nhap_kho()
+
+    def lam_moi_bo_nho_tim_kiem(self, kinds=ALL_KINDS):
+        """Xóa kết quả tìm kiếm đã lưu của các tab bị ảnh hưởng khi máy này thay đổi dữ liệu."""
+        self.bo_nho_tim_kiem.invalidate(kinds, nha_may=self.lb000.text() or None)
+
+    def tai_chi_muc_vi_tri(self):
+        """Tải chỉ mục vị trí của nhà máy đang đăng nhập (một lần, ở luồng nền)."""
+        nha_may = self.lb000.text()
+        sql, params = located_query(nha_may).all()
+        self.tac_vu.submit("chi_muc_vi_tri", run_query_with_mark, sql, params, shape=index_rows,
+                           on_result=partial(self.nap_chi_muc_vi_tri, nha_may),
+                           on_error=self.loi_chi_muc_vi_tri)
+
+    def nap_chi_muc_vi_tri(self, nha_may, ket_qua):
+        rows, row_version = ket_qua
+        self.chi_muc_vi_tri.load(nha_may, rows, row_version)
+        completer = QCompleter(self.chi_muc_vi_tri.locations(), self.tb_tim_nhanh)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.tb_tim_nhanh.setCompleter(completer)
+
+    def lam_moi_chi_muc_vi_tri(self):
+        """Gộp thay đổi vị trí (kể cả từ máy khác) vào chỉ mục (gọi theo chu kỳ)."""
+        chi_muc = self.chi_muc_vi_tri
+        if self.tac_vu.is_running("chi_muc_vi_tri") or not self.lb000.text():
+            return
+        if not chi_muc.loaded:
+            # Lần tải đầu bị lỗi (mất kết nối): thử tải lại
+            self.tai_chi_muc_vi_tri()
+            return
+        if chi_muc.row_version is None:
+            return
+        self.tac_vu.submit("chi_muc_vi_tri", fetch_changes, located_query(chi_muc.nha_may), chi_muc.row_version,
+                           shape=index_rows, on_result=partial(self.cap_nhat_chi_muc_vi_tri, chi_muc.nha_may),
+                           on_error=self.loi_chi_muc_vi_tri)
+
+    def cap_nhat_chi_muc_vi_tri(self, nha_may, changes):
+        if self.chi_muc_vi_tri.nha_may == nha_may:
+            self.chi_muc_vi_tri.apply(changes)
+
+    def loi_chi_muc_vi_tri(self, e):
+        if isinstance(e, ConnectionError):
+            return  # chu kỳ sau thử lại
+        # Thường do máy chủ chưa có cột ROW_VER: chỉ mục chỉ còn cập nhật theo lần quét của máy này
+        self.chi_muc_vi_tri.row_version = None
+        self.lb003.setText(f"Lỗi cập nhật chỉ mục vị trí: {e}")
+
+    def tim_nhanh(self):
+        """Tra cứu trong chỉ mục vị trí: nhập ID để biết cuộn ở đâu, nhập mã vị trí để biết vị trí có gì."""
+        text = self.tb_tim_nhanh.text().strip()
+        if not text:
+            return
+        chi_muc = self.chi_muc_vi_tri
+        if not chi_muc.loaded:
+            QMessageBox.information(self, "Thông báo", "Đang tải chỉ mục vị trí, vui lòng chờ!")
+            return
+        if text.isdigit():
+            vi_tri = chi_muc.locate(text)
+            if vi_tri:
+                thong_bao = f"Cuộn {text} đang ở vị trí {vi_tri}."
+            else:
+                thong_bao = f"Cuộn {text} không nằm trên kệ nào (đã xả vải, xuất kho hoặc không tồn tại)."
+        else:
+            vi_tri = text.upper()
+            ids = sorted(chi_muc.rolls_at(vi_tri))
+            if ids:
+                danh_sach = ", ".join(str(roll_id) for roll_id in ids[:200])
+                thong_bao = f"Vị trí {vi_tri}: {len(ids)} cuộn\n{danh_sach}{' ...' if len(ids) > 200 else ''}"
+            elif is_location_code(vi_tri):
+                thong_bao = f"Vị trí {vi_tri} đang trống."
+            else:
+                thong_bao = f"Mã vị trí không hợp lệ: {text}"
+        QMessageBox.information(self, "Tìm nhanh", thong_bao)
+
+    def bao_loi_truy_van(self, e):
+        if isinstance(e, ConnectionError):
+            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
+        else:
+            QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi tìm kiếm dữ liệu: {e}")
+
+    def closeEvent(self, event):
+        # Hủy các truy vấn nền đang chạy trước khi đóng ứng dụng
+        self.tac_vu.cancel_all()
+        self.tac_vu.pool.waitForDone(3000)
+        self.quet.close()
+        self.quet_lo.close()
+        self.dong_bo.close()
+        self.nhat_ky_quet.close()
+        super().closeEvent(event)
+
+    def show_chan_doan_tab(self):
+        if not self.menuBar.isVisible():
+            return  # chưa đăng nhập
+        if self.chan_doan is None:
+            from diagnostics import DiagnosticsPanel
+            self.chan_doan = DiagnosticsPanel(tracer, self.thong_tin_chan_doan, self)
+            self.tabWidget.addTab(self.chan_doan, "Chẩn đoán")
+        self.tabWidget.setCurrentIndex(self.tabWidget.indexOf(self.chan_doan))
+
+    def thong_tin_chan_doan(self):
+        # Số liệu hiển thị thêm trên tab chẩn đoán
+        thong_tin = {
+            'Độ trễ quét': self.quet.latency.snapshot(),
+            'Máy chủ (quét)': self.quet.db_latency.snapshot(),
+            'Bộ nhớ đệm': self.bo_nho_tim_kiem.snapshot(),
+            'Chỉ mục vị trí': self.chi_muc_vi_tri.snapshot(),
+            'Tồn kho trong bộ nhớ': self.ton_kho_cuc_bo.snapshot() if self.ton_kho_cuc_bo is not None else None,
+        }
+        try:
+            thong_tin['Pool kết nối'] = thong_ke_pool()
+        except Exception as e:
+            thong_tin['Pool kết nối'] = str(e)
+        return thong_tin
         
     def show_login_tab(self):
         self.tabWidget.setCurrentIndex(0) 
@@ -444,6 +676,10 @@ class MainApp(QMainWindow,ui):
         self.lb002.setText("")
         self.lb003.setText("Phần mềm quản lý kho vải")
         self.menuBar.setVisible(False)
+        self.tac_vu.cancel("chi_muc_vi_tri")
+        self.chi_muc_vi_tri.clear()
+        self.tac_vu.cancel("ton_kho_cuc_bo")
+        self.ton_kho_cuc_bo = None
                         
     def show_nhap_kho_tab(self):
         self.tabWidget.setCurrentIndex(1) 
@@ -484,6 +720,25 @@ class MainApp(QMainWindow,ui):
         else:
             self.tabWidget.setCurrentIndex(9) 
             self.lb003.setText("Sơ đồ kho vải Nam Thuận 2")
+        self.tai_so_do_kho()
+
+    def tai_so_do_kho(self):
+        """Tải số cuộn, số yard theo vị trí bằng một câu GROUP BY và cập nhật sơ đồ của tab đang mở."""
+        from warehouse_map import WarehouseMapView, location_query, location_values
+        tab = self.tabWidget.currentIndex()
+        so_do = self.so_do_kho.get(tab)
+        if so_do is None:
+            khung = self.widget_74 if tab == 8 else self.widget_77
+            so_do = WarehouseMapView(self.tac_vu, f"so_do_kho_{tab}", self.lb003.text(), khung)
+            layout = QVBoxLayout(khung)
+            layout.setContentsMargins(0, 0, 0, 0)
+            layout.addWidget(so_do)
+            self.so_do_kho[tab] = so_do
+        if self.tac_vu.is_running(so_do.key):
+            return
+        sql, params = location_query(self.lb000.text())
+        self.tac_vu.submit(so_do.key, run_query, sql, params, shape=location_values,
+                           on_result=so_do.set_values, on_error=self.bao_loi_truy_van)
                    
     def show_xuat_kho_tab(self):
         self.menuBar.setVisible(True)
@@ -505,31 +760,38 @@ class MainApp(QMainWindow,ui):
         self.lb704.setText("")
         self.lb705.setText("")
         self.tb701.setFocus()
-    def tong_so_dong(self):
-        rows = self.tableWidget.rowCount()
+    def tong_so_dong(self, rows=None):
+        if rows is None:
+            rows = self.model_nhap_kho.rowCount()
         self.lb101.setText(f"Tổng số dòng dữ liệu: {rows}")
         self.lb101.setStyleSheet("color: rgb(0, 255, 0);")
         
-    def tong_so_dong_xa_vai(self):
-        rows = self.tableWidget_2.rowCount()
+    def tong_so_dong_xa_vai(self, rows=None):
+        if rows is None:
+            rows = self.model_xa_vai.rowCount()
         self.lb201.setText(f"Tổng số dòng dữ liệu: {rows}")
         self.lb201.setStyleSheet("color: rgb(0, 255, 0);")
         
-    def tong_so_dong_xuat_kho(self):
-        rows = self.tableWidget_5.rowCount()
+    def tong_so_dong_xuat_kho(self, rows=None):
+        if rows is None:
+            rows = self.model_xuat_kho.rowCount()
         self.lb301.setText(f"Tổng số dòng dữ liệu: {rows}")
         self.lb301.setStyleSheet("color: rgb(0, 255, 0);")    
     
-    def tong_so_dong_ton_kho(self):
-        rows = self.tableWidget_6.rowCount()
+    def tong_so_dong_ton_kho(self, rows=None):
+        if rows is None:
+            rows = self.model_ton_kho.rowCount()
         self.lb401.setText(f"Tổng số dòng dữ liệu: {rows}")
         self.lb401.setStyleSheet("color: rgb(0, 255, 0);") 
             
     def delete_row(self, row):
-        self.tableWidget.removeRow(row)
+        self.model_nhap_kho.removeRows(row, 1)
         self.tong_so_dong()
         
     def import_from_excel(self):
+        if self.tac_vu.is_running("nhap_file"):
+            QMessageBox.information(self, "Thông báo", "Đang nhập tệp Excel, vui lòng chờ!")
+            return
         # Mở hộp thoại để chọn tệp
         options = QFileDialog.Options()
         options |= QFileDialog.ReadOnly
@@ -540,46 +802,60 @@ class MainApp(QMainWindow,ui):
             QMessageBox.information(self, "Thông báo", "Không có tệp nào được chọn!")
             return
 
-        # Đọc tệp Excel
+        # Đọc và nhập tệp Excel ở luồng nền: nạp bảng tạm theo lô rồi MERGE bỏ qua cuộn đã có
+        from bulk_import import import_packing_list
+        self.progressBar.setValue(0)
+        self.tac_vu.submit("nhap_file", import_packing_list, file_to_open, self.lb000.text(),
+                           on_result=self.nhap_file_xong, on_error=self.loi_nhap_file,
+                           on_progress=self.progressBar.setValue)
+
+    def nhap_file_xong(self, summary):
+        if summary.inserted:
+            # Cuộn vải mới nhập ở trạng thái Nhập kho
+            self.lam_moi_bo_nho_tim_kiem(kinds_for_states([TRANG_THAI_NHAP_KHO]))
+        report = summary.report
+        if report.empty:
+            QMessageBox.information(self, "Thông báo", summary.text())
+        else:
+            # Có dòng lỗi/trùng: cho phép lưu báo cáo theo từng dòng để sửa file
+            reply = QMessageBox.question(
+                self,
+                "Thông báo",
+                f"{summary.text()}\nBạn có muốn lưu báo cáo {len(report)} lỗi/trùng theo từng dòng không?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.Yes
+            )
+            if reply == QMessageBox.Yes:
+                self.luu_bao_cao_nhap_file(report)
+        self.lam_moi_nhap_kho()
+
+    def luu_bao_cao_nhap_file(self, report):
+        file_name = datetime.now().strftime("%d-%m-%Y %H-%M-%S")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Lưu báo cáo",
+            f"Báo cáo nhập kho {file_name}",
+            "Excel Files (*.xlsx);;All Files (*)"
+        )
+        if not file_path:
+            return
         try:
-            df = pd.read_excel(file_to_open,sheet_name="NHẬP",usecols=range(9),header=0,skiprows=1)
-            df = df.rename(columns={
-                'Ngày nhận':'NGAY_NHAN',
-                'Style' : 'STYLE',
-                'Loại vải' : 'LOAI_VAI',
-                'ĐVT' : 'DVT',
-                'Lot' : 'LOT',
-                'Màu' : 'MAU',
-                'Cuộn số' : 'CUON_SO',
-                'Số yard' : 'SO_YARD'
-            })
-            df['NGAY_NHAN'] = pd.to_datetime(df['NGAY_NHAN'], errors='coerce').dt.strftime('%Y-%m-%d')
-            df['NHA_MAY'] = self.lb000.text()
-            df = df.drop_duplicates(subset=['STYLE','MO','LOAI_VAI','LOT','MAU','CUON_SO'])
-            
-            dtype = {
-                'NGAY_NHAN' : DATE,
-                'STYLE' : VARCHAR(20),
-                'MO' : VARCHAR(30),
-                'LOAI_VAI' : VARCHAR(20),
-                'DVT' : VARCHAR(10),
-                'LOT' : VARCHAR(50),
-                'MAU': VARCHAR(20),
-                'CUON_SO': INTEGER,
-                'SO_YARD': DECIMAL(6,2),
-                'NHA_MAY': VARCHAR(5)
-            }
-            import_to_sql(df,'DANH_SACH_CUON_VAI',dtype,engine_1)
-            QMessageBox.information(self, "Thông báo", f"Tải lên thành công {df.shape[0]} dòng dữ liệu!")
-            self.search_nhap_kho()
-        except Exception  as e:
-            QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi đọc tệp Excel: {e}")    
+            report.rename(columns={'DONG': 'Dòng', 'COT': 'Cột', 'LOI': 'Lỗi'}).to_excel(file_path, index=False)
+        except Exception as e:
+            QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi lưu file: {e}")
+
+    def loi_nhap_file(self, e):
+        # Các lô trước lô bị lỗi đã được commit
+        self.lam_moi_bo_nho_tim_kiem(kinds_for_states([TRANG_THAI_NHAP_KHO]))
+        if isinstance(e, ConnectionError):
+            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
+        else:
+            QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi đọc tệp Excel: {e}")
     
     def delete_selected_rows(self):
         # Lấy ID danh sách các hàng được chọn
-        selected_IDs  = set(self.tableWidget.item(index.row(),10).text() 
-                          for index in self.tableWidget.selectedIndexes()
-                          if self.tableWidget.item(index.row(),10) is not None)
+        selected_rows = set(index.row() for index in self.tableWidget.selectionModel().selectedIndexes())
+        selected_IDs  = set(self.model_nhap_kho.text(row, COT_ID) for row in selected_rows)
         # Kiểm tra nếu không có hàng nào được chọn
         if not selected_IDs:  # Tập hợp rỗng
             QMessageBox.information(self, "Thông báo", "Chưa có dòng nào được chọn")
@@ -595,205 +871,45 @@ class MainApp(QMainWindow,ui):
         if reply == QMessageBox.No:
             return  # Không làm gì nếu người dùng chọn "No"
         try:
-            connection = connect_to_db()
-            if connection is None:
-                self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
-                return
-            cursor = connection.cursor()
-            # Chuyển danh sách ID thành chuỗi tham số
-            placeholders = ", ".join(["?"] * len(selected_IDs))
-            query = f"DELETE FROM DANH_SACH_CUON_VAI WHERE ID IN ({placeholders})"
-            # Thực thi câu lệnh với tham số
-            cursor.execute(query, tuple(selected_IDs))
-            connection.commit()
+            self.kho_du_lieu.delete_rolls(selected_IDs)
+            # Chỉ các tab chứa trạng thái của những cuộn vừa xóa
+            self.lam_moi_bo_nho_tim_kiem(kinds_for_states(
+                set(self.model_nhap_kho.text(row, COT_TRANG_THAI) for row in selected_rows)))
             
             QMessageBox.information(self, "Thông báo", f"Xóa thành công {len(selected_IDs)} dữ liệu!")
-            self.search_nhap_kho()
+            self.lam_moi_nhap_kho()
+        except ConnectionError:
+            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
         except Exception  as e:
             QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi xóa dữ liệu: {e}")    
-        finally:
-            if connection:
-                connection.close()   
                 
     def tai_xuong_file_mau(self):
-        headers = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID','Thời gian xả vải','Thời gian xuất kho','Trạng thái']
-        df = table_to_dataframe(self.tableWidget,headers)
-        # df = df.drop(columns=['ID','Thời gian xả vải','Thời gian xuất kho','Trạng thái'])
-        # Create a new Excel workbook
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "NHẬP"
-
-        # Add the title to A1
-        sheet['A1'] = "MẪU FILE NHẬP VÀO HỆ THỐNG"
-        # Merge cells from A1 to J1
-        sheet.merge_cells('A1:I1')
-
-        # Center-align the merged cells
-        sheet['A1'].alignment = Alignment(horizontal="center", vertical="center")
-        sheet['A1'].font = Font(color="FFFFFF", bold=True,size=14)
-        sheet['A1'].fill = PatternFill(start_color="349eeb", end_color="349eeb", fill_type="solid")
-        # Apply bold style to headers (A2:J2)
-        for row in sheet.iter_rows(min_row=2, max_row=2, min_col=1, max_col=14):
-            for cell in row:
-                cell.font = Font(bold=True)
-                if cell.column <=9:
-                    cell.font = Font(color="FF0000",bold=True)
-        # Write DataFrame to the sheet, starting from the second row
-        for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), start=2):
-            for c_idx, value in enumerate(row, start=1):
-                sheet.cell(row=r_idx, column=c_idx, value=value)
-   
-        # Open file dialog to select save location
-        options = QFileDialog.Options()
-        file_name = datetime.now().strftime("%d-%m-%Y %H-%M-%S")
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, 
-            "Tải xuống file", 
-            f"Nhập kho vải {file_name}", 
-            "Excel Files (*.xlsx);;All Files (*)", 
-            options=options
-        )
-
-        if not file_path:
-            # QMessageBox.information(self, "Thông báo", "Bạn đã hủy việc tải xuống.")
-            return
-
-        # Save the file to the selected location
-        try:
-            workbook.save(file_path)
-            QMessageBox.information(self, "Thông báo", f"File đã được tải xuống thành công tại:\n{file_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi lưu file: {e}")
+        self.xuat_file("nhap_kho", self.model_nhap_kho, self.progressBar)
     
     def tai_xuong_file_xa_vai(self):
-        headers = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID','Thời gian xả vải','Số giờ xả']
-        df = table_to_dataframe(self.tableWidget_2,headers)
-        # Create a new Excel workbook
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "XẢ VẢI"
-
-        # Add the title to A1
-        sheet['A1'] = "DỮ LIỆU XẢ VẢI"
-        # Merge cells from A1 to J
-        sheet.merge_cells('A1:M1')
-        # Center-align the merged cells
-        sheet['A1'].alignment = Alignment(horizontal="center", vertical="center")
-        sheet['A1'].font = Font(color="FFFFFF", bold=True,size=14)
-        sheet['A1'].fill = PatternFill(start_color="349eeb", end_color="349eeb", fill_type="solid")
-        # Apply bold style to headers (A2:J2)
-        for row in sheet.iter_rows(min_row=2, max_row=2, min_col=1, max_col=13):
-            for cell in row:
-                cell.font = Font(bold=True)
-        # Write DataFrame to the sheet, starting from the second row
-        for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), start=2):
-            for c_idx, value in enumerate(row, start=1):
-                sheet.cell(row=r_idx, column=c_idx, value=value)
-   
-        # Open file dialog to select save location
-        options = QFileDialog.Options()
-        file_name = datetime.now().strftime("%d-%m-%Y %H-%M-%S")
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, 
-            "Tải xuống file", 
-            f"Xả vải {file_name}", 
-            "Excel Files (*.xlsx);;All Files (*)", 
-            options=options
-        )
-
-        if not file_path:
-            # QMessageBox.information(self, "Thông báo", "Bạn đã hủy việc tải xuống.")
-            return
-
-        # Save the file to the selected location
-        try:
-            workbook.save(file_path)
-            QMessageBox.information(self, "Thông báo", f"File đã được tải xuống thành công tại:\n{file_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi lưu file: {e}")
+        self.xuat_file("xa_vai", self.model_xa_vai, self.progressBar_2)
             
     def tai_xuong_file_xuat_kho(self):
-        headers = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID','Thời gian xả vải','Thời gian xuất kho']
-        df = table_to_dataframe(self.tableWidget_5,headers)
-        # Create a new Excel workbook
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "XUẤT KHO"
-
-        # Add the title to A1
-        sheet['A1'] = "DỮ LIỆU XUẤT KHO"
-        # Merge cells from A1 to J
-        sheet.merge_cells('A1:M1')
-
-        # Center-align the merged cells
-        sheet['A1'].alignment = Alignment(horizontal="center", vertical="center")
-        sheet['A1'].font = Font(color="FFFFFF", bold=True,size=14)
-        sheet['A1'].fill = PatternFill(start_color="349eeb", end_color="349eeb", fill_type="solid")
-        # Apply bold style to headers (A2:J2)
-        for row in sheet.iter_rows(min_row=2, max_row=2, min_col=1, max_col=13):
-            for cell in row:
-                cell.font = Font(bold=True)
-        # Write DataFrame to the sheet, starting from the second row
-        for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), start=2):
-            for c_idx, value in enumerate(row, start=1):
-                sheet.cell(row=r_idx, column=c_idx, value=value)
-   
-        # Open file dialog to select save location
-        options = QFileDialog.Options()
-        file_name = datetime.now().strftime("%d-%m-%Y %H-%M-%S")
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, 
-            "Tải xuống file", 
-            f"Xuất kho {file_name}", 
-            "Excel Files (*.xlsx);;All Files (*)", 
-            options=options
-        )
+        self.xuat_file("xuat_kho", self.model_xuat_kho, self.progressBar_5)
 
-        if not file_path:
-            # QMessageBox.information(self, "Thông báo", "Bạn đã hủy việc tải xuống.")
-            return
-
-        # Save the file to the selected location
-        try:
-            workbook.save(file_path)
-            QMessageBox.information(self, "Thông báo", f"File đã được tải xuống thành công tại:\n{file_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi lưu file: {e}")
     def tai_xuong_file_ton_kho(self):
-        headers = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID']
-        df = table_to_dataframe(self.tableWidget_6,headers)
-        # Create a new Excel workbook
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "TỒN KHO"
-
-        # Add the title to A1
-        sheet['A1'] = "DỮ LIỆU TỒN KHO"
-        # Merge cells from A1 to J
-        sheet.merge_cells('A1:K1')
-
-        # Center-align the merged cells
-        sheet['A1'].alignment = Alignment(horizontal="center", vertical="center")
-        sheet['A1'].font = Font(color="FFFFFF", bold=True,size=14)
-        sheet['A1'].fill = PatternFill(start_color="349eeb", end_color="349eeb", fill_type="solid")
-        # Apply bold style to headers (A2:J2)
-        for row in sheet.iter_rows(min_row=2, max_row=2, min_col=1, max_col=13):
-            for cell in row:
-                cell.font = Font(bold=True)
-        # Write DataFrame to the sheet, starting from the second row
-        for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), start=2):
-            for c_idx, value in enumerate(row, start=1):
-                sheet.cell(row=r_idx, column=c_idx, value=value)
-   
+        self.xuat_file("ton_kho", self.model_ton_kho, self.progressBar_6)
+
+    def xuat_file(self, kind, model, progress_bar):
+        """Xuất kết quả tìm kiếm của một tab ra Excel/CSV/Parquet ở luồng nền."""
+        from exporter import EXPORTS, FILE_FILTER, export_rows, model_source, resolve_path
+        key = f"xuat_file_{kind}"
+        if self.tac_vu.is_running(key):
+            QMessageBox.information(self, "Thông báo", "Đang xuất file, vui lòng chờ!")
+            return
         # Open file dialog to select save location
         options = QFileDialog.Options()
         file_name = datetime.now().strftime("%d-%m-%Y %H-%M-%S")
-        file_path, _ = QFileDialog.getSaveFileName(
+        file_path, selected_filter = QFileDialog.getSaveFileName(
             self, 
             "Tải xuống file", 
-            f"Tồn kho {file_name}", 
-            "Excel Files (*.xlsx);;All Files (*)", 
+            f"{EXPORTS[kind]['file']} {file_name}", 
+            FILE_FILTER, 
             options=options
         )
 
@@ -801,22 +917,35 @@ class MainApp(QMainWindow,ui):
             # QMessageBox.information(self, "Thông báo", "Bạn đã hủy việc tải xuống.")
             return
 
-        # Save the file to the selected location
-        try:
-            workbook.save(file_path)
-            QMessageBox.information(self, "Thông báo", f"File đã được tải xuống thành công tại:\n{file_path}")
-        except Exception as e:
+        # Ghi file theo từng lô: từ model nếu đã tải đủ, nếu không thì đọc thẳng từ cursor
+        file_path, file_format = resolve_path(file_path, selected_filter)
+        progress_bar.setValue(0)
+        self.tac_vu.submit(key, export_rows, file_path, file_format, kind, model.headers, model_source(model),
+                           on_result=self.xuat_file_xong, on_error=self.loi_xuat_file,
+                           on_progress=progress_bar.setValue)
+
+    def xuat_file_xong(self, ket_qua):
+        file_path, _ = ket_qua
+        QMessageBox.information(self, "Thông báo", f"File đã được tải xuống thành công tại:\n{file_path}")
+
+    def loi_xuat_file(self, e):
+        if isinstance(e, ConnectionError):
+            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
+        else:
             QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi lưu file: {e}")
     
     def print_labels_3x2(self):
+        if self.tac_vu.is_running("in_tem"):
+            QMessageBox.information(self, "Thông báo", "Đang in tem, vui lòng chờ!")
+            return
          # Lặp qua các dòng được chọn để lấy dữ liệu
-        selected_rows = self.tableWidget.selectedIndexes()
+        selected_rows = self.tableWidget.selectionModel().selectedIndexes()
         if not selected_rows:
             QMessageBox.information(self, "Thông báo", "Chưa có dòng nào được chọn")
             return
         
-        # Tạo danh sách các hàng (độc nhất) được chọn
-        rows = set(index.row() for index in selected_rows)
+        # Tạo danh sách các hàng (độc nhất) được chọn, in theo thứ tự trên bảng
+        rows = sorted(set(index.row() for index in selected_rows))
         
         # Hiển thị cảnh báo xác nhận
         reply = QMessageBox.question(
@@ -833,257 +962,353 @@ class MainApp(QMainWindow,ui):
         data_list = []
         for row in rows:
             data = {
-                "ID": self.tableWidget.item(row, 10).text(),
-                "NgayNhap": self.tableWidget.item(row, 0).text(),
-                "Style": self.tableWidget.item(row, 1).text(),
-                "MO": self.tableWidget.item(row, 2).text(),
-                "LoaiVai": self.tableWidget.item(row, 3).text(),
-                "Dvt": self.tableWidget.item(row, 4).text(),
-                "Lot": self.tableWidget.item(row, 5).text(),
-                "Mau": self.tableWidget.item(row, 6).text(),
-                "CuonSo": self.tableWidget.item(row, 7).text(),
-                "SoYard": self.tableWidget.item(row, 8).text(),
+                "ID": self.model_nhap_kho.text(row, 10),
+                "NgayNhap": self.model_nhap_kho.text(row, 0),
+                "Style": self.model_nhap_kho.text(row, 1),
+                "MO": self.model_nhap_kho.text(row, 2),
+                "LoaiVai": self.model_nhap_kho.text(row, 3),
+                "Dvt": self.model_nhap_kho.text(row, 4),
+                "Lot": self.model_nhap_kho.text(row, 5),
+                "Mau": self.model_nhap_kho.text(row, 6),
+                "CuonSo": self.model_nhap_kho.text(row, 7),
+                "SoYard": self.model_nhap_kho.text(row, 8),
             }
             data_list.append(data)
 
+        from labels import CANH_BAO_RESOURCE, load_resource, print_labels
         try:
-            # Tạo file PDF tạm thời
-            temp_dir = tempfile.gettempdir()
-            output_path = os.path.join(temp_dir, "labels_3x2.pdf")
-
-            # Định kích thước trang 4x6 inch
-            page_width = 3.1 * inch
-            page_height = 2 * inch
-
-            # Tạo PDF
-            c = canvas.Canvas(output_path, pagesize=(page_width, page_height))
-
-            for data in data_list:
-                # Reset vị trí in (trang mới cho mỗi tem)
-                gap = 10
-                # In ID (in đậm, kích thước 20)
-                c.setFont("Arial-Bold", 20)  # Font in đậm
-                c.drawString(15, page_height - gap*3, f"ID: {data['ID']}")
-                # In các thông tin khác (kích thước chữ 12)
-                c.setFont("Arial", 9)  # Font thường
-                c.drawString(15, page_height - gap*5, f"Ngày nhập: {data['NgayNhap']}")
-                c.drawString(15, page_height - gap*6, f"Style: {data['Style']}")
-                c.drawString(15, page_height - gap*7, f"MO: {data['MO']}")
-                c.drawString(15, page_height - gap*8, f"Loại vải: {data['LoaiVai']}")
-                c.drawString(15, page_height - gap*9, f"ĐVT: {data['Dvt']}")
-                c.drawString(15, page_height - gap*10, f"Lot: {data['Lot']}")
-                c.drawString(15, page_height - gap*11, f"Màu: {data['Mau']}")
-                c.drawString(15, page_height - gap*12, f"Cuộn số: {data['CuonSo']}")
-                c.drawString(15, page_height - gap*13, f"Số yard: {data['SoYard']}")
-
-                # Tạo mã QR từ ID
-                qr = qrcode.make(data['ID'])
-                qr_temp_path = os.path.join(temp_dir, f"qr_{data['ID']}.png")
-                qr.save(qr_temp_path)
-
-                # Vẽ mã QR lên tem
-                qr_size = 0.8 * inch  # Kích thước mã QR 2x2 inch
-                c.drawImage(qr_temp_path, page_width - qr_size - 5, page_height - qr_size - 5, width=qr_size, height=qr_size)
-                c.drawImage(qr_temp_path, page_width - qr_size - 5, 5, width=qr_size, height=qr_size)
-                # Đường dẫn resource trong file .qrc
-                logo_resource_path = ":/pictures/pics/canh_bao.png"
-                # Tạo đường dẫn tạm thời cho ảnh
-                temp_dir = tempfile.gettempdir()
-                temp_logo_path = os.path.join(temp_dir, "canh_bao.png")
-                # Lưu ảnh từ resource ra file tạm
-                pixmap = QPixmap(logo_resource_path)
-                if not pixmap.isNull():
-                    pixmap.save(temp_logo_path, "PNG")
-                else:
-                    raise FileNotFoundError(f"Không thể tìm thấy resource: {logo_resource_path}")
-                # Vẽ mã tem cảnh báo lên tem
-                # logo_size = 1.5 * inch  # Kích thước mã QR 2x2 inch
-                # c.drawImage(temp_logo_path, 10,10, width=logo_size, height=logo_size)
-                # Lưu mỗi tem trên một trang
-                c.showPage()
-
-                # Xóa file QR tạm
-                if os.path.exists(qr_temp_path):
-                    os.remove(qr_temp_path)
-
-            c.save()
-            # # Gửi lệnh in trực tiếp tới máy in
-            printer_name = win32print.GetDefaultPrinter()
-            win32api.ShellExecute(
-                0,
-                "print",
-                output_path,
-                None,
-                ".",
-                0
-            )
-
-            QMessageBox.information(self, "Thông báo", "In tem thành công!")
-
+            # Ảnh cảnh báo chỉ đọc từ resource một lần
+            canh_bao = load_resource(CANH_BAO_RESOURCE)
         except Exception as e:
             QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi in tem: {e}")
+            return
+
+        # Vẽ tem song song theo lô ở tiến trình con, lô nào xong thì gửi máy in ngay
+        self.progressBar.setValue(0)
+        self.tac_vu.submit("in_tem", print_labels, data_list, gui_may_in, canh_bao,
+                           on_result=self.in_tem_xong, on_error=self.loi_in_tem,
+                           on_progress=self.progressBar.setValue)
+
+    def in_tem_xong(self, job):
+        QMessageBox.information(self, "Thông báo", f"In tem thành công!\n{job.count} tem, {job.chunks} lô, {job.labels_per_second:,.0f} tem/giây")
+
+    def loi_in_tem(self, e):
+        QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi khi in tem: {e}")
             
+    def thuc_hien_quet(self, action, qr_code, vi_tri=None):
+        """Ghi lần quét vào nhật ký cục bộ trước rồi mới cập nhật máy chủ.
+
+        Khi mất kết nối hoặc còn lần quét cũ chưa đồng bộ, lần quét chỉ được xếp
+        hàng (giữ đúng thứ tự quét) và trả về ngay, không chờ máy chủ.
+        """
+        phien = self.phien_quet_nhanh.get(action)
+        if phien is not None:
+            # Quét nhanh: kiểm tra với danh sách đã tải, báo ngay, gửi máy chủ theo lô
+            result = phien.scan(qr_code)
+            if phien.should_flush():
+                self.gui_lo_quet_nhanh(action)
+            else:
+                self.cap_nhat_quet_nhanh(action)
+            return result
+
+        reason = validate_scan(action, qr_code, vi_tri)
+        if reason:
+            return ScanResult(action, qr_code, reason)
+        thoi_gian = datetime.now()
+        if self.ngoai_tuyen or self.nhat_ky_quet.pending_count(include_sending=False):
+            self.nhat_ky_quet.record(action, qr_code, vi_tri, thoi_gian)
+            self.cap_nhat_hang_cho()
+            return ScanResult(action, qr_code, QUEUED, vi_tri=vi_tri, thoi_gian=thoi_gian)
+
+        seq = self.nhat_ky_quet.record(action, qr_code, vi_tri, thoi_gian, status=SENDING)
+        try:
+            result = self.quet.transition(action, qr_code, vi_tri=vi_tri, thoi_gian=thoi_gian)
+        except ConnectionError:
+            # Mất kết nối: giữ lần quét trong hàng chờ, các lần quét sau không chờ máy chủ nữa
+            self.nhat_ky_quet.requeue(seq)
+            self.ngoai_tuyen = True
+            self.cap_nhat_hang_cho()
+            return ScanResult(action, qr_code, QUEUED, vi_tri=vi_tri, thoi_gian=thoi_gian)
+        except Exception:
+            self.nhat_ky_quet.requeue(seq)
+            raise
+        self.nhat_ky_quet.complete([(seq, result)])
+        if result.ok:
+            # Chuyển vị trí ghi vị trí mới, xả vải / xuất kho đưa cuộn khỏi kệ
+            self.chi_muc_vi_tri.move(qr_code, vi_tri if action == CHUYEN_VI_TRI else None)
+            # Chuyển vị trí giữ nguyên trạng thái nên chỉ ảnh hưởng các tab chứa trạng thái hiện tại
+            self.lam_moi_bo_nho_tim_kiem(kinds_for_states([result.trang_thai]) if action == CHUYEN_VI_TRI
+                                         and result.trang_thai else kinds_for_action(action))
+        return result
+
+    def o_quet_nhanh(self, action):
+        """(ô chọn, nhãn trạng thái, danh sách báo cáo, ô quét) của tab quét nhanh."""
+        if action == XA_VAI:
+            return self.cb501, self.lb505, self.lw501, self.tb501
+        return self.cb601, self.lb605, self.lw601, self.tb601
+
+    def bat_tat_quet_nhanh(self, action, checked):
+        _, nhan, _, o_quet = self.o_quet_nhanh(action)
+        key = f"quet_nhanh_{action}"
+        o_quet.setFocus()
+        if not checked:
+            # Gửi nốt các lần quét còn lại rồi quay về quét từng cuộn
+            self.tac_vu.cancel(key)
+            self.gui_lo_quet_nhanh(action)
+            self.phien_quet_nhanh.pop(action, None)
+            nhan.setText("")
+            return
+        nhan.setText("Đang tải danh sách cuộn vải...")
+        sql, params = eligible_query(action, self.lb000.text())
+        self.tac_vu.submit(key, run_query, sql, params, shape=lambda rows: [row[0] for row in rows],
+                           on_result=partial(self.bat_dau_quet_nhanh, action),
+                           on_error=partial(self.loi_quet_nhanh, action))
+
+    def bat_dau_quet_nhanh(self, action, ids):
+        o_chon, _, _, o_quet = self.o_quet_nhanh(action)
+        if not o_chon.isChecked():
+            return
+        self.phien_quet_nhanh[action] = BurstSession(action, ids, journal=self.nhat_ky_quet)
+        self.cap_nhat_quet_nhanh(action)
+        o_quet.setFocus()
+
+    def loi_quet_nhanh(self, action, e):
+        o_chon, _, _, _ = self.o_quet_nhanh(action)
+        o_chon.setChecked(False)
+        self.bao_loi_truy_van(e)
+
+    def gui_tat_ca_lo_quet_nhanh(self):
+        # Gửi theo chu kỳ BURST_FLUSH_MS dù chưa đủ BURST_FLUSH_SIZE lần quét
+        for action in list(self.phien_quet_nhanh):
+            self.gui_lo_quet_nhanh(action)
+
+    def gui_lo_quet_nhanh(self, action):
+        """Gửi các lần quét đang chờ của phiên quét nhanh lên máy chủ thành một lô."""
+        phien = self.phien_quet_nhanh.get(action)
+        lo = phien.take_batch() if phien is not None else None
+        if lo is None:
+            return
+        number, batch = lo
+        self.tac_vu.submit(f"quet_nhanh_{action}_lo_{number}", flush_batch, self.quet_lo, action, batch,
+                           on_result=partial(self.ket_qua_lo_quet_nhanh, phien, number, batch),
+                           on_error=partial(self.loi_lo_quet_nhanh, phien, number, batch))
+        self.cap_nhat_quet_nhanh(action)
+
+    def ket_qua_lo_quet_nhanh(self, phien, number, batch, results):
+        report = phien.complete(number, batch, results)
+        for result in results:
+            if result.ok:
+                self.chi_muc_vi_tri.remove(result.roll_id)
+        if report.applied:
+            self.lam_moi_bo_nho_tim_kiem(kinds_for_action(phien.action))
+        self.hien_bao_cao_lo(phien.action, report)
+        if report.rejected:
+            QSound.play(":/sounds/sounds/error.wav") # Báo có cuộn bị từ chối trong lô
+
+    def loi_lo_quet_nhanh(self, phien, number, batch, e):
+        # Không gửi được: các lần quét của lô chuyển sang hàng chờ đồng bộ của nhật ký
+        error = "mất kết nối" if isinstance(e, ConnectionError) else str(e)
+        report = phien.fail(number, batch, error)
+        if isinstance(e, ConnectionError):
+            self.ngoai_tuyen = True
+        self.cap_nhat_hang_cho()
+        self.hien_bao_cao_lo(phien.action, report)
+
+    def hien_bao_cao_lo(self, action, report):
+        _, _, danh_sach, _ = self.o_quet_nhanh(action)
+        danh_sach.addItems([report.summary()] + report.lines())
+        danh_sach.scrollToBottom()
+        self.cap_nhat_quet_nhanh(action)
+
+    def cap_nhat_quet_nhanh(self, action):
+        _, nhan, _, _ = self.o_quet_nhanh(action)
+        phien = self.phien_quet_nhanh.get(action)
+        if phien is not None:
+            nhan.setText(f"Quét nhanh: đã quét {len(phien.seen)} cuộn, chờ gửi {phien.pending}, "
+                         f"đã gửi {phien.batch_number} lô")
+
+    def dong_bo_nhat_ky_quet(self):
+        """Đồng bộ nền các lần quét còn chờ trong nhật ký offline (gọi theo chu kỳ)."""
+        if self.tac_vu.is_running('dong_bo_quet') or not self.nhat_ky_quet.pending_count():
+            return
+        self.tac_vu.submit('dong_bo_quet', replay, self.nhat_ky_quet, self.dong_bo,
+                           on_result=self.ket_thuc_dong_bo, on_error=self.loi_dong_bo)
+
+    def ket_thuc_dong_bo(self, ket_qua):
+        applied, _ = ket_qua
+        if applied:
+            # Nhật ký có thể gồm mọi thao tác quét
+            self.lam_moi_bo_nho_tim_kiem()
+        if not self.nhat_ky_quet.pending_count():
+            self.ngoai_tuyen = False
+        self.loi_dong_bo_gan_nhat = None
+        self.cap_nhat_hang_cho()
+
+    def loi_dong_bo(self, e):
+        # Vẫn chưa kết nối được: giữ nguyên hàng chờ, chu kỳ sau thử lại
+        self.ngoai_tuyen = True
+        self.loi_dong_bo_gan_nhat = None if isinstance(e, ConnectionError) else f"Lỗi đồng bộ: {e}"
+        self.cap_nhat_hang_cho()
+
+    def cap_nhat_hang_cho(self):
+        """Hiển thị số lần quét chờ đồng bộ và bị từ chối khi đồng bộ lại."""
+        dong = []
+        if self.ngoai_tuyen:
+            dong.append("Mất kết nối")
+        so_cho = self.nhat_ky_quet.pending_count()
+        if so_cho:
+            dong.append(f"Chờ đồng bộ: {so_cho}")
+        bi_tu_choi = self.nhat_ky_quet.rejected(since=self.bat_dau)
+        if bi_tu_choi:
+            dong.append(f"Bị từ chối: {len(bi_tu_choi)}")
+        if self.loi_dong_bo_gan_nhat:
+            dong.append(self.loi_dong_bo_gan_nhat)
+        self.lb004.setText("\n".join(dong))
+        self.lb004.setToolTip("\n".join(
+            f"{thoi_gian[:19]}  ID {roll_id}: {ScanResult(action, roll_id, reason, trang_thai).message}"
+            for seq, action, roll_id, vi_tri, thoi_gian, reason, trang_thai in bi_tu_choi[-50:]))
+
+    def ghi_do_tre_quet(self, start, action):
+        # Độ trễ từ lúc nhận mã quét tới lúc phát âm thanh
+        ms = (time.perf_counter() - start) * 1000
+        self.quet.latency.record(ms)
+        tracer.record(f"scan.{action}", ms)
+
     def handle_scan_xa_vai(self):
+        start = time.perf_counter()
         qr_code = self.tb501.text().strip()
 
         if not qr_code:
             return
 
-        # Kiểm tra QR trong database
-        connection = connect_to_db()
-        if connection is None:
-            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
-            return
-        cursor = connection.cursor()
-        query = "SELECT ID FROM DANH_SACH_CUON_VAI WHERE ID = ? and TRANG_THAI = N'Nhập kho'"
-        cursor.execute(query, (qr_code,))
-        result = cursor.fetchone()
-
-        if result:
-            # Nếu QR hợp lệ, cập nhật THOI_DIEM_XUAT_KHO
-            update_query = """
-                UPDATE DANH_SACH_CUON_VAI 
-                SET THOI_GIAN_XA = ? ,
-                TRANG_THAI = N'Xả vải',
-                VI_TRI = ''
-                WHERE ID = ?
-            """
-            cursor.execute(update_query, (datetime.now(), qr_code))
-            connection.commit()
+        result = self.thuc_hien_quet(XA_VAI, qr_code)
 
+        if result.ok:
             # Hiển thị thông báo thành công
-            self.lb501.setText("OK")
+            self.lb501.setText(result.message)
             self.lb502.setText("")
             self.lb503.setText(f"ID : {qr_code}")
-            self.lb504.setText(f"Thời điểm xả vải : {datetime.now()}")
+            self.lb504.setText(f"Thời điểm xả vải : {result.thoi_gian}")
             QSound.play(":/sounds/sounds/bellding.wav") # Phát âm thanh thành công
         else:
             # Nếu QR không hợp lệ
             self.lb501.setText("")
-            self.lb502.setText("Mã QR không hợp lệ!")
+            self.lb502.setText(result.message)
             self.lb503.setText(f"ID : {qr_code}")
             self.lb504.setText("")
             QSound.play(":/sounds/sounds/error.wav") # Phát âm thanh lỗi
+        self.ghi_do_tre_quet(start, XA_VAI)
             
         # Reset lại LineEdit
         self.tb501.clear()
         self.tb501.setFocus()
     def handle_scan_xuat_kho(self):
+        start = time.perf_counter()
         qr_code = self.tb601.text().strip()
 
         if not qr_code:
             return
 
-        # Kiểm tra QR trong database
-        connection = connect_to_db()
-        if connection is None:
-            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
-            return
-        cursor = connection.cursor()
-        query = "SELECT ID FROM DANH_SACH_CUON_VAI WHERE ID = ? AND TRANG_THAI IN (N'Nhập kho',N'Xả vải')"
-        cursor.execute(query, (qr_code,))
-        result = cursor.fetchone()
-
-        if result:
-            # Nếu QR hợp lệ, cập nhật THOI_DIEM_XUAT_KHO
-            update_query = """
-                UPDATE DANH_SACH_CUON_VAI 
-                SET THOI_GIAN_XUAT_KHO = ? ,
-                TRANG_THAI = N'Xuất kho',
-                VI_TRI = ''
-                WHERE ID = ?
-            """
-            cursor.execute(update_query, (datetime.now(), qr_code))
-            connection.commit()
+        result = self.thuc_hien_quet(XUAT_KHO, qr_code)
 
+        if result.ok:
             # Hiển thị thông báo thành công
-            self.lb601.setText("OK")
+            self.lb601.setText(result.message)
             self.lb602.setText("")
             self.lb603.setText(f"ID : {qr_code}")
-            self.lb604.setText(f"Thời điểm xuất kho : {datetime.now()}")
+            self.lb604.setText(f"Thời điểm xuất kho : {result.thoi_gian}")
             QSound.play(":/sounds/sounds/bellding.wav") # Phát âm thanh thành công
         else:
             # Nếu QR không hợp lệ
             self.lb601.setText("")
-            self.lb602.setText("Mã QR không hợp lệ!")
+            self.lb602.setText(result.message)
             self.lb603.setText(f"ID : {qr_code}")
             self.lb604.setText("")
             QSound.play(":/sounds/sounds/error.wav") # Phát âm thanh lỗi
+        self.ghi_do_tre_quet(start, XUAT_KHO)
             
         # Reset lại LineEdit
         self.tb601.clear()
         self.tb601.setFocus()    
     
     def handle_scan_chuyen_vi_tri(self):
+        start = time.perf_counter()
         qr_code = self.tb701.text().strip()
 
         if not qr_code:
             return
 
-        if qr_code[0:1] in ['A','B','C','D','E','F','G','H','I','K','L','M','N','O','P','Q','R','S','T','U','V','W','X','Y','Z']:
+        if not qr_code.isdigit():
+            # Mã không phải ID cuộn: kiểm tra theo quy ước mã vị trí (LOCATION_CODE_PATTERN)
             self.tb701.clear()
             self.tb701.setFocus() 
+            if not is_location_code(qr_code):
+                self.lb701.setText("")
+                self.lb702.setText(f"Mã vị trí không hợp lệ: {qr_code}")
+                QSound.play(":/sounds/sounds/error.wav") # Phát âm thanh lỗi
+                return
             self.lb702.setText("")
             self.lb703.setText(f"{qr_code}")
-            self.lb704.setText("")
+            if self.chi_muc_vi_tri.loaded:
+                self.lb704.setText(f"Đang có {len(self.chi_muc_vi_tri.rolls_at(qr_code))} cuộn")
+            else:
+                self.lb704.setText("")
             self.lb705.setText("")
             QSound.play(":/sounds/sounds/success.wav") # Phát âm thanh thành công
             return
         
-        # Kiểm tra QR trong database
-        connection = connect_to_db()
-        if connection is None:
-            self.lb003.setText("Không thể kết nối tới cơ sở dữ liệu!")
-            return
-        cursor = connection.cursor()
-        query = "SELECT ID FROM DANH_SACH_CUON_VAI WHERE ID = ? AND TRANG_THAI IN (N'Nhập kho',N'Xả vải')"
-        cursor.execute(query, (qr_code,))
-        result = cursor.fetchone()
-
-        if result:
-            # Nếu QR hợp lệ, cập nhật THOI_DIEM_XUAT_KHO
-            update_query = """
-                UPDATE DANH_SACH_CUON_VAI 
-                SET VI_TRI = ? 
-                WHERE ID = ?
-            """
-            vi_tri = self.lb703.text().strip()
-            if vi_tri:
-                cursor.execute(update_query, (vi_tri, qr_code))
-                connection.commit()
+        vi_tri = self.lb703.text().strip()
+        vi_tri_cu = self.chi_muc_vi_tri.locate(qr_code)
+        result = self.thuc_hien_quet(CHUYEN_VI_TRI, qr_code, vi_tri=vi_tri)
 
-                # Hiển thị thông báo thành công
-                self.lb701.setText("OK")
-                self.lb702.setText("")
-                self.lb704.setText(f"Vị trí : {vi_tri}")
-                self.lb705.setText(f"ID : {qr_code}")
-                QSound.play(":/sounds/sounds/bellding.wav") # Phát âm thanh thành công
+        if result.ok:
+            # Hiển thị thông báo thành công
+            self.lb701.setText(result.message)
+            self.lb702.setText("")
+            if vi_tri_cu and vi_tri_cu != vi_tri:
+                self.lb704.setText(f"Vị trí : {vi_tri_cu} → {vi_tri}")
             else:
-                # Nếu chưa cập nhật vị trí hiện tại
-                self.lb701.setText("")
-                self.lb702.setText("Vui lòng quét mã QR vị trí trước khi quét mã cuộn vải!")
-                self.lb704.setText("")
-                self.lb705.setText("")
-                QSound.play(":/sounds/sounds/error.wav") # Phát âm thanh lỗi
+                self.lb704.setText(f"Vị trí : {vi_tri}")
+            self.lb705.setText(f"ID : {qr_code}")
+            QSound.play(":/sounds/sounds/bellding.wav") # Phát âm thanh thành công
         else:
-            # Nếu QR không hợp lệ
+            # Nếu QR không hợp lệ hoặc chưa quét vị trí
             self.lb701.setText("")
-            self.lb702.setText("Mã QR không hợp lệ!")
+            self.lb702.setText(result.message)
             self.lb704.setText("")
             self.lb705.setText("")
             QSound.play(":/sounds/sounds/error.wav") # Phát âm thanh lỗi
+        self.ghi_do_tre_quet(start, CHUYEN_VI_TRI)
             
         # Reset lại LineEdit
         self.tb701.clear()
         self.tb701.setFocus()    
 
+def ghi_thoi_gian_khoi_dong(app, moc):
+    # Chế độ đo khởi động: ghi các mốc (ms) và các thư viện nặng đã nạp, rồi thoát
+    moc['login_ms'] = round((time.perf_counter() - STARTED) * 1000, 1)
+    moc['heavy_modules'] = sorted(name for name in ('pandas', 'openpyxl', 'reportlab', 'qrcode', 'sqlalchemy',
+                                                    'pyodbc', 'PyQt5.QtWebEngineWidgets') if name in sys.modules)
+    with open(settings.STARTUP_LOG, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(moc) + "\n")
+    app.quit()
+
 def main():
+    moc = {'imports_ms': round((time.perf_counter() - STARTED) * 1000, 1)}
+    # Cho phép import QtWebEngineWidgets sau khi đã tạo QApplication (chỉ nạp khi mở biểu đồ)
+    QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     window = MainApp()
     app.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5())
     window.show()
+    moc['window_ms'] = round((time.perf_counter() - STARTED) * 1000, 1)
+    if settings.STARTUP_LOG:
+        # Chạy ngay sau khi vòng lặp sự kiện vẽ xong màn hình đăng nhập
+        QTimer.singleShot(0, partial(ghi_thoi_gian_khoi_dong, app, moc))
     app.exec_()
 
 if __name__ == '__main__':
+    # Cần cho tiến trình con vẽ tem khi chạy từ file .exe đóng gói bằng PyInstaller
+    multiprocessing.freeze_support()
     main()
 
@@ -0,0 +1,54 @@
+from pagination import KeysetQuery
+from query_builder import build_where, SEARCH_KINDS
+
+# Các cột được phép nhóm khi tổng hợp tồn kho
+GROUP_COLUMNS = ('STYLE', 'MO', 'LOT', 'MAU', 'VI_TRI', 'LOAI_VAI')
+
+# Các kiểu nhóm có sẵn trên tab Tồn kho (mỗi kiểu là danh sách cấp nhóm lồng nhau)
+GROUPINGS = [
+    ('Style / MO / Lot / Màu', ['STYLE', 'MO', 'LOT', 'MAU']),
+    ('Vị trí', ['VI_TRI']),
+    ('Loại vải / Style', ['LOAI_VAI', 'STYLE']),
+]
+
+def _where_with_parent(kind, filters, nha_may, parent):
+    """Mệnh đề WHERE của tab cộng thêm điều kiện của các nhóm cha (khi mở rộng nhóm)."""
+    where, params = build_where(kind, filters, nha_may)
+    clauses = [where]
+    params = list(params)
+    for column, value in (parent or {}).items():
+        if column not in GROUP_COLUMNS:
+            raise ValueError(f"Không thể nhóm theo cột {column}")
+        if value is None:
+            clauses.append(f"{column} IS NULL")
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return "\n                AND ".join(clauses), tuple(params)
+
+def summary_query(kind, filters, nha_may, group_by, parent=None):
+    """Câu GROUP BY trả về số cuộn và tổng số yard theo các cột group_by."""
+    for column in group_by:
+        if column not in GROUP_COLUMNS:
+            raise ValueError(f"Không thể nhóm theo cột {column}")
+    where, params = _where_with_parent(kind, filters, nha_may, parent)
+    columns = ", ".join(group_by)
+    select = f"{columns}, " if group_by else ""
+    group = f"GROUP BY {columns} ORDER BY {columns}" if group_by else ""
+    sql = f"""
+            SELECT {select}COUNT(*) AS SO_CUON, SUM(SO_YARD) AS SO_YARD
+            FROM DANH_SACH_CUON_VAI
+            WHERE {where}
+            {group}
+        """
+    return sql, params
+
+def detail_query(kind, filters, nha_may, parent):
+    """Truy vấn các cuộn vải của một nhóm (chỉ chạy khi người dùng mở nhóm đó)."""
+    where, params = _where_with_parent(kind, filters, nha_may, parent)
+    return KeysetQuery(SEARCH_KINDS[kind]['columns'], where, params)
+
+def summary_rows(rows, group_by):
+    """Chuyển kết quả GROUP BY thành danh sách dict gồm các cột nhóm, SO_CUON và SO_YARD."""
+    names = list(group_by) + ['SO_CUON', 'SO_YARD']
+    return [dict(zip(names, row)) for row in rows]
@@ -0,0 +1,92 @@
+"""Đo thời gian từ lúc chạy chương trình tới khi màn hình đăng nhập hiện lên.
+
+Mỗi lượt chạy ứng dụng trong một tiến trình mới với biến môi trường
+STARTUP_LOG; ứng dụng ghi các mốc thời gian (import xong, dựng cửa sổ xong,
+màn hình đăng nhập đã vẽ) cùng các thư viện nặng đã nạp rồi tự thoát. Kết quả
+là trung vị của nhiều lượt chạy. Với --importtime, chạy thêm một lượt với
+python -X importtime và in các module import chậm nhất.
+
+    python bench_startup.py [--runs 5] [--importtime] [--exe dist\\Fb_Whs.exe] [--json startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_SCRIPT = 'Fb_Whs.py'
+MILESTONES = ('imports_ms', 'window_ms', 'login_ms', 'wall_ms')
+
+def run_once(command):
+    """Chạy ứng dụng một lần, trả về các mốc thời gian (ms) mà ứng dụng ghi lại."""
+    fd, log_path = tempfile.mkstemp(suffix='.jsonl')
+    os.close(fd)
+    env = dict(os.environ, STARTUP_LOG=log_path)
+    try:
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wall_ms = round((time.perf_counter() - start) * 1000, 1)
+        with open(log_path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    finally:
+        os.remove(log_path)
+    if not lines:
+        raise RuntimeError("Ứng dụng không ghi mốc thời gian khởi động")
+    result = json.loads(lines[-1])
+    # Gồm cả thời gian khởi động trình thông dịch / giải nén file .exe
+    result['wall_ms'] = wall_ms
+    return result
+
+def import_times(limit=15):
+    """Chạy python -X importtime, trả về các module có thời gian import (cộng dồn) lớn nhất."""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import Fb_Whs'],
+                             capture_output=True, text=True)
+    rows = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+def summarize(runs):
+    summary = {name: round(statistics.median(run[name] for run in runs), 1) for name in MILESTONES}
+    summary['runs'] = len(runs)
+    summary['heavy_modules'] = runs[-1].get('heavy_modules', [])
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động tới màn hình đăng nhập")
+    parser.add_argument('--runs', type=int, default=5, help="số lượt chạy (lấy trung vị)")
+    parser.add_argument('--exe', help="đo file .exe đã đóng gói thay vì chạy bằng python")
+    parser.add_argument('--importtime', action='store_true', help="in các module import chậm nhất")
+    parser.add_argument('--json', help="ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    command = [args.exe] if args.exe else [sys.executable, APP_SCRIPT]
+    # Lượt đầu chỉ để làm nóng bộ đệm đĩa / file .pyc, không tính vào kết quả
+    run_once(command)
+    runs = [run_once(command) for _ in range(args.runs)]
+    summary = summarize(runs)
+    for name in MILESTONES:
+        print(f"{name:>12}: {summary[name]:8.1f}")
+    print(f"Thư viện nặng đã nạp khi hiện màn hình đăng nhập: {', '.join(summary['heavy_modules']) or 'không có'}")
+
+    if args.importtime:
+        summary['imports'] = []
+        print("\nModule import chậm nhất (ms, cộng dồn / riêng):")
+        for cumulative_us, self_us, name in import_times():
+            print(f"{cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}")
+            summary['imports'].append({'module': name, 'cumulative_ms': cumulative_us / 1000,
+                                       'self_ms': self_us / 1000})
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,349 @@
+"""Đo hiệu năng các thao tác chính trên dữ liệu kho giả lập, ghi kết quả ra JSON để so sánh giữa các lần chạy.
+
+Dữ liệu DANH_SACH_CUON_VAI được sinh ngẫu nhiên có hạt giống (cùng --seed thì
+cùng dữ liệu) cho NT1/NT2 với đủ các trạng thái, nạp vào SQLite cục bộ
+(repository.SqliteStore). Mỗi kích thước được sinh một lần và giữ lại trong
+--data-dir; mỗi lượt đo chạy trên một bản sao nên các lần chạy luôn bắt đầu từ
+cùng một dữ liệu. Các phép đo:
+
+    search   trang đầu và câu COUNT của các tab tìm kiếm (search_*)
+    grid     build_result và RollTableModel.set_result (đổ kết quả lên bảng)
+    export   export_rows ra CSV và Excel (tai_xuong_file_*)
+    import   đọc packing list, kiểm tra, so trùng và ghi (import_from_excel)
+    labels   print_labels vẽ tem PDF (print_labels_3x2), không gửi máy in
+    scans    chuyển vị trí từng cuộn và xả vải theo lô (ScanEngine.transition_many)
+
+    python bench_suite.py [--sizes 10000 100000 1000000] [--seed 1] [--repeat 5] [--json bench.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from config import settings
+from query_builder import build_search, TRANG_THAI_NHAP_KHO, TRANG_THAI_XA_VAI, TRANG_THAI_XUAT_KHO
+from repository import SqliteStore
+from scan_engine import CHUYEN_VI_TRI, XA_VAI
+
+SIZES = (10000, 100000, 1000000)
+FACTORIES = ('NT1', 'NT2')
+# Tỉ lệ cuộn theo trạng thái
+STATES = ((TRANG_THAI_NHAP_KHO, 0.6), (TRANG_THAI_XA_VAI, 0.25), (TRANG_THAI_XUAT_KHO, 0.15))
+# Ngày mốc cố định (không theo ngày chạy) để các lần chạy so sánh được với nhau
+END_DATE = date(2025, 1, 1)
+DAYS = 365
+LOAD_BATCH = 50000
+GRID_ROWS = 100000      # số dòng tối đa đổ lên bảng
+EXPORT_ROWS = 20000     # số dòng mỗi file xuất
+IMPORT_ROWS = 5000      # số dòng của packing list giả lập
+LABEL_COUNT = 200       # số tem mỗi lượt in
+SCAN_COUNT = 200        # số lần quét từng cuộn
+SCAN_BATCH = 100        # số cuộn mỗi lô quét nhanh
+
+LOAI_VAI = ('KNIT', 'WOVEN', 'FLEECE', 'RIB', 'MESH')
+MAU = ('BLACK', 'WHITE', 'NAVY', 'RED', 'GREY', 'OLIVE', 'PINK', 'HEATHER')
+
+def location(rng):
+    return f"{rng.choice('ABCDEFGH')}{rng.randrange(1, 41):02d}"
+
+def generate_rolls(count, seed=1):
+    """Sinh count cuộn vải (dict theo tên cột, ID từ 1), cùng seed thì cùng dữ liệu."""
+    rng = random.Random(seed)
+    start = datetime.combine(END_DATE - timedelta(days=DAYS), datetime.min.time())
+    xa_vai = STATES[0][1]
+    xuat_kho = xa_vai + STATES[1][1]
+    for roll_id in range(1, count + 1):
+        ngay_nhan = start + timedelta(days=rng.randrange(DAYS))
+        roll = {
+            'ID': roll_id,
+            'NHA_MAY': FACTORIES[roll_id % len(FACTORIES)],
+            'NGAY_NHAN': ngay_nhan.date(),
+            'STYLE': f"ST{rng.randrange(300):04d}",
+            'MO': f"MO{rng.randrange(2000):05d}",
+            'LOAI_VAI': rng.choice(LOAI_VAI),
+            'DVT': 'YDS',
+            'LOT': f"L{rng.randrange(5000):05d}",
+            'MAU': rng.choice(MAU),
+            'CUON_SO': rng.randrange(1, 200),
+            'SO_YARD': round(rng.uniform(20, 120), 2),
+            'VI_TRI': '',
+            'TRANG_THAI': TRANG_THAI_NHAP_KHO,
+            'THOI_GIAN_XA': None,
+            'THOI_GIAN_XUAT_KHO': None,
+        }
+        state = rng.random()
+        if state < xa_vai:
+            roll['VI_TRI'] = location(rng)
+        elif state < xuat_kho:
+            roll['TRANG_THAI'] = TRANG_THAI_XA_VAI
+            roll['THOI_GIAN_XA'] = ngay_nhan + timedelta(hours=rng.uniform(1, 24 * 20))
+        else:
+            roll['TRANG_THAI'] = TRANG_THAI_XUAT_KHO
+            if rng.random() < 0.5:
+                roll['THOI_GIAN_XA'] = ngay_nhan + timedelta(hours=rng.uniform(1, 24 * 20))
+            roll['THOI_GIAN_XUAT_KHO'] = ngay_nhan + timedelta(hours=rng.uniform(24 * 20, 24 * 40))
+        yield roll
+
+def base_database(data_dir, count, seed):
+    """Đường dẫn file SQLite đã nạp count cuộn (sinh một lần, các lần sau dùng lại)."""
+    path = os.path.join(data_dir, f"bench_{count}_{seed}.db")
+    if os.path.exists(path):
+        return path
+    temp_path = f"{path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    started = time.perf_counter()
+    store = SqliteStore(temp_path)
+    try:
+        batch = []
+        for roll in generate_rolls(count, seed):
+            batch.append(roll)
+            if len(batch) >= LOAD_BATCH:
+                store.add_rolls(batch)
+                batch = []
+        store.add_rolls(batch)
+        store.analyze()
+        store.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        store.close()
+    os.replace(temp_path, path)
+    print(f"Đã sinh {count:,} cuộn vào {path} ({time.perf_counter() - started:.1f} s)")
+    return path
+
+class Token():
+    """Thay cho CancelToken của TaskManager: không bao giờ hủy."""
+    cancelled = False
+
+    def check(self):
+        pass
+
+    def attach(self, cursor):
+        pass
+
+def no_progress(value):
+    pass
+
+def timings(samples):
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))], 3)
+    return {'runs': len(samples), 'min_ms': round(samples[0], 3), 'median_ms': round(statistics.median(samples), 3),
+            'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'max_ms': round(samples[-1], 3)}
+
+def measure(fn, repeat):
+    """Chạy fn repeat lần, trả về (thống kê thời gian, kết quả lần cuối)."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return timings(samples), result
+
+def search_cases():
+    tu_ngay = END_DATE - timedelta(days=90)
+    return [
+        ('ton_kho', 'all', {}),
+        ('ton_kho', 'style_prefix', {'STYLE': 'ST001*'}),
+        ('ton_kho', 'lot_contains', {'LOT': '123'}),
+        ('nhap_kho', '90_days', {'tu_ngay': tu_ngay, 'den_ngay': END_DATE}),
+        ('xa_vai', '90_days', {'tu_ngay': tu_ngay, 'den_ngay': END_DATE}),
+        ('xuat_kho', '90_days', {'tu_ngay': tu_ngay, 'den_ngay': END_DATE}),
+    ]
+
+def bench_search(store, repeat):
+    results = {}
+    for kind, label, filters in search_cases():
+        query = build_search(kind, filters, FACTORIES[0], store.dialect)
+        results[f"search.{kind}.{label}.page"], _ = measure(lambda: store._fetch(*query.page()), repeat)
+        results[f"search.{kind}.{label}.count"], (_, rows) = measure(lambda: store._fetch(*query.count()), repeat)
+        results[f"search.{kind}.{label}.count"]['rows'] = rows[0][0]
+    return results
+
+def bench_grid(store, repeat):
+    """Trả về (kết quả đo, model đã đổ dữ liệu tồn kho) để dùng cho bước xuất file và in tem."""
+    from table_models import HEADERS_TON_KHO, RollTableModel, build_result
+    query = build_search('ton_kho', {}, FACTORIES[0], store.dialect)
+    sql, params = query.all()
+    _, rows = store._fetch(f"{sql} LIMIT {GRID_ROWS}", params)
+    page = rows[:query.page_size]
+    model = RollTableModel(HEADERS_TON_KHO)
+    results = {}
+    for label, part in (('page', page), ('full', rows)):
+        stats, result = measure(lambda: build_result(part, HEADERS_TON_KHO, yard_col=8), repeat)
+        results[f"grid.build_result.{label}"] = dict(stats, rows=len(part))
+        stats, _ = measure(lambda: model.set_result(result), repeat)
+        results[f"grid.set_result.{label}"] = dict(stats, rows=len(part))
+    return results, model
+
+def bench_export(model, work_dir, repeat):
+    from exporter import CSV, XLSX, ModelSource, export_rows
+    columns = [model.column_values(i)[:EXPORT_ROWS] for i in range(len(model.headers))]
+    results = {}
+    for file_format in (CSV, XLSX):
+        path = os.path.join(work_dir, f"export.{file_format}")
+        stats, (_, written) = measure(
+            lambda: export_rows(Token(), no_progress, path, file_format, 'ton_kho', model.headers,
+                                ModelSource(columns)), repeat)
+        results[f"export.{file_format}"] = dict(stats, rows=written)
+    return results
+
+def write_packing_list(path, count, seed):
+    """Packing list giả lập (sheet NHẬP, tiêu đề ở dòng 1, tên cột ở dòng 2) gồm các cuộn chưa có trong kho."""
+    from openpyxl import Workbook
+    from bulk_import import SHEET_NAME
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET_NAME)
+    sheet.append(["PACKING LIST"])
+    sheet.append(['Ngày nhận', 'Style', 'MO', 'Loại vải', 'ĐVT', 'Lot', 'Màu', 'Cuộn số', 'Số yard'])
+    for number in range(1, count + 1):
+        sheet.append([END_DATE - timedelta(days=rng.randrange(30)), f"IMP{number // 100:04d}", f"MO{seed:05d}",
+                      rng.choice(LOAI_VAI), 'YDS', f"IL{number // 50:05d}", rng.choice(MAU), number,
+                      round(rng.uniform(20, 120), 2)])
+    workbook.save(path)
+
+def bench_import(store, work_dir, repeat, seed):
+    """Đọc, kiểm tra, so trùng và ghi packing list; các cuộn vừa nhập được xóa sau mỗi lượt.
+
+    Trên SQL Server bước ghi là bảng tạm + MERGE; ở đây ghi thẳng bằng SqliteStore.add_rolls.
+    """
+    from bulk_import import IMPORT_COLUMNS, DuplicateChecker, PackingListReader, to_records, validate_chunk
+    path = os.path.join(work_dir, "packing_list.xlsx")
+    write_packing_list(path, IMPORT_ROWS, seed)
+
+    def run():
+        checker = DuplicateChecker(store.connection, FACTORIES[0])
+        ids = []
+        for chunk in PackingListReader(path, FACTORIES[0]):
+            clean, _, _, _ = validate_chunk(chunk, checker)
+            ids += store.add_rolls(dict(zip(IMPORT_COLUMNS, record)) for record in to_records(clean))
+        store.delete_rolls(ids)
+        return len(ids)
+
+    stats, inserted = measure(run, repeat)
+    return {'import.packing_list': dict(stats, rows=inserted)}
+
+def bench_labels(model, work_dir, repeat):
+    from labels import print_labels
+    keys = ['NgayNhap', 'Style', 'MO', 'LoaiVai', 'Dvt', 'Lot', 'Mau', 'CuonSo', 'SoYard']
+    data_list = [dict(zip(keys, (model.text(row, column) for column in range(9))), ID=model.text(row, 10))
+                 for row in range(min(LABEL_COUNT, model.rowCount()))]
+    output_dir = os.path.join(work_dir, "labels")
+    stats, job = measure(lambda: print_labels(Token(), no_progress, data_list, lambda path: None,
+                                              output_dir=output_dir), repeat)
+    return {'labels.print_labels': dict(stats, labels=job.count, chunks=job.chunks,
+                                        labels_per_second=round(job.labels_per_second, 1))}
+
+def bench_scans(store):
+    """Chuyển vị trí từng cuộn (độ trễ mỗi lần quét) và xả vải theo lô SCAN_BATCH cuộn."""
+    query = build_search('ton_kho', {}, FACTORIES[0], store.dialect)
+    _, rows = store._fetch(*query.page())
+    ids = [row[10] for row in rows]
+    samples = []
+    for number in range(SCAN_COUNT):
+        started = time.perf_counter()
+        store.transition(CHUYEN_VI_TRI, ids[number % len(ids)], f"Z{number % 40:02d}")
+        samples.append((time.perf_counter() - started) * 1000)
+    results = {'scans.chuyen_vi_tri.single': timings(samples)}
+    samples = []
+    released = 0
+    for start in range(0, len(ids) - SCAN_BATCH + 1, SCAN_BATCH):
+        batch = [(XA_VAI, roll_id, None, None) for roll_id in ids[start:start + SCAN_BATCH]]
+        started = time.perf_counter()
+        released += sum(result.ok for result in store.transition_many(batch))
+        samples.append((time.perf_counter() - started) * 1000)
+    if samples:
+        results['scans.xa_vai.batch'] = dict(timings(samples), batch=SCAN_BATCH, released=released)
+    return results
+
+def run_size(count, args):
+    """Chạy mọi phép đo trên một bản sao của dữ liệu count cuộn."""
+    base = base_database(args.data_dir, count, args.seed)
+    work_dir = tempfile.mkdtemp(prefix="Fb_Whs_bench_")
+    path = os.path.join(work_dir, "bench.db")
+    shutil.copyfile(base, path)
+    store = SqliteStore(path)
+    results = {}
+    steps = {
+        'search': lambda: bench_search(store, args.repeat),
+        'export': lambda: bench_export(model, work_dir, args.repeat),
+        'import': lambda: bench_import(store, work_dir, args.repeat, args.seed),
+        'labels': lambda: bench_labels(model, work_dir, args.repeat),
+        'scans': lambda: bench_scans(store),
+    }
+    try:
+        # Bảng tồn kho đã đổ dữ liệu cũng là nguồn cho bước xuất file và in tem
+        if {'grid', 'export', 'labels'} & set(args.only):
+            grid, model = bench_grid(store, args.repeat)
+            if 'grid' in args.only:
+                results.update(grid)
+        for name, step in steps.items():
+            if name not in args.only:
+                continue
+            try:
+                results.update(step())
+            except Exception as e:
+                results[name] = {'error': f"{type(e).__name__}: {e}"}
+            print(f"  {count:>9,} cuộn: xong {name}")
+    finally:
+        store.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng trên dữ liệu kho giả lập")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="số cuộn của từng bộ dữ liệu")
+    parser.add_argument('--seed', type=int, default=1, help="hạt giống sinh dữ liệu")
+    parser.add_argument('--repeat', type=int, default=5, help="số lượt đo mỗi phép đo")
+    parser.add_argument('--only', nargs='+', default=['search', 'grid', 'export', 'import', 'labels', 'scans'],
+                        help="chỉ chạy các nhóm phép đo này")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), "Fb_Whs_bench"),
+                        help="thư mục giữ dữ liệu đã sinh")
+    parser.add_argument('--json', default=f"bench_{datetime.now():%Y%m%d_%H%M%S}.json", help="file JSON kết quả")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        'meta': {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlite': sqlite3.sqlite_version,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'page_size': settings.SEARCH_PAGE_SIZE,
+        },
+        'results': {},
+    }
+    for count in args.sizes:
+        results = run_size(count, args)
+        report['results'][str(count)] = results
+        for name, stats in results.items():
+            if 'error' in stats:
+                print(f"{count:>9,} {name:<40} LỖI: {stats['error']}")
+            else:
+                print(f"{count:>9,} {name:<40} {stats['median_ms']:>10.3f} ms (p95 {stats['p95_ms']:.3f})")
+    with open(args.json, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào {args.json}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,401 @@
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import VARCHAR, INTEGER, DATE, DECIMAL
+from sqlalchemy.dialects import mssql
+
+from config import settings
+from database import ket_noi_db
+
+# Cột trong sheet "NHẬP" của packing list và tên cột tương ứng trong DANH_SACH_CUON_VAI
+SHEET_NAME = "NHẬP"
+HEADER_ROW = 2      # dòng 1 là tiêu đề packing list, dòng 2 là tên cột
+COLUMN_COUNT = 9    # chỉ đọc 9 cột đầu
+COLUMN_MAP = {
+    'Ngày nhận': 'NGAY_NHAN',
+    'Style': 'STYLE',
+    'Loại vải': 'LOAI_VAI',
+    'ĐVT': 'DVT',
+    'Lot': 'LOT',
+    'Màu': 'MAU',
+    'Cuộn số': 'CUON_SO',
+    'Số yard': 'SO_YARD'
+}
+
+# Kiểu dữ liệu các cột được nhập
+IMPORT_DTYPE = {
+    'NGAY_NHAN': DATE(),
+    'STYLE': VARCHAR(20),
+    'MO': VARCHAR(30),
+    'LOAI_VAI': VARCHAR(20),
+    'DVT': VARCHAR(10),
+    'LOT': VARCHAR(50),
+    'MAU': VARCHAR(20),
+    'CUON_SO': INTEGER(),
+    'SO_YARD': DECIMAL(6, 2),
+    'NHA_MAY': VARCHAR(5)
+}
+IMPORT_COLUMNS = list(IMPORT_DTYPE)
+
+# Khóa nhận diện một cuộn vải: dòng trùng khóa (trong file hoặc đã có trong bảng) được bỏ qua
+KEY_COLUMNS = ('STYLE', 'MO', 'LOAI_VAI', 'LOT', 'MAU', 'CUON_SO', 'NHA_MAY')
+# Các cột bắt buộc phải có dữ liệu
+REQUIRED_COLUMNS = ('NGAY_NHAN', 'STYLE', 'CUON_SO', 'SO_YARD')
+# Cột của báo cáo lỗi: dòng trong file Excel, cột, nội dung lỗi
+REPORT_COLUMNS = ['DONG', 'COT', 'LOI']
+
+STAGING_TABLE = '#NHAP_KHO'
+
+def staging_sql():
+    """Tạo (một lần mỗi phiên kết nối) và làm rỗng bảng tạm cùng kiểu với IMPORT_DTYPE."""
+    dialect = mssql.dialect()
+    columns = ",\n            ".join(
+        f"{name} {sql_type.compile(dialect=dialect)} NULL"
+        for name, sql_type in IMPORT_DTYPE.items())
+    return f"""
+        IF OBJECT_ID('tempdb..{STAGING_TABLE}') IS NULL
+        CREATE TABLE {STAGING_TABLE} (
+            SO_TT INT IDENTITY(1, 1) NOT NULL,
+            {columns}
+        );
+        TRUNCATE TABLE {STAGING_TABLE};
+    """
+
+def insert_staging_sql():
+    columns = ", ".join(IMPORT_COLUMNS)
+    marks = ", ".join("?" for _ in IMPORT_COLUMNS)
+    return f"INSERT INTO {STAGING_TABLE} ({columns}) VALUES ({marks})"
+
+def merge_sql():
+    """MERGE theo tập hợp từ bảng tạm vào DANH_SACH_CUON_VAI, chỉ thêm cuộn chưa có.
+
+    Dòng trùng khóa trong cùng lô chỉ giữ dòng xuất hiện trước; so khớp khóa coi
+    hai giá trị NULL là bằng nhau (như drop_duplicates của pandas). Trả về số dòng đã thêm.
+    """
+    columns = ", ".join(IMPORT_COLUMNS)
+    keys = ", ".join(KEY_COLUMNS)
+    match = "\n            AND ".join(f"(t.{c} = s.{c} OR (t.{c} IS NULL AND s.{c} IS NULL))" for c in KEY_COLUMNS)
+    values = ", ".join(f"s.{c}" for c in IMPORT_COLUMNS)
+    return f"""
+        SET NOCOUNT ON;
+        MERGE DANH_SACH_CUON_VAI WITH (HOLDLOCK) AS t
+        USING (
+            SELECT {columns}
+            FROM (SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY {keys} ORDER BY SO_TT) AS RN
+                  FROM {STAGING_TABLE}) d
+            WHERE RN = 1
+        ) AS s
+        ON {match}
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT ({columns}) VALUES ({values});
+        SELECT @@ROWCOUNT;
+    """
+
+def normalize_frame(df, nha_may):
+    """Đổi tên cột, chuyển NGAY_NHAN sang ngày và gắn NHA_MAY (thao tác theo cột).
+
+    Ô ngày không đọc được giữ nguyên giá trị gốc để bước kiểm tra báo lỗi đúng dòng.
+    """
+    df = df.rename(columns=COLUMN_MAP)
+    raw = df['NGAY_NHAN']
+    parsed = pd.to_datetime(raw, errors='coerce')
+    df['NGAY_NHAN'] = parsed.where(parsed.notna() | raw.isna(), raw)
+    df['NHA_MAY'] = nha_may
+    return df.reindex(columns=IMPORT_COLUMNS)
+
+def read_packing_list(path, nha_may):
+    """Đọc cả sheet NHẬP của packing list thành một DataFrame đã chuẩn hóa."""
+    df = pd.read_excel(path, sheet_name=SHEET_NAME, usecols=range(COLUMN_COUNT), header=0, skiprows=HEADER_ROW - 1)
+    df.index = df.index + HEADER_ROW + 1  # số dòng trong file Excel (cho báo cáo lỗi)
+    return normalize_frame(df, nha_may)
+
+class PackingListReader():
+    """Đọc sheet NHẬP theo từng lô chunk_size dòng bằng openpyxl read_only.
+
+    Bộ nhớ chỉ giữ một lô tại một thời điểm dù file lớn đến đâu; mỗi lô được
+    chuẩn hóa (đổi tên cột, NGAY_NHAN, NHA_MAY) theo cột rồi chuyển ngay cho
+    bước nhập, nên các dòng đầu lên máy chủ trong khi file vẫn đang được đọc.
+    File .xls (openpyxl không đọc được) vẫn đọc bằng pandas rồi chia lô.
+    """
+    def __init__(self, path, nha_may, chunk_size=settings.IMPORT_CHUNK_SIZE):
+        self.path = path
+        self.nha_may = nha_may
+        self.chunk_size = chunk_size
+        self.workbook = None
+        self.total_rows = None
+        if os.path.splitext(path)[1].lower() != '.xls':
+            self.workbook = load_workbook(path, read_only=True, data_only=True)
+            sheet = self.workbook[SHEET_NAME]
+            # Ước lượng từ thẻ dimension của sheet (có thể thiếu), chỉ dùng cho thanh tiến độ
+            if sheet.max_row:
+                self.total_rows = max(0, sheet.max_row - HEADER_ROW)
+
+    def __iter__(self):
+        if self.workbook is None:
+            df = read_packing_list(self.path, self.nha_may)
+            self.total_rows = len(df)
+            yield from iter_chunks(df, self.chunk_size)
+            return
+        try:
+            rows = self.workbook[SHEET_NAME].iter_rows(
+                min_row=HEADER_ROW, max_col=COLUMN_COUNT, values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(name).strip() if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+            chunk = []
+            numbers = []  # số dòng trong file Excel (cho báo cáo lỗi)
+            for number, row in enumerate(rows, start=HEADER_ROW + 1):
+                if all(value is None for value in row):
+                    continue  # bỏ dòng trống (read_only trả cả các dòng định dạng rỗng ở cuối sheet)
+                chunk.append(row)
+                numbers.append(number)
+                if len(chunk) >= self.chunk_size:
+                    yield normalize_frame(pd.DataFrame(chunk, columns=columns, index=numbers), self.nha_may)
+                    chunk = []
+                    numbers = []
+            if chunk:
+                yield normalize_frame(pd.DataFrame(chunk, columns=columns, index=numbers), self.nha_may)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.workbook is not None:
+            self.workbook.close()
+
+def _text(column):
+    # Số nguyên Excel đọc thành float (vd. LOT 123 -> 123.0) được đưa về dạng '123'
+    if pd.api.types.is_float_dtype(column) and (column.dropna() % 1 == 0).all():
+        column = column.astype('Int64')
+    # Chỉ xử lý chuỗi trên các giá trị khác nhau rồi ánh xạ lại theo mã (cột packing list lặp rất nhiều)
+    codes, uniques = pd.factorize(column)
+    values = pd.Series(uniques, dtype=object).astype('string').str.strip()
+    values = np.append(values.to_numpy(dtype=object, na_value=pd.NA), pd.NA)
+    return pd.Series(values[codes], index=column.index, dtype='string')
+
+def to_records(df):
+    """Chuyển DataFrame thành danh sách tuple kiểu Python thuần cho executemany (NaN -> None)."""
+    values = []
+    for name in IMPORT_COLUMNS:
+        column = df[name]
+        if name == 'NGAY_NHAN':
+            column = pd.to_datetime(column, errors='coerce').dt.date
+        elif name == 'CUON_SO':
+            column = pd.to_numeric(column, errors='coerce').astype('Int64')
+        elif name == 'SO_YARD':
+            column = pd.to_numeric(column, errors='coerce').round(2)
+        else:
+            column = _text(column)
+        column = column.astype(object)
+        values.append(column.where(pd.notna(column), None).tolist())
+    return list(zip(*values))
+
+def _integers(column):
+    # Số nguyên hợp lệ dạng Int64 (giá trị không phải số nguyên thành <NA>)
+    numbers = pd.to_numeric(column, errors='coerce')
+    return numbers.where(numbers % 1 == 0).astype('Int64')
+
+def text_columns(df):
+    """Dạng chuỗi đã chuẩn hóa của các cột, tính một lần cho cả bước kiểm tra và so trùng."""
+    return {name: _text(df[name]) for name in IMPORT_COLUMNS}
+
+def problems(df, texts=None):
+    """Các lỗi dữ liệu theo IMPORT_DTYPE, mỗi lỗi là (mask theo dòng, cột, nội dung).
+
+    Mọi kiểm tra đều thao tác trên cả cột (pandas/NumPy), không duyệt từng dòng.
+    """
+    texts = texts or text_columns(df)
+    for name, sql_type in IMPORT_DTYPE.items():
+        column = df[name]
+        text = texts[name]
+        missing = (text.isna() | (text == '')).to_numpy(dtype=bool)
+        if name in REQUIRED_COLUMNS:
+            yield missing, name, "Thiếu dữ liệu"
+        if isinstance(sql_type, DATE):
+            invalid = pd.to_datetime(column, errors='coerce').isna().to_numpy()
+            yield ~missing & invalid, name, "Ngày không hợp lệ"
+        elif isinstance(sql_type, INTEGER):
+            numbers = pd.to_numeric(column, errors='coerce')
+            invalid = (numbers.isna() | (numbers % 1 != 0) | (numbers.abs() > 2**31 - 1)).to_numpy()
+            yield ~missing & invalid, name, "Không phải số nguyên hợp lệ"
+        elif isinstance(sql_type, DECIMAL):
+            numbers = pd.to_numeric(column, errors='coerce')
+            limit = 10 ** (sql_type.precision - sql_type.scale)
+            yield ~missing & numbers.isna().to_numpy(), name, "Không phải số"
+            yield (numbers.round(sql_type.scale).abs() >= limit).to_numpy(), name, \
+                f"Vượt quá DECIMAL({sql_type.precision},{sql_type.scale})"
+        elif isinstance(sql_type, VARCHAR):
+            yield (text.str.len() > sql_type.length).fillna(False).to_numpy(dtype=bool), name, \
+                f"Dài quá {sql_type.length} ký tự"
+
+def key_frame(df, texts=None):
+    """Khóa cuộn vải đã chuẩn hóa (chữ bỏ khoảng trắng, CUON_SO số nguyên) để so trùng."""
+    return pd.DataFrame({name: _integers(df[name]) if name == 'CUON_SO' else
+                         (texts[name] if texts else _text(df[name]))
+                         for name in KEY_COLUMNS}, index=df.index)
+
+def key_hashes(df, texts=None):
+    """Băm khóa từng dòng thành uint64 (so trùng bằng np.isin thay cho so từng dòng)."""
+    return pd.util.hash_pandas_object(key_frame(df, texts), index=False).to_numpy()
+
+class DuplicateChecker():
+    """Phát hiện dòng trùng khóa: với dòng trước đó trong file và với cuộn đã có trong kho.
+
+    Khóa các cuộn đã có được lấy theo STYLE bằng một truy vấn cho mọi STYLE mới
+    của lô (dùng index IX_DSCV_KHOA_NHAP), rồi giữ dạng tập băm để các lô sau
+    không phải hỏi lại máy chủ.
+    """
+    STYLE_BATCH = 1000  # số STYLE mỗi câu IN (dưới giới hạn 2100 tham số)
+
+    def __init__(self, connection, nha_may):
+        self.connection = connection
+        self.nha_may = nha_may
+        self.loaded_styles = set()
+        self.existing = np.empty(0, dtype=np.uint64)
+        self.seen = np.empty(0, dtype=np.uint64)
+
+    def _load(self, styles):
+        styles = [style for style in styles if style not in self.loaded_styles]
+        frames = []
+        cursor = self.connection.cursor()
+        try:
+            for start in range(0, len(styles), self.STYLE_BATCH):
+                part = styles[start:start + self.STYLE_BATCH]
+                marks = ", ".join("?" for _ in part)
+                cursor.execute(f"SELECT {', '.join(KEY_COLUMNS)} FROM DANH_SACH_CUON_VAI "
+                               f"WHERE NHA_MAY = ? AND STYLE IN ({marks})", [self.nha_may] + part)
+                rows = cursor.fetchall()
+                if rows:
+                    frames.append(pd.DataFrame.from_records([tuple(row) for row in rows], columns=KEY_COLUMNS))
+        finally:
+            cursor.close()
+        self.loaded_styles.update(styles)
+        if frames:
+            self.existing = np.concatenate([self.existing] + [key_hashes(frame) for frame in frames])
+
+    def check(self, df, texts=None):
+        """Trả về (mask trùng trong file, mask đã có trong kho) cho một lô."""
+        hashes = key_hashes(df, texts)
+        styles = (texts['STYLE'] if texts else _text(df['STYLE'])).dropna().unique().tolist()
+        if self.connection is not None and styles:
+            self._load(styles)
+        in_file = pd.Series(hashes).duplicated().to_numpy() | np.isin(hashes, self.seen)
+        in_stock = ~in_file & np.isin(hashes, self.existing)
+        self.seen = np.concatenate([self.seen, hashes])
+        return in_file, in_stock
+
+def validate_chunk(df, checker=None):
+    """Kiểm tra một lô trước khi nhập.
+
+    Trả về (các dòng sạch, báo cáo lỗi DONG/COT/LOI, số dòng lỗi, số dòng trùng).
+    Dòng lỗi dữ liệu không được kiểm tra trùng; chỉ dòng sạch được nhập.
+    """
+    reports = []
+    texts = text_columns(df)
+    invalid = np.zeros(len(df), dtype=bool)
+    for mask, column, message in problems(df, texts):
+        if mask.any():
+            invalid |= mask
+            reports.append(pd.DataFrame({'DONG': df.index[mask], 'COT': column, 'LOI': message}))
+    duplicate = np.zeros(len(df), dtype=bool)
+    if checker is not None:
+        valid = df[~invalid]
+        in_file, in_stock = checker.check(valid, {name: text[~invalid] for name, text in texts.items()})
+        key_label = ", ".join(KEY_COLUMNS)
+        for mask, message in ((in_file, "Trùng với dòng khác trong file"), (in_stock, "Cuộn vải đã có trong kho")):
+            if mask.any():
+                reports.append(pd.DataFrame({'DONG': valid.index[mask], 'COT': key_label, 'LOI': message}))
+        duplicate[np.flatnonzero(~invalid)[in_file | in_stock]] = True
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=REPORT_COLUMNS)
+    return df[~invalid & ~duplicate], report, int(invalid.sum()), int(duplicate.sum())
+
+def iter_chunks(df, chunk_size=settings.IMPORT_CHUNK_SIZE):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+class ImportSummary():
+    """Tổng kết một lần nhập file, kèm báo cáo lỗi/trùng theo từng dòng."""
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.invalid = 0
+        self.chunks = 0
+        self.reports = []
+
+    @property
+    def skipped(self):
+        # Dòng trùng (phát hiện trước khi nhập hoặc khi MERGE) không tính dòng lỗi
+        return self.total - self.inserted - self.invalid
+
+    @property
+    def report(self):
+        if not self.reports:
+            return pd.DataFrame(columns=REPORT_COLUMNS)
+        return pd.concat(self.reports, ignore_index=True).sort_values('DONG', kind='stable')
+
+    def text(self):
+        text = f"Tải lên thành công {self.inserted} dòng dữ liệu, bỏ qua {self.skipped} dòng trùng"
+        if self.invalid:
+            text += f", {self.invalid} dòng lỗi"
+        return text + "!"
+
+def import_chunk(connection, df):
+    """Nạp một lô vào bảng tạm bằng fast_executemany, MERGE và commit. Trả về số dòng đã thêm."""
+    records = to_records(df)
+    if not records:
+        return 0
+    cursor = connection.cursor()
+    try:
+        cursor.execute(staging_sql())
+        cursor.fast_executemany = True
+        cursor.executemany(insert_staging_sql(), records)
+        cursor.execute(merge_sql())
+        inserted = cursor.fetchone()[0]
+        connection.commit()
+        return inserted
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def import_chunks(token, report_progress, chunks, total_rows=None, nha_may=None):
+    """Kiểm tra rồi nhập lần lượt các lô DataFrame (chạy trong TaskManager), mỗi lô commit riêng.
+
+    Dòng lỗi và dòng trùng (trong file hoặc đã có trong kho của nha_may) được
+    ghi vào báo cáo và không gửi lên máy chủ.
+
+    Tiến độ tính theo số dòng đã commit trên total_rows (hoặc chunks.total_rows nếu có).
+    """
+    summary = ImportSummary()
+    with ket_noi_db() as connection:
+        if connection is None:
+            raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+        checker = DuplicateChecker(connection, nha_may) if nha_may else None
+        for chunk in chunks:
+            token.check()
+            clean, report, invalid, _ = validate_chunk(chunk, checker)
+            if len(report):
+                summary.reports.append(report)
+            summary.invalid += invalid
+            summary.inserted += import_chunk(connection, clean)
+            summary.total += len(chunk)
+            summary.chunks += 1
+            total = total_rows or getattr(chunks, 'total_rows', None)
+            if total:
+                report_progress(min(99, int(summary.total * 100 / total)))
+            else:
+                # Chưa biết tổng số dòng, tiến độ tiệm cận 90% theo số lô đã nhập
+                report_progress(int(90 * summary.chunks / (summary.chunks + 1)))
+    report_progress(100)
+    return summary
+
+def import_packing_list(token, report_progress, path, nha_may, chunk_size=settings.IMPORT_CHUNK_SIZE):
+    """Đọc packing list theo lô và nhập dần vào DANH_SACH_CUON_VAI, trả về ImportSummary."""
+    reader = PackingListReader(path, nha_may, chunk_size)
+    try:
+        return import_chunks(token, report_progress, reader, total_rows=reader.total_rows, nha_may=nha_may)
+    finally:
+        reader.close()
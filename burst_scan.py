@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from config import settings
+from scan_engine import (ScanResult, TRANSITIONS, OK, INVALID_ID, NOT_ELIGIBLE,
+                         ALREADY_RELEASED, ALREADY_DISPATCHED, XA_VAI, XUAT_KHO, is_roll_id)
+from scan_journal import SENDING
+
+def eligible_query(action, nha_may):
+    """Câu truy vấn lấy ID các cuộn vải đang được phép quét cho thao tác action."""
+    allowed = ", ".join(f"N'{state}'" for state in TRANSITIONS[action]['from'])
+    sql = f"SELECT ID FROM DANH_SACH_CUON_VAI WHERE NHA_MAY = ? AND TRANG_THAI IN ({allowed})"
+    return sql, (nha_may,)
+
+class BatchReport():
+    """Kết quả máy chủ trả về cho một lô quét nhanh."""
+    def __init__(self, number, results, error=None):
+        self.number = number
+        self.time = datetime.now()
+        self.size = len(results)
+        self.applied = sum(1 for result in results if result.ok)
+        self.rejected = [result for result in results if not result.ok]
+        self.error = error
+
+    def summary(self):
+        if self.error:
+            return f"Lô {self.number} ({self.time:%H:%M:%S}): {self.size} cuộn chờ đồng bộ ({self.error})"
+        return (f"Lô {self.number} ({self.time:%H:%M:%S}): {self.size} cuộn, "
+                f"{self.applied} OK, {len(self.rejected)} bị từ chối")
+
+    def lines(self):
+        return [f"    ID {result.roll_id}: {result.message}" for result in self.rejected]
+
+class BurstSession():
+    """Phiên quét nhanh cho xả vải / xuất kho.
+
+    Mỗi lần quét được kiểm tra với danh sách ID hợp lệ đã tải sẵn và trả lời
+    ngay, không chờ máy chủ; các lần quét hợp lệ được gom lại và gửi theo lô.
+    ID lớn hơn ID lớn nhất lúc tải (cuộn vừa nhập sau đó) vẫn được nhận và để
+    máy chủ quyết định.
+    """
+    def __init__(self, action, eligible_ids, journal=None, flush_size=settings.BURST_FLUSH_SIZE):
+        if action not in (XA_VAI, XUAT_KHO):
+            raise ValueError(f"Không hỗ trợ quét nhanh cho thao tác {action}")
+        self.action = action
+        self.eligible = set(eligible_ids)
+        self.max_id = max(self.eligible, default=0)
+        self.journal = journal
+        self.flush_size = flush_size
+        self.seen = set()
+        self.buffer = []  # [(seq nhật ký, roll_id, thoi_gian)]
+        self.batch_number = 0
+        self.in_flight = 0
+        self.reports = []
+
+    def scan(self, roll_id, thoi_gian=None):
+        """Kiểm tra và ghi nhận một lần quét, trả về ScanResult ngay lập tức."""
+        roll_id = str(roll_id).strip()
+        if not is_roll_id(roll_id):
+            return ScanResult(self.action, roll_id, INVALID_ID)
+        key = int(roll_id)
+        if key in self.seen:
+            return ScanResult(self.action, roll_id, ALREADY_RELEASED if self.action == XA_VAI else ALREADY_DISPATCHED)
+        if key not in self.eligible and key <= self.max_id:
+            return ScanResult(self.action, roll_id, NOT_ELIGIBLE)
+        thoi_gian = thoi_gian or datetime.now()
+        seq = None
+        if self.journal is not None:
+            seq = self.journal.record(self.action, roll_id, None, thoi_gian, status=SENDING)
+        self.seen.add(key)
+        self.eligible.discard(key)
+        self.buffer.append((seq, roll_id, thoi_gian))
+        return ScanResult(self.action, roll_id, OK, thoi_gian=thoi_gian)
+
+    def should_flush(self):
+        return len(self.buffer) >= self.flush_size
+
+    def take_batch(self):
+        """Lấy các lần quét đang chờ ra thành một lô (số lô, danh sách)."""
+        batch, self.buffer = self.buffer, []
+        if not batch:
+            return None
+        self.batch_number += 1
+        self.in_flight += len(batch)
+        return self.batch_number, batch
+
+    def complete(self, number, batch, results):
+        """Ghi kết quả máy chủ trả về cho một lô, trả về BatchReport."""
+        self.in_flight -= len(batch)
+        if self.journal is not None:
+            self.journal.complete([(seq, result) for (seq, _, _), result in zip(batch, results) if seq is not None])
+        report = BatchReport(number, results)
+        self.reports.append(report)
+        return report
+
+    def fail(self, number, batch, error):
+        """Gửi lô không thành công: chuyển các lần quét sang hàng chờ đồng bộ của nhật ký."""
+        self.in_flight -= len(batch)
+        if self.journal is not None:
+            for seq, _, _ in batch:
+                if seq is not None:
+                    self.journal.requeue(seq)
+        results = [ScanResult(self.action, roll_id, OK, thoi_gian=thoi_gian) for _, roll_id, thoi_gian in batch]
+        report = BatchReport(number, results, error=error)
+        self.reports.append(report)
+        return report
+
+    @property
+    def pending(self):
+        return len(self.buffer) + self.in_flight
+
+def flush_batch(token, report_progress, engine, action, batch):
+    """Gửi một lô quét nhanh lên máy chủ (chạy trong TaskManager)."""
+    results = engine.transition_set(action, [(roll_id, thoi_gian) for _, roll_id, thoi_gian in batch])
+    report_progress(100)
+    return results
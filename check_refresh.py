@@ -0,0 +1,277 @@
+"""Kiểm tra các nhánh làm mới bảng theo thay đổi (delta_refresh.py) trên giao diện, không cần máy chủ.
+
+Ứng dụng chạy (không hiện cửa sổ) trên một kết nối giả lập giữ cuộn vải trong
+bộ nhớ: trả lời các câu tìm kiếm theo trang, COUNT, mốc rowversion và lấy thay
+đổi. Mỗi kiểm tra sửa dữ liệu giả lập như máy khác vừa quét/nhập/xóa rồi xem
+bảng, số dòng và tổng số yard có được cập nhật đúng không. Lỗi phát sinh trong
+các hàm xử lý của Qt cũng được tính là kiểm tra lỗi.
+
+    python check_refresh.py
+"""
+import os
+import re
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import date
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("DELTA_REFRESH_MS", "0")       # làm mới do kiểm tra gọi, không theo chu kỳ
+os.environ.setdefault("SCAN_JOURNAL_PATH", ":memory:")
+
+from PyQt5.QtCore import QThreadPool
+from PyQt5.QtWidgets import QApplication, QMessageBox
+
+NHA_MAY = 'KT1'
+COLUMNS = ('NGAY_NHAN', 'STYLE', 'MO', 'LOAI_VAI', 'DVT', 'LOT', 'MAU', 'CUON_SO', 'SO_YARD', 'VI_TRI', 'ID',
+           'THOI_GIAN_XA', 'THOI_GIAN_XUAT_KHO', 'TRANG_THAI')
+
+class FakeDatabase():
+    """Bảng DANH_SACH_CUON_VAI trong bộ nhớ, trả lời đúng các dạng câu truy vấn của ứng dụng.
+
+    row_ver=False giả lập máy chủ chưa chạy migration V003 (không có cột
+    ROW_VER); fail_full_load làm hỏng câu lấy toàn bộ kết quả (không có TOP).
+    """
+    def __init__(self):
+        self.rolls = {}
+        self.deleted = []  # [(ID, ROW_VER)]
+        self.version = 0
+        self.row_ver = True
+        self.fail_full_load = False
+
+    def put(self, roll_id, trang_thai='Nhập kho', so_yard=10.0, vi_tri='A01'):
+        self.version += 1
+        self.rolls[roll_id] = {'NGAY_NHAN': date(2024, 3, 1), 'STYLE': f"ST-{roll_id % 3}", 'MO': f"MO{roll_id}",
+                               'LOAI_VAI': 'KNIT', 'DVT': 'YDS', 'LOT': 'L1', 'MAU': 'BLACK', 'CUON_SO': roll_id,
+                               'SO_YARD': so_yard, 'VI_TRI': vi_tri if trang_thai == 'Nhập kho' else '',
+                               'ID': roll_id, 'THOI_GIAN_XA': None, 'THOI_GIAN_XUAT_KHO': None,
+                               'TRANG_THAI': trang_thai, 'ROW_VER': self.version}
+
+    def delete(self, roll_id):
+        self.version += 1
+        del self.rolls[roll_id]
+        self.deleted.append((roll_id, self.version))
+
+    def in_stock(self):
+        return [roll for _, roll in sorted(self.rolls.items()) if roll['TRANG_THAI'] == 'Nhập kho']
+
+    def answer(self, sql, params):
+        if 'MIN_ACTIVE_ROWVERSION' in sql:
+            return [(self.version,)]
+        if 'ROW_VER' in sql and not self.row_ver:
+            raise RuntimeError("Invalid column name 'ROW_VER'.")
+        trang_thai = re.search(r"TRANG_THAI = N'([^']*)'", sql)
+        matches = lambda roll: trang_thai is None or roll['TRANG_THAI'] == trang_thai.group(1)
+        values = lambda roll: tuple(roll[column] for column in COLUMNS)
+        rolls = [roll for _, roll in sorted(self.rolls.items())]
+        if 'DANH_SACH_CUON_VAI_DA_XOA' in sql:
+            return [(roll_id,) for roll_id, version in self.deleted if version > params[-1]]
+        if 'KHOP' in sql:
+            return [values(roll) + (int(matches(roll)),) for roll in rolls if roll['ROW_VER'] > params[-1]]
+        if 'SO_CUON' in sql:
+            return []  # cây tổng hợp tồn kho: không kiểm tra ở đây
+        rolls = [roll for roll in rolls if matches(roll)]
+        if sql.lstrip().startswith('SELECT COUNT(*)'):
+            return [(len(rolls), sum(roll['SO_YARD'] for roll in rolls)) if 'SUM(' in sql else (len(rolls),)]
+        top = re.search(r"TOP \((\d+)\)", sql)
+        if top is None and self.fail_full_load:
+            raise RuntimeError("Lỗi giả lập khi lấy toàn bộ kết quả")
+        if 'ID > ?' in sql:
+            rolls = [roll for roll in rolls if roll['ID'] > params[-1]]
+        if top is not None:
+            rolls = rolls[:int(top.group(1))]
+        return [values(roll) for roll in rolls]
+
+class FakeCursor():
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        self.rows = self.db.answer(sql, params)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        pass
+
+class FakeConnection():
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+class Session():
+    """Một cửa sổ ứng dụng đã "đăng nhập" vào nhà máy thử, dùng kết nối giả lập."""
+    def __init__(self, app, db):
+        import Fb_Whs
+        self.app = app
+        self.db = db
+        self.errors = []
+        self.window = Fb_Whs.MainApp()
+        self.window.lb000.setText(NHA_MAY)
+        QMessageBox.critical = staticmethod(lambda parent, title, text, *args: self.errors.append(text))
+
+    def settle(self, timeout=10):
+        """Chờ mọi tác vụ nền (kể cả tác vụ do kết quả của tác vụ trước gửi tiếp) chạy xong."""
+        pool = QThreadPool.globalInstance()
+        deadline = time.monotonic() + timeout
+        idle = 0
+        while idle < 3 and time.monotonic() < deadline:
+            pool.waitForDone(50)
+            self.app.processEvents()
+            idle = idle + 1 if pool.activeThreadCount() == 0 else 0
+
+    def close(self):
+        self.window.tac_vu.cancel_all()
+        self.settle()
+        self.window.close()
+
+def check_ton_kho_delta_without_snapshot(session):
+    """Tab tồn kho đã tải đủ theo trang (chưa có tồn kho trong bộ nhớ): thay đổi được gộp, tổng tính lại tại máy."""
+    db, w = session.db, session.window
+    db.fail_full_load = True
+    try:
+        w.search_ton_kho()
+        session.settle()
+    finally:
+        db.fail_full_load = False
+    model = w.model_ton_kho
+    check(w.ton_kho_cuc_bo is None, "tồn kho trong bộ nhớ phải chưa có khi tải lỗi")
+    check(model.rowCount() == len(db.in_stock()) and not model.has_more(), "bảng tồn kho phải tải đủ")
+    db.put(3, trang_thai='Xuất kho')
+    db.put(1001, so_yard=7.5)
+    model.refresh_changes()
+    session.settle()
+    stock = db.in_stock()
+    check(model.rowCount() == len(stock), f"sai số dòng sau khi gộp thay đổi: {model.rowCount()}")
+    check(w.lb401.text() == f"Tổng số dòng dữ liệu: {len(stock)}", f"sai nhãn số dòng: {w.lb401.text()}")
+    yards = sum(roll['SO_YARD'] for roll in stock)
+    check(w.lb44.text() == f"{yards:,.0f}", f"sai tổng số yard: {w.lb44.text()} (đúng: {yards:,.0f})")
+
+def check_ton_kho_snapshot(session):
+    """Tồn kho trong bộ nhớ: lọc khi gõ và gộp thay đổi của máy khác."""
+    db, w = session.db, session.window
+    w.search_ton_kho()
+    session.settle()
+    model = w.model_ton_kho
+    check(w.ton_kho_cuc_bo is not None and len(w.ton_kho_cuc_bo) == len(db.in_stock()), "chưa tải tồn kho vào bộ nhớ")
+    w.tb401.setText('=st-1')
+    expected = [roll for roll in db.in_stock() if roll['STYLE'] == 'ST-1']
+    check(model.rowCount() == len(expected), f"lọc tại máy sai: {model.rowCount()} dòng (đúng: {len(expected)})")
+    db.put(4, trang_thai='Xả vải')
+    db.put(1003, so_yard=3.0)
+    model.refresh_changes()
+    session.settle()
+    expected = [roll for roll in db.in_stock() if roll['STYLE'] == 'ST-1']
+    check(model.rowCount() == len(expected), f"sai số dòng sau khi gộp thay đổi: {model.rowCount()}")
+    yards = sum(roll['SO_YARD'] for roll in expected)
+    check(w.lb44.text() == f"{yards:,.0f}", f"sai tổng số yard: {w.lb44.text()} (đúng: {yards:,.0f})")
+
+def check_ton_kho_snapshot_without_row_ver(session):
+    """Máy chủ chưa có cột ROW_VER: không lấy được thay đổi thì lượt tìm sau tải lại toàn bộ tồn kho."""
+    db, w = session.db, session.window
+    db.row_ver = False
+    w.search_ton_kho()
+    session.settle()
+    w.model_ton_kho.refresh_changes()
+    session.settle()
+    check(w.ton_kho_cuc_bo is not None and w.ton_kho_cuc_bo.row_version is None, "lấy thay đổi phải lỗi")
+    db.put(6, trang_thai='Xuất kho')
+    w.search_ton_kho()
+    session.settle()
+    stock = db.in_stock()
+    check(w.model_ton_kho.rowCount() == len(stock), f"tồn kho không được tải lại: {w.model_ton_kho.rowCount()} dòng")
+    yards = sum(roll['SO_YARD'] for roll in stock)
+    check(w.lb44.text() == f"{yards:,.0f}", f"sai tổng số yard: {w.lb44.text()} (đúng: {yards:,.0f})")
+
+def import_and_delete(session):
+    """Như sau khi nhập file Excel rồi xóa dòng trên tab Nhập kho: bảng phải có dòng mới và mất dòng đã xóa."""
+    db, w = session.db, session.window
+    w.search_nhap_kho()
+    session.settle()
+    model = w.model_nhap_kho
+    check(model.rowCount() == len(db.rolls), "bảng nhập kho phải tải đủ")
+    db.put(1002)
+    w.lam_moi_bo_nho_tim_kiem()
+    w.lam_moi_nhap_kho()
+    session.settle()
+    ids = [int(model.value(row, 10)) for row in range(model.rowCount())]
+    check(ids == sorted(db.rolls), f"bảng thiếu cuộn vừa nhập: {ids[-3:]}")
+    db.delete(5)
+    w.lam_moi_bo_nho_tim_kiem()
+    w.lam_moi_nhap_kho()
+    session.settle()
+    ids = [int(model.value(row, 10)) for row in range(model.rowCount())]
+    check(ids == sorted(db.rolls), "bảng còn cuộn đã xóa" if 5 in ids else f"sai danh sách cuộn: {ids}")
+
+def check_nhap_kho_refresh(session):
+    """Máy chủ có cột ROW_VER: nhập/xóa chỉ lấy các dòng thay đổi."""
+    import_and_delete(session)
+
+def check_nhap_kho_refresh_without_row_ver(session):
+    """Máy chủ chưa có cột ROW_VER (chưa chạy migration V003): câu lấy thay đổi lỗi thì tìm lại toàn bộ."""
+    session.db.row_ver = False
+    import_and_delete(session)
+
+CHECKS = [check_ton_kho_delta_without_snapshot, check_ton_kho_snapshot, check_ton_kho_snapshot_without_row_ver,
+          check_nhap_kho_refresh, check_nhap_kho_refresh_without_row_ver]
+
+def sample_database():
+    """20 cuộn đang nhập kho của nhà máy thử."""
+    db = FakeDatabase()
+    for roll_id in range(1, 21):
+        db.put(roll_id, so_yard=10.0 + roll_id)
+    return db
+
+def main():
+    app = QApplication.instance() or QApplication(sys.argv)
+    import workers
+    import delta_refresh
+
+    current = {}
+
+    @contextmanager
+    def fake_db():
+        yield FakeConnection(current['db'])
+
+    workers.ket_noi_db = fake_db
+    delta_refresh.ket_noi_db = fake_db
+
+    failures = 0
+    for fn in CHECKS:
+        # Lỗi trong hàm xử lý của Qt: ghi lại thay vì để PyQt5 dừng ứng dụng
+        slot_errors = []
+        sys.excepthook = lambda *exc: slot_errors.append("".join(traceback.format_exception(*exc)))
+        current['db'] = sample_database()
+        session = Session(app, current['db'])
+        try:
+            fn(session)
+            errors = slot_errors + session.errors
+            check(not errors, "lỗi khi xử lý kết quả:\n" + "\n".join(errors))
+            print(f"OK   {fn.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"LỖI  {fn.__name__}: {e}")
+        finally:
+            session.close()
+            sys.excepthook = sys.__excepthook__
+    print(f"{len(CHECKS) - failures}/{len(CHECKS)} kiểm tra đạt")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
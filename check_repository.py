@@ -0,0 +1,172 @@
+"""Kiểm tra hành vi của kho dữ liệu (repository.py): SQL Server và SQLite phải cho cùng kết quả.
+
+Bộ kiểm tra tự thêm các cuộn vải của nhà máy thử KT1/KT2, chạy lần lượt các
+kiểm tra (tra cứu, tìm kiếm, quét, xóa, đăng nhập) rồi xóa dữ liệu đã thêm.
+Cuối cùng in thời gian tra cứu một cuộn theo ID (trung vị và p95).
+
+    python check_repository.py                   # SQLite trong thư mục tạm
+    python check_repository.py --sqlite kho.db   # SQLite tại đường dẫn cho trước
+    python check_repository.py --sqlserver       # SQL Server theo .env (chỉ dùng cơ sở dữ liệu thử nghiệm!)
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from query_builder import TRANG_THAI_NHAP_KHO, TRANG_THAI_XA_VAI, TRANG_THAI_XUAT_KHO
+from repository import SqliteStore, SqlServerStore
+from scan_engine import (OK, INVALID_ID, UNKNOWN_ID, ALREADY_RELEASED, ALREADY_DISPATCHED, NO_LOCATION,
+                         INVALID_LOCATION, XA_VAI, XUAT_KHO, CHUYEN_VI_TRI)
+
+NHA_MAY = 'KT1'
+NHA_MAY_KHAC = 'KT2'
+NGAY = date(2024, 3, 1)
+
+def sample_rolls():
+    """20 cuộn của KT1 (5 cuộn ở A01, lô 'L_1' và 'LX1' để kiểm tra ký tự đại diện) và 2 cuộn của KT2."""
+    rolls = []
+    for i in range(20):
+        rolls.append({'NHA_MAY': NHA_MAY, 'NGAY_NHAN': NGAY + timedelta(days=i % 4), 'STYLE': f"ST-{i % 2}",
+                      'MO': f"MO{i}", 'LOAI_VAI': 'KNIT', 'DVT': 'YDS', 'LOT': 'L_1' if i < 10 else 'LX1',
+                      'MAU': 'BLACK', 'CUON_SO': i + 1, 'SO_YARD': 50.25, 'VI_TRI': 'A01' if i < 5 else 'A02',
+                      'TRANG_THAI': TRANG_THAI_NHAP_KHO})
+    for i in range(2):
+        rolls.append({'NHA_MAY': NHA_MAY_KHAC, 'NGAY_NHAN': NGAY, 'STYLE': 'ST-0', 'MO': 'MO0', 'LOAI_VAI': 'KNIT',
+                      'DVT': 'YDS', 'LOT': 'L_1', 'MAU': 'BLACK', 'CUON_SO': i + 1, 'SO_YARD': 10,
+                      'VI_TRI': 'A01', 'TRANG_THAI': TRANG_THAI_NHAP_KHO})
+    return rolls
+
+def ids_of(rows):
+    return sorted(int(row['ID']) for row in rows)
+
+def search_ids(store, kind, nha_may=NHA_MAY, **filters):
+    return ids_of(store.search(kind, filters, nha_may)['rows'])
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+def check_lookup(store, ids):
+    roll = store.get_roll(ids[0])
+    check(roll is not None, "không tìm thấy cuộn vừa thêm")
+    check(roll['NHA_MAY'] == NHA_MAY and roll['STYLE'] == 'ST-0' and roll['CUON_SO'] == 1, f"sai thông tin: {roll}")
+    check(str(roll['NGAY_NHAN'])[:10] == NGAY.isoformat(), f"sai NGAY_NHAN: {roll['NGAY_NHAN']}")
+    check(abs(float(roll['SO_YARD']) - 50.25) < 1e-6, f"sai SO_YARD: {roll['SO_YARD']}")
+    check(roll['TRANG_THAI'] == TRANG_THAI_NHAP_KHO and roll['VI_TRI'] == 'A01', f"sai trạng thái: {roll}")
+    check(store.get_roll(max(ids) + 1000000) is None, "ID không tồn tại phải trả về None")
+
+def check_locations(store, ids):
+    check(ids_of(store.rolls_at(NHA_MAY, 'A01')) == ids[:5], "sai các cuộn ở A01")
+    check(ids_of(store.rolls_at(NHA_MAY_KHAC, 'A01')) == ids[20:], "sai các cuộn ở A01 của nhà máy khác")
+    check(store.rolls_at(NHA_MAY, 'Z99') == [], "vị trí trống phải không có cuộn nào")
+
+def check_search(store, ids):
+    check(search_ids(store, 'ton_kho') == ids[:20], "tồn kho không đủ 20 cuộn")
+    check(search_ids(store, 'ton_kho', STYLE='=ST-1') == ids[1:20:2], "lọc chính xác STYLE sai")
+    check(search_ids(store, 'ton_kho', STYLE='=st-1') == ids[1:20:2], "lọc phải không phân biệt hoa thường")
+    check(search_ids(store, 'ton_kho', STYLE='ST*') == ids[:20], "lọc bắt đầu bằng sai")
+    check(search_ids(store, 'ton_kho', LOT='L_1') == ids[:10], "ký tự _ phải được so khớp đúng nghĩa đen")
+    check(search_ids(store, 'ton_kho', MO='O1') == [ids[1]] + ids[10:20], "lọc chứa sai")
+    check(search_ids(store, 'nhap_kho', tu_ngay=NGAY, den_ngay=NGAY + timedelta(days=1))
+          == [roll_id for i, roll_id in enumerate(ids[:20]) if i % 4 < 2], "khoảng ngày phải gồm cả ngày cuối")
+    page = store.search('ton_kho', {}, NHA_MAY, page_size=8)
+    check(ids_of(page['rows']) == ids[:8] and page['after'] == ids[7], "trang đầu sai")
+    page = store.search('ton_kho', {}, NHA_MAY, after=ids[15], page_size=8)
+    check(ids_of(page['rows']) == ids[16:20] and page['after'] is None, "trang cuối sai")
+
+def check_scans(store, ids):
+    reasons = lambda results: [result.reason for result in results]
+    results = store.transition_many([
+        (XA_VAI, ids[0], None, None),
+        (XA_VAI, ids[0], None, None),          # cùng lô: lần sau thấy kết quả lần trước
+        (XUAT_KHO, ids[1], None, None),
+        (XUAT_KHO, ids[1], None, None),
+        (CHUYEN_VI_TRI, ids[1], 'B01', None),
+        (CHUYEN_VI_TRI, ids[2], 'B01', None),
+        (XA_VAI, ids[2], None, None),
+        (CHUYEN_VI_TRI, ids[2], 'C01', None),  # chuyển vị trí được cả khi đã xả vải
+        (XA_VAI, 'abc', None, None),
+        (XA_VAI, max(ids) + 1000000, None, None),
+        (CHUYEN_VI_TRI, ids[3], None, None),
+        (CHUYEN_VI_TRI, ids[3], 'j-01', None),
+    ])
+    check(reasons(results) == [OK, ALREADY_RELEASED, OK, ALREADY_DISPATCHED, ALREADY_DISPATCHED, OK, OK, OK,
+                               INVALID_ID, UNKNOWN_ID, NO_LOCATION, INVALID_LOCATION], f"sai kết quả quét: {reasons(results)}")
+    check(results[0].trang_thai == TRANG_THAI_XA_VAI and results[0].vi_tri == '', "xả vải phải bỏ vị trí")
+    check(results[4].trang_thai == TRANG_THAI_XUAT_KHO, "cuộn bị từ chối phải kèm trạng thái hiện tại")
+    check(isinstance(results[0].thoi_gian, datetime), "quét thành công phải có thời gian")
+    roll = store.get_roll(ids[2])
+    check(roll['TRANG_THAI'] == TRANG_THAI_XA_VAI and roll['VI_TRI'] == 'C01', f"sai trạng thái sau khi quét: {roll}")
+    today = date.today()
+    released = store.search('xa_vai', {'tu_ngay': today, 'den_ngay': today}, NHA_MAY)['rows']
+    check(ids_of(released) == [ids[0], ids[2]], "tab xả vải sai")
+    check(all(0 <= float(row['SO_GIO']) < 1 for row in released), "sai số giờ đã xả")
+    check(search_ids(store, 'xuat_kho', tu_ngay=today, den_ngay=today) == [ids[1]], "tab xuất kho sai")
+    check(search_ids(store, 'ton_kho') == ids[3:20], "tồn kho phải bỏ các cuộn đã xả/xuất")
+
+def check_delete(store, ids):
+    check(store.delete_rolls([ids[19], ids[18]]) == 2, "phải xóa đúng 2 dòng")
+    check(store.get_roll(ids[19]) is None, "cuộn đã xóa vẫn còn")
+    check(store.delete_rolls([]) == 0, "xóa danh sách rỗng phải trả về 0")
+
+def check_login(store, ids):
+    if hasattr(store, 'add_employees'):
+        store.add_employees([(NHA_MAY, '0001', 'Nguyễn Văn A', 'KHO', 'mk', 'Kho vải'),
+                             (NHA_MAY, '0002', 'Trần Thị B', 'MAY', 'mk', None)])
+        check(store.authenticate(NHA_MAY, '0001', 'mk') == (NHA_MAY, '0001', 'Nguyễn Văn A', 'KHO', 'Kho vải'),
+              "đăng nhập đúng phải trả về thông tin nhân viên")
+        check(store.authenticate(NHA_MAY, '0002', 'mk') is None, "nhân viên không thuộc kho không được đăng nhập")
+    check(store.authenticate(NHA_MAY, '0001', 'sai mật khẩu') is None, "sai mật khẩu phải trả về None")
+
+CHECKS = [check_lookup, check_locations, check_search, check_scans, check_delete, check_login]
+
+def lookup_timing(store, ids, runs=500):
+    """Trung vị và p95 (ms) của get_roll."""
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        store.get_roll(ids[i % len(ids)])
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(0.95 * len(samples))]
+
+def run_checks(store):
+    """Chạy mọi kiểm tra trên store, trả về số kiểm tra lỗi."""
+    ids = store.add_rolls(sample_rolls())
+    failures = 0
+    try:
+        for fn in CHECKS:
+            try:
+                fn(store, ids)
+                print(f"OK   {fn.__name__}")
+            except Exception as e:
+                failures += 1
+                print(f"LỖI  {fn.__name__}: {e}")
+        p50, p95 = lookup_timing(store, ids[:17])
+        print(f"Tra cứu theo ID: trung vị {p50:.3f} ms, p95 {p95:.3f} ms")
+    finally:
+        store.delete_rolls(ids)
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sqlite', metavar='PATH', help="đường dẫn file SQLite (mặc định: file tạm)")
+    parser.add_argument('--sqlserver', action='store_true', help="kiểm tra SQL Server theo cấu hình .env")
+    args = parser.parse_args()
+
+    if args.sqlserver:
+        store = SqlServerStore()
+    else:
+        store = SqliteStore(args.sqlite or os.path.join(tempfile.mkdtemp(), 'check_repository.db'))
+    try:
+        failures = run_checks(store)
+    finally:
+        store.close()
+    print(f"{type(store).__name__}: {len(CHECKS) - failures}/{len(CHECKS)} kiểm tra đạt")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
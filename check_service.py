@@ -0,0 +1,154 @@
+"""Kiểm tra dịch vụ quét (scan_service.py) qua HTTP trên cơ sở dữ liệu SQLite tạm.
+
+Mỗi kiểm tra chạy ứng dụng FastAPI trên một SqliteStore riêng (có sẵn các cuộn
+của check_repository.sample_rolls) và gọi thẳng qua httpx.ASGITransport, không
+cần mở cổng: quét đồng thời (gom lô ghi), mã quét hỏng không làm lỗi lần quét
+khác trong lô, thao tác/loại tìm kiếm sai (404), tham số sai (422), phân trang,
+mất kết nối (503) và /health.
+
+    python check_service.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import httpx
+
+from check_repository import NHA_MAY, check, ids_of, sample_rolls
+from repository import SqliteStore
+from scan_engine import (OK, INVALID_ID, UNKNOWN_ID, ALREADY_RELEASED, ALREADY_DISPATCHED, NO_LOCATION,
+                         XA_VAI, XUAT_KHO, CHUYEN_VI_TRI)
+from scan_service import create_app
+
+HUGE_ID = str(2 ** 31)  # chỉ gồm chữ số nhưng vượt quá cột ID (INT)
+
+class FlakyStore(SqliteStore):
+    """SqliteStore giả lập được mất kết nối tới máy chủ (offline = True)."""
+    offline = False
+
+    def _online(self):
+        if self.offline:
+            raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+
+    def get_roll(self, roll_id):
+        self._online()
+        return super().get_roll(roll_id)
+
+    def transition_many(self, scans):
+        self._online()
+        return super().transition_many(scans)
+
+async def scan(client, action, roll_id, vi_tri=None):
+    response = await client.post(f"/scan/{action}", json={'id': str(roll_id), 'vi_tri': vi_tri})
+    check(response.status_code == 200, f"quét {action} {roll_id}: HTTP {response.status_code} {response.text}")
+    return response.json()
+
+async def scan_all(client, scans):
+    """Gửi mọi lần quét cùng lúc (như nhiều máy quét), trả về kết quả theo thứ tự."""
+    return await asyncio.gather(*(scan(client, *item) for item in scans))
+
+async def check_concurrent_scans(client, store, ids):
+    scans = [(XA_VAI, roll_id) for roll_id in ids[:10]] + [(XUAT_KHO, roll_id) for roll_id in ids[10:15]]
+    scans += [(CHUYEN_VI_TRI, ids[15], 'B01'), (XA_VAI, ids[0]), (XUAT_KHO, ids[10])]
+    results = await scan_all(client, scans)
+    reasons = [result['reason'] for result in results]
+    check(reasons[:16] == [OK] * 16, f"các lần quét hợp lệ phải thành công: {reasons[:16]}")
+    check(reasons[16:] == [ALREADY_RELEASED, ALREADY_DISPATCHED], f"quét lại phải bị từ chối: {reasons[16:]}")
+    check(store.get_roll(ids[15])['VI_TRI'] == 'B01', "chuyển vị trí không được ghi")
+    writes = (await client.get("/health")).json()['writes']
+    check(writes['scans'] == len(scans), f"sai số lần quét đã ghi: {writes}")
+    check(writes['batches'] < len(scans), f"các lần quét đồng thời phải được gom lô: {writes}")
+
+async def check_bad_ids(client, store, ids):
+    results = await scan_all(client, [(XA_VAI, ids[0]), (XA_VAI, HUGE_ID), (XA_VAI, 'abc'),
+                                      (XA_VAI, max(ids) + 1000000), (XUAT_KHO, ids[1]),
+                                      (CHUYEN_VI_TRI, ids[2], None)])
+    reasons = [result['reason'] for result in results]
+    check(reasons == [OK, INVALID_ID, INVALID_ID, UNKNOWN_ID, OK, NO_LOCATION],
+          f"mã quét hỏng chỉ được làm lỗi chính nó: {reasons}")
+    response = await client.get(f"/rolls/{HUGE_ID}")
+    check(response.status_code == 422, f"ID vượt quá INT phải trả về 422: HTTP {response.status_code}")
+
+async def check_bad_requests(client, store, ids):
+    expected = [
+        ('POST', "/scan/nhap_kho", {'id': str(ids[0])}, 404),
+        ('POST', f"/scan/{XA_VAI}", {}, 422),
+        ('GET', f"/rolls/{max(ids) + 1000000}", None, 404),
+        ('GET', f"/search/khong_co?nha_may={NHA_MAY}", None, 404),
+        ('GET', f"/search/ton_kho?nha_may={NHA_MAY}&limit=-1", None, 422),
+        ('GET', f"/search/ton_kho?nha_may={NHA_MAY}&limit=0", None, 422),
+        ('GET', f"/search/ton_kho?nha_may={NHA_MAY}&after=-1", None, 422),
+    ]
+    for method, url, body, status in expected:
+        response = await client.request(method, url, json=body)
+        check(response.status_code == status, f"{method} {url}: HTTP {response.status_code} (đúng: {status})")
+
+async def check_lookup(client, store, ids):
+    roll = (await client.get(f"/rolls/{ids[0]}")).json()
+    check(roll['ID'] == ids[0] and roll['NHA_MAY'] == NHA_MAY and roll['VI_TRI'] == 'A01', f"sai thông tin: {roll}")
+    located = (await client.get(f"/locations/A01?nha_may={NHA_MAY}")).json()
+    check(ids_of(located['rolls']) == ids[:5], "sai các cuộn ở A01")
+
+async def check_paging(client, store, ids):
+    seen, after, pages = [], None, 0
+    while True:
+        url = f"/search/ton_kho?nha_may={NHA_MAY}&limit=6" + (f"&after={after}" if after is not None else "")
+        page = (await client.get(url)).json()
+        check(len(page['rows']) <= 6, f"trang vượt quá limit: {len(page['rows'])} dòng")
+        seen += ids_of(page['rows'])
+        pages += 1
+        after = page['after']
+        if after is None:
+            break
+    check(seen == ids[:20] and pages == 4, f"phân trang sai: {pages} trang, {len(seen)} cuộn")
+    page = (await client.get(f"/search/ton_kho?nha_may={NHA_MAY}&style=st-1")).json()
+    check(ids_of(page['rows']) == ids[1:20:2], "lọc theo style sai")
+
+async def check_offline(client, store, ids):
+    store.offline = True
+    try:
+        for response in (await client.get(f"/rolls/{ids[0]}"),
+                         await client.post(f"/scan/{XA_VAI}", json={'id': str(ids[0])})):
+            check(response.status_code == 503, f"mất kết nối phải trả về 503: HTTP {response.status_code}")
+    finally:
+        store.offline = False
+    check((await scan(client, XA_VAI, ids[0]))['reason'] == OK, "có kết nối lại phải quét được")
+
+async def check_health(client, store, ids):
+    await scan_all(client, [(XA_VAI, roll_id) for roll_id in ids[:3]])
+    await client.get(f"/rolls/{ids[3]}")
+    health = (await client.get("/health")).json()
+    check(set(health) == {'scan', 'read', 'db', 'writes'}, f"thiếu mục trong /health: {sorted(health)}")
+    check(health['scan']['count'] == 3 and health['read']['count'] == 1, f"sai số lượt đo: {health}")
+    check(health['writes']['scans'] == 3 and health['writes']['waiting'] == 0, f"sai thống kê ghi: {health['writes']}")
+
+CHECKS = [check_concurrent_scans, check_bad_ids, check_bad_requests, check_lookup, check_paging, check_offline,
+          check_health]
+
+async def run_check(fn, path):
+    store = FlakyStore(path)
+    ids = store.add_rolls(sample_rolls())
+    app = create_app(store)
+    try:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://scan") as client:
+                await fn(client, store, ids)
+    finally:
+        store.close()
+
+def main():
+    folder = tempfile.mkdtemp()
+    failures = 0
+    for fn in CHECKS:
+        try:
+            asyncio.run(run_check(fn, os.path.join(folder, f"{fn.__name__}.db")))
+            print(f"OK   {fn.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"LỖI  {fn.__name__}: {e}")
+    print(f"{len(CHECKS) - failures}/{len(CHECKS)} kiểm tra đạt")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+def get_resource_path(relative_path):
+    """Trả về đường dẫn đầy đủ đến tài nguyên."""
+    if getattr(sys, 'frozen', False):  # Kiểm tra nếu đang chạy file .exe
+        base_path = sys._MEIPASS
+    else:  # Nếu đang chạy bằng Python gốc
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+# Nạp file .env một lần duy nhất khi khởi động
+env_file = get_resource_path(".env")
+load_dotenv(env_file)
+
+#config URL cho engine
+class Settings():
+    API_PREFIX = ''
+
+    @property
+    def DATABASE_1_URL(self):
+        # Chỉ nạp SQLAlchemy khi tạo engine lần đầu, không làm chậm lúc khởi động
+        from sqlalchemy.engine import URL
+        return URL.create(
+            "mssql+pyodbc",
+            username=os.getenv("UID"),
+            password=os.getenv("PASSWORD"),
+            host=os.getenv("SERVER"),
+            port=1433,
+            database=os.getenv("DB"),
+            query={
+               "driver": "ODBC Driver 17 for SQL Server",
+               "TrustServerCertificate": "yes"
+            }
+        )
+
+    # Giới hạn pool kết nối dùng chung cho toàn bộ ứng dụng
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))         # số kết nối giữ sẵn
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))   # số kết nối mở thêm khi cao điểm
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))  # số giây chờ tối đa khi pool đầy
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # làm mới kết nối sau 30 phút
+    # Số dòng mỗi trang khi tìm kiếm (các trang sau được tải khi cuộn bảng)
+    SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", 1000))
+    # Bộ nhớ đệm kết quả tìm kiếm: dung lượng tối đa (MB) và thời gian sống (giây, 0 = tắt)
+    QUERY_CACHE_MB = int(os.getenv("QUERY_CACHE_MB", 64))
+    QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", 120))
+    # Chu kỳ lấy các dòng thay đổi cho bảng của tab đang mở (mili giây, 0 = tắt)
+    DELTA_REFRESH_MS = int(os.getenv("DELTA_REFRESH_MS", 15000))
+    # Nhật ký quét offline (SQLite) trong thư mục người dùng
+    SCAN_JOURNAL_PATH = os.getenv("SCAN_JOURNAL_PATH", os.path.join(
+        os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), "Fb_Whs", "scan_journal.db"))
+    SCAN_REPLAY_BATCH = int(os.getenv("SCAN_REPLAY_BATCH", 200))         # số lần quét mỗi lô đồng bộ
+    SCAN_REPLAY_INTERVAL_MS = int(os.getenv("SCAN_REPLAY_INTERVAL_MS", 5000))  # chu kỳ thử đồng bộ lại
+    SCAN_JOURNAL_KEEP_DAYS = int(os.getenv("SCAN_JOURNAL_KEEP_DAYS", 30))  # số ngày giữ lần quét đã đồng bộ
+    # Quét nhanh: gửi lô lên máy chủ sau mỗi N lần quét hoặc M mili giây
+    BURST_FLUSH_SIZE = int(os.getenv("BURST_FLUSH_SIZE", 50))
+    BURST_FLUSH_MS = int(os.getenv("BURST_FLUSH_MS", 2000))
+    # Mã vị trí hợp lệ: chữ cái đầu (trừ J) rồi tới chữ số/chữ hoa/dấu gạch, tối đa 20 ký tự
+    LOCATION_CODE_PATTERN = os.getenv("LOCATION_CODE_PATTERN", r"[A-IK-Z][A-Z0-9._/-]{0,19}")
+    # Nhập file Excel: số dòng mỗi lô (mỗi lô nạp bảng tạm, MERGE và commit riêng)
+    IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 5000))
+    # In tem: số tem mỗi file PDF gửi máy in, số tiến trình vẽ tem (0 = theo số nhân CPU)
+    LABEL_CHUNK_SIZE = int(os.getenv("LABEL_CHUNK_SIZE", 200))
+    LABEL_WORKERS = int(os.getenv("LABEL_WORKERS", 0))
+    # Cơ sở dữ liệu SQLite cục bộ cho kho vệ tinh (rỗng = dùng SQL Server), xem repository.py
+    LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "")
+    # Dịch vụ quét cho máy cầm tay (scan_service.py): địa chỉ, cổng và số lần quét tối đa mỗi lô ghi
+    SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+    SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8000))
+    SERVICE_WRITE_BATCH = int(os.getenv("SERVICE_WRITE_BATCH", 100))
+    # Đo thời gian khởi động: đường dẫn file ghi các mốc thời gian (xem bench_startup.py)
+    STARTUP_LOG = os.getenv("STARTUP_LOG", "")
+    # Ghi vết thời gian thao tác (tracing.py): bật/tắt, file log xoay vòng, dung lượng mỗi file (MB), số file cũ giữ lại
+    TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+    TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", os.path.join(
+        os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), "Fb_Whs", "trace.log"))
+    TRACE_LOG_MB = int(os.getenv("TRACE_LOG_MB", 5))
+    TRACE_LOG_BACKUPS = int(os.getenv("TRACE_LOG_BACKUPS", 3))
+
+settings = Settings()
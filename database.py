@@ -0,0 +1,136 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Generator
+
+from config import settings
+from tracing import tracer
+
+_engine_lock = threading.Lock()
+_engine = None
+_session_factory = None
+_base = None
+
+def get_engine():
+    """Engine dùng chung, tạo ở lần dùng đầu tiên (pool có giới hạn, kiểm tra kết nối trước khi dùng).
+
+    SQLAlchemy và driver pyodbc chỉ được nạp lúc này nên màn hình đăng nhập
+    hiện lên mà không phải chờ.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from sqlalchemy import create_engine, event
+                engine = create_engine(
+                    settings.DATABASE_1_URL,
+                    pool_pre_ping=True,
+                    pool_size=settings.DB_POOL_SIZE,
+                    max_overflow=settings.DB_MAX_OVERFLOW,
+                    pool_timeout=settings.DB_POOL_TIMEOUT,
+                    pool_recycle=settings.DB_POOL_RECYCLE,
+                )
+                event.listen(engine, "checkout", _on_checkout)
+                event.listen(engine, "connect", _on_connect)
+                _engine = engine
+    return _engine
+
+def get_session_factory():
+    global _session_factory
+    if _session_factory is None:
+        from sqlalchemy.orm import sessionmaker
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    return _session_factory
+
+def __getattr__(name):
+    # Giữ các tên cũ (engine_1, SessionLocal_1, Base) nhưng chỉ tạo khi được dùng tới
+    global _base
+    if name == "engine_1":
+        return get_engine()
+    if name == "SessionLocal_1":
+        return get_session_factory()
+    if name == "Base":
+        if _base is None:
+            from sqlalchemy.orm import declarative_base
+            _base = declarative_base()
+        return _base
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_db_1() -> Generator:
+    try:
+        db = get_session_factory()()
+        yield db
+    finally:
+        db.close()
+
+class PoolStats():
+    """Thống kê sử dụng pool kết nối (an toàn khi gọi từ nhiều luồng)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0      # số lần lấy kết nối từ pool
+        self.connects = 0       # số kết nối vật lý đã mở tới máy chủ
+        self.errors = 0         # số lần không lấy được kết nối
+        self.wait_total = 0.0   # tổng thời gian chờ lấy kết nối (giây)
+        self.wait_max = 0.0     # thời gian chờ lâu nhất (giây)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool):
+        with self._lock:
+            checkouts = self.checkouts
+            return {
+                "checkouts": checkouts,
+                "connects": self.connects,
+                "errors": self.errors,
+                "wait_avg_ms": round(self.wait_total * 1000 / checkouts, 2) if checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 2),
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+
+pool_stats = PoolStats()
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.increment("checkouts")
+
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.increment("connects")
+
+def connect_to_db():
+    """Lấy một kết nối từ pool dùng chung, trả về None nếu không kết nối được.
+
+    Gọi close() trên kết nối sẽ trả nó về pool chứ không đóng kết nối vật lý.
+    """
+    start = time.perf_counter()
+    try:
+        with tracer.span("db.connect"):
+            return get_engine().raw_connection()
+    except Exception as e:
+        pool_stats.increment("errors")
+        print(f"Lỗi khi kết nối tới máy chủ: {e}")
+        return None
+    finally:
+        pool_stats.record_wait(time.perf_counter() - start)
+
+@contextmanager
+def ket_noi_db():
+    """Context manager lấy kết nối từ pool và luôn trả lại pool khi xong."""
+    connection = connect_to_db()
+    try:
+        yield connection
+    finally:
+        if connection is not None:
+            connection.close()
+
+def thong_ke_pool():
+    """Trả về thống kê pool kết nối: số lần lấy, thời gian chờ, số kết nối vượt mức."""
+    return pool_stats.snapshot(get_engine().pool)
@@ -0,0 +1,88 @@
+from functools import partial
+
+from database import ket_noi_db
+from workers import FETCH_BATCH, run_query
+
+# Cột rowversion và bảng ghi cuộn đã xóa (migrations/V003)
+ROW_VERSION = 'ROW_VER'
+DELETED_TABLE = 'DANH_SACH_CUON_VAI_DA_XOA'
+# Mốc an toàn: mọi thay đổi có rowversion <= mốc này đã commit xong, nên lần
+# làm mới sau không bỏ sót giao dịch đang chạy dở ở máy khác
+HIGH_WATER_MARK_SQL = "SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1"
+
+def changes_query(query, since):
+    """Các dòng của bảng có ROW_VER > since, kèm cột cuối cho biết dòng còn khớp bộ lọc của query.
+
+    Chỉ lọc theo ROW_VER (index IX_DSCV_ROW_VER) nên số dòng đọc bằng số dòng
+    đã thay đổi; điều kiện tìm kiếm được tính trong CASE cho từng dòng.
+    """
+    sql = f"""SELECT {query.columns},
+                CASE WHEN {query.where} THEN 1 ELSE 0 END AS KHOP
+            FROM {query.table}
+            WHERE {ROW_VERSION} > CAST(? AS BINARY(8))
+            ORDER BY {query.key}"""
+    return sql, query.params + (since,)
+
+def deleted_query(since):
+    sql = f"SELECT ID FROM {DELETED_TABLE} WHERE {ROW_VERSION} > CAST(? AS BINARY(8))"
+    return sql, (since,)
+
+class ChangeSet():
+    """Các thay đổi kể từ một mốc: dòng đã thay đổi (kết quả shape), cờ khớp bộ lọc, ID đã xóa."""
+    def __init__(self, row_version, result, matches, deleted):
+        self.row_version = row_version  # mốc mới cho lần làm mới sau
+        self.result = result
+        self.matches = matches
+        self.deleted = deleted
+
+    def __len__(self):
+        return len(self.matches) + len(self.deleted)
+
+def _fetch_all(token, cursor, sql, params):
+    cursor.execute(sql, params)
+    rows = []
+    while True:
+        batch = cursor.fetchmany(FETCH_BATCH)
+        token.check()
+        if not batch:
+            return rows
+        rows.extend(batch)
+
+def fetch_changes(token, report_progress, query, since, shape=None):
+    """Lấy các dòng thay đổi và bị xóa kể từ mốc since (chạy trong TaskManager).
+
+    Mốc mới được đọc trước khi lấy thay đổi nên dòng thay đổi trong lúc đọc
+    sẽ được lấy lại ở lần sau (gộp lại cùng một dòng không làm sai bảng).
+    Trả về ChangeSet.
+    """
+    with ket_noi_db() as connection:
+        if connection is None:
+            raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+        cursor = connection.cursor()
+        token.attach(cursor)
+        try:
+            cursor.execute(HIGH_WATER_MARK_SQL)
+            row_version = cursor.fetchone()[0]
+            sql, params = changes_query(query, since)
+            rows = _fetch_all(token, cursor, sql, params)
+            sql, params = deleted_query(since)
+            deleted = [row[0] for row in _fetch_all(token, cursor, sql, params)]
+        finally:
+            token.attach(None)
+            cursor.close()
+    matches = [bool(row[-1]) for row in rows]
+    result = shape(rows) if shape else rows
+    token.check()
+    report_progress(100)
+    return ChangeSet(row_version, result, matches, deleted)
+
+def run_query_with_mark(token, report_progress, sql, params=(), shape=None):
+    """Như workers.run_query nhưng đọc mốc rowversion ngay trước truy vấn.
+
+    shape(rows, row_version=mốc) nhận thêm mốc để lưu cùng kết quả; các lần
+    làm mới sau chỉ cần lấy thay đổi kể từ mốc này.
+    """
+    row_version = run_query(token, lambda value: None, HIGH_WATER_MARK_SQL, shape=lambda rows: rows[0][0])
+    if shape is not None:
+        shape = partial(shape, row_version=row_version)
+    return run_query(token, report_progress, sql, params, shape=shape)
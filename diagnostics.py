@@ -0,0 +1,103 @@
+import json
+
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import (QAbstractItemView, QCheckBox, QComboBox, QHBoxLayout, QHeaderView, QLabel,
+                             QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+
+HEADERS = ['Thao tác', 'Số lần', 'p50 (ms)', 'p95 (ms)', 'Max (ms)', 'Số dòng']
+REFRESH_MS = 1000
+
+class DiagnosticsPanel(QWidget):
+    """Tab chẩn đoán (ẩn, mở bằng phím tắt): p50/p95 của từng thao tác do tracer ghi lại.
+
+    Bật/tắt ghi vết, chạy cProfile cho lần kế tiếp của một thao tác và xem các
+    số liệu khác (pool kết nối, bộ nhớ đệm, độ trễ quét) do extra() trả về.
+    Chỉ làm mới khi tab đang hiển thị.
+    """
+    def __init__(self, tracer, extra=None, parent=None):
+        super().__init__(parent)
+        self.tracer = tracer
+        self.extra = extra
+        self.enabled = QCheckBox("Ghi vết thời gian", self)
+        self.enabled.setChecked(tracer.enabled)
+        self.enabled.toggled.connect(self._toggle)
+        self.names = QComboBox(self)
+        self.names.setMinimumWidth(250)
+        self.profile = QPushButton("cProfile lần kế tiếp", self)
+        self.profile.clicked.connect(self._arm_profile)
+        self.reset = QPushButton("Xóa số liệu", self)
+        self.reset.clicked.connect(self._clear)
+        toolbar = QHBoxLayout()
+        for widget in (self.enabled, self.names, self.profile, self.reset):
+            toolbar.addWidget(widget)
+        toolbar.addStretch(1)
+        self.table = QTableWidget(0, len(HEADERS), self)
+        self.table.setHorizontalHeaderLabels(HEADERS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.status = QLabel(self)
+        self.status.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.details = QLabel(self)
+        self.details.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.details.setWordWrap(True)
+        box = QVBoxLayout(self)
+        box.addLayout(toolbar)
+        box.addWidget(self.table, 1)
+        box.addWidget(self.details)
+        box.addWidget(self.status)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start(REFRESH_MS)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        stats = self.tracer.stats()
+        self.table.setRowCount(len(stats))
+        for row, name in enumerate(sorted(stats)):
+            item = stats[name]
+            values = [name, item['count'], item['p50_ms'], item['p95_ms'], item['max_ms'],
+                      '' if item['rows'] is None else item['rows']]
+            for column, value in enumerate(values):
+                cell = QTableWidgetItem(f"{value:,}" if isinstance(value, int) else str(value))
+                if column:
+                    cell.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, cell)
+        # Giữ lựa chọn hiện tại khi danh sách thao tác thay đổi
+        names = sorted(set(stats) | {self.names.currentText()} - {''})
+        if names != [self.names.itemText(i) for i in range(self.names.count())]:
+            current = self.names.currentText()
+            self.names.blockSignals(True)
+            self.names.clear()
+            self.names.addItems(names)
+            self.names.setCurrentText(current)
+            self.names.blockSignals(False)
+        if self.extra is not None:
+            self.details.setText("\n".join(f"{title}: {json.dumps(values, ensure_ascii=False, default=str)}"
+                                           for title, values in self.extra().items()))
+        status = [f"Log: {self.tracer.path}"]
+        if self.tracer.armed:
+            status.append(f"Đang chờ chạy cProfile cho: {self.tracer.armed}")
+        if self.tracer.last_profile:
+            status.append(f"cProfile gần nhất: {self.tracer.last_profile}")
+        self.status.setText("   |   ".join(status))
+
+    def _toggle(self, checked):
+        self.tracer.enabled = checked
+
+    def _arm_profile(self):
+        name = self.names.currentText()
+        if name:
+            self.tracer.profile_next(name)
+            self.refresh()
+
+    def _clear(self):
+        self.tracer.clear()
+        self.refresh()
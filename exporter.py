@@ -0,0 +1,194 @@
+import csv
+import os
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from database import ket_noi_db
+from tracing import tracer
+from workers import FETCH_BATCH
+
+# Định dạng file xuất và bộ lọc tương ứng trong hộp thoại lưu file
+XLSX = 'xlsx'
+CSV = 'csv'
+PARQUET = 'parquet'
+FILE_FILTERS = {
+    XLSX: "Excel Files (*.xlsx)",
+    CSV: "CSV Files (*.csv)",
+    PARQUET: "Parquet Files (*.parquet)",
+}
+FILE_FILTER = ";;".join(list(FILE_FILTERS.values()) + ["All Files (*)"])
+
+# Tên sheet, dòng tiêu đề (gộp từ cột A tới cột merge) và tên file mặc định của từng tab.
+# red: số cột đầu có tiêu đề màu đỏ (các cột bắt buộc của file mẫu nhập kho).
+EXPORTS = {
+    'nhap_kho': {'sheet': "NHẬP", 'title': "MẪU FILE NHẬP VÀO HỆ THỐNG", 'merge': 9, 'red': 9, 'file': "Nhập kho vải"},
+    'xa_vai': {'sheet': "XẢ VẢI", 'title': "DỮ LIỆU XẢ VẢI", 'merge': 13, 'red': 0, 'file': "Xả vải"},
+    'xuat_kho': {'sheet': "XUẤT KHO", 'title': "DỮ LIỆU XUẤT KHO", 'merge': 13, 'red': 0, 'file': "Xuất kho"},
+    'ton_kho': {'sheet': "TỒN KHO", 'title': "DỮ LIỆU TỒN KHO", 'merge': 11, 'red': 0, 'file': "Tồn kho"},
+}
+
+TITLE_FONT = Font(color="FFFFFF", bold=True, size=14)
+TITLE_FILL = PatternFill(start_color="349eeb", end_color="349eeb", fill_type="solid")
+TITLE_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+HEADER_FONT = Font(bold=True)
+REQUIRED_HEADER_FONT = Font(color="FF0000", bold=True)
+
+def _text(value):
+    return "" if value is None else str(value)
+
+def resolve_path(path, selected_filter=""):
+    """Trả về (đường dẫn, định dạng) theo đuôi file; thêm đuôi theo bộ lọc đã chọn nếu thiếu."""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in FILE_FILTERS:
+        return path, extension
+    for file_format, file_filter in FILE_FILTERS.items():
+        if selected_filter == file_filter:
+            return f"{path}.{file_format}", file_format
+    return f"{path}.{XLSX}", XLSX
+
+class ModelSource():
+    """Dữ liệu đã nằm đủ trong model của bảng (mảng theo cột)."""
+    def __init__(self, columns):
+        self.columns = columns
+        self.total = len(columns[0]) if columns else 0
+
+    def chunks(self, token):
+        for start in range(0, self.total, FETCH_BATCH):
+            token.check()
+            yield list(zip(*(column[start:start + FETCH_BATCH] for column in self.columns)))
+
+class QuerySource():
+    """Toàn bộ kết quả của câu truy vấn, lấy từ máy chủ theo lô bằng fetchmany."""
+    def __init__(self, sql, params, width, total=None):
+        self.sql = sql
+        self.params = params
+        self.width = width
+        self.total = total
+
+    def chunks(self, token):
+        with ket_noi_db() as connection:
+            if connection is None:
+                raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+            cursor = connection.cursor()
+            token.attach(cursor)
+            try:
+                cursor.execute(self.sql, self.params)
+                while True:
+                    batch = cursor.fetchmany(FETCH_BATCH)
+                    token.check()
+                    if not batch:
+                        break
+                    yield [tuple(row)[:self.width] for row in batch]
+            finally:
+                token.attach(None)
+                cursor.close()
+
+def model_source(model):
+    """Chọn nguồn dữ liệu cho model (gọi ở luồng giao diện).
+
+    Bảng đã tải đủ thì xuất thẳng từ model; bảng mới tải một phần (phân trang)
+    thì chạy lại câu truy vấn đầy đủ và đọc dần từ cursor.
+    """
+    if not model.has_more() or model.query is None:
+        return ModelSource([model.column_values(i) for i in range(len(model.headers))])
+    sql, params = model.query.all()
+    return QuerySource(sql, params, len(model.headers), total=model.total)
+
+class ExcelWriter():
+    """Workbook write_only: các dòng được ghi thẳng ra file tạm, không giữ trong bộ nhớ."""
+    def __init__(self, path, spec, headers):
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(spec['sheet'])
+        title = WriteOnlyCell(self.sheet, spec['title'])
+        title.font = TITLE_FONT
+        title.fill = TITLE_FILL
+        title.alignment = TITLE_ALIGNMENT
+        self.sheet.append([title])
+        self.sheet.merged_cells.add(f"A1:{get_column_letter(spec['merge'])}1")
+        row = []
+        for column, header in enumerate(headers, start=1):
+            cell = WriteOnlyCell(self.sheet, header)
+            cell.font = REQUIRED_HEADER_FONT if column <= spec['red'] else HEADER_FONT
+            row.append(cell)
+        self.sheet.append(row)
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append([_text(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+class CsvWriter():
+    """CSV UTF-8 có BOM để Excel đọc đúng tiếng Việt."""
+    def __init__(self, path, spec, headers):
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(headers)
+
+    def write(self, rows):
+        self.writer.writerows([_text(value) for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter():
+    """Parquet (cần pyarrow), mỗi lô dữ liệu là một row group, mọi cột kiểu chuỗi."""
+    def __init__(self, path, spec, headers):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Cần cài đặt thư viện pyarrow để xuất file Parquet!")
+        self.pa = pa
+        self.headers = list(headers)
+        self.schema = pa.schema([(header, pa.string()) for header in self.headers])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = [self.pa.array([None if value is None else str(value) for value in column], self.pa.string())
+                   for column in zip(*rows)]
+        if columns:
+            self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+WRITERS = {XLSX: ExcelWriter, CSV: CsvWriter, PARQUET: ParquetWriter}
+
+def export_rows(token, report_progress, path, file_format, kind, headers, source):
+    """Ghi dữ liệu từ source ra file theo từng lô (chạy trong TaskManager).
+
+    File được ghi ra đường dẫn tạm rồi mới đổi tên, nên khi hủy hoặc lỗi giữa
+    chừng file cũ (nếu có) vẫn còn nguyên. Trả về (đường dẫn, số dòng đã ghi).
+    """
+    temp_path = f"{path}.tmp"
+    writer = WRITERS[file_format](temp_path, EXPORTS[kind], headers)
+    written = chunks = 0
+    try:
+        with tracer.span("export.write", format=file_format, kind=kind) as span:
+            try:
+                for rows in source.chunks(token):
+                    writer.write(rows)
+                    written += len(rows)
+                    chunks += 1
+                    if source.total:
+                        report_progress(min(95, 95 * written / source.total))
+                    else:
+                        # Chưa biết tổng số dòng, tiến độ tiệm cận 90% theo số lô đã ghi
+                        report_progress(90 * chunks / (chunks + 1))
+            finally:
+                writer.close()
+                span.set(rows=written)
+        token.check()
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    report_progress(100)
+    return path, written
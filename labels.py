@@ -0,0 +1,218 @@
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import qrcode
+from qrcode.constants import ERROR_CORRECT_M
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from config import settings
+from tracing import tracer
+
+# Khổ tem 3.1 x 2 inch, mỗi tem một trang
+PAGE_WIDTH = 3.1 * inch
+PAGE_HEIGHT = 2 * inch
+QR_SIZE = 0.8 * inch
+QR_MARGIN = 5
+TEXT_X = 15
+GAP = 10
+CANH_BAO_RESOURCE = ":/pictures/pics/canh_bao.png"
+# Thư mục chứa các file PDF gửi máy in (xóa ở lượt in sau)
+LABEL_DIR = os.path.join(tempfile.gettempdir(), "Fb_Whs_labels")
+
+# Bố cục chữ trên tem: (font, cỡ chữ, dòng, nhãn, khóa dữ liệu)
+LABEL_TEMPLATE = [
+    ("Arial-Bold", 20, 3, "ID", "ID"),
+    ("Arial", 9, 5, "Ngày nhập", "NgayNhap"),
+    ("Arial", 9, 6, "Style", "Style"),
+    ("Arial", 9, 7, "MO", "MO"),
+    ("Arial", 9, 8, "Loại vải", "LoaiVai"),
+    ("Arial", 9, 9, "ĐVT", "Dvt"),
+    ("Arial", 9, 10, "Lot", "Lot"),
+    ("Arial", 9, 11, "Màu", "Mau"),
+    ("Arial", 9, 12, "Cuộn số", "CuonSo"),
+    ("Arial", 9, 13, "Số yard", "SoYard"),
+]
+
+_resources = {}
+
+def register_fonts():
+    """Đăng ký font Unicode cho ReportLab (một lần cho cả tiến trình)."""
+    registered = pdfmetrics.getRegisteredFontNames()
+    if 'Arial' not in registered:
+        pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
+    if 'Arial-Bold' not in registered:
+        pdfmetrics.registerFont(TTFont('Arial-Bold', 'arialbd.ttf'))
+
+def load_resource(path):
+    """Đọc ảnh trong file .qrc một lần, giữ trong bộ nhớ dưới dạng bytes."""
+    if path not in _resources:
+        from PyQt5.QtCore import QFile, QIODevice
+        resource = QFile(path)
+        if not resource.open(QIODevice.ReadOnly):
+            raise FileNotFoundError(f"Không thể tìm thấy resource: {path}")
+        try:
+            _resources[path] = bytes(resource.readAll())
+        finally:
+            resource.close()
+    return _resources[path]
+
+def qr_matrix(value):
+    """Ma trận module của mã QR (đã gồm viền), cùng thông số với qrcode.make()."""
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECT_M, border=4)
+    qr.add_data(value)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+class LabelRenderer():
+    """Vẽ tem cuộn vải ra PDF, mã QR vẽ dạng vector nên không cần file ảnh tạm.
+
+    Font, bố cục và ảnh tĩnh được chuẩn bị một lần cho mỗi lượt in; mỗi mã QR
+    được vẽ một lần thành form XObject rồi đặt lại ở cả hai góc tem.
+    """
+    def __init__(self, output, canh_bao=None):
+        register_fonts()
+        self.output = output
+        self.canh_bao = ImageReader(io.BytesIO(canh_bao)) if canh_bao else None
+        self.canvas = canvas.Canvas(output, pagesize=(PAGE_WIDTH, PAGE_HEIGHT))
+        self.lines = [(font, size, PAGE_HEIGHT - GAP * line, f"{label}: ", key)
+                      for font, size, line, label, key in LABEL_TEMPLATE]
+        self.count = 0
+        self.seconds = 0.0
+
+    def draw_qr(self, value, name):
+        """Vẽ mã QR thành form name, mỗi dãy module đen liền nhau là một hình chữ nhật.
+
+        Toạ độ tính theo đơn vị module (số nguyên) rồi co về QR_SIZE bằng phép
+        biến đổi, nên lệnh vẽ được ghép thẳng thành chuỗi PDF ngắn gọn.
+        """
+        c = self.canvas
+        matrix = qr_matrix(value)
+        size = len(matrix)
+        rects = []
+        for r, row in enumerate(matrix):
+            y = size - r - 1
+            start = None
+            for col, dark in enumerate(row + [False]):
+                if dark and start is None:
+                    start = col
+                elif not dark and start is not None:
+                    rects.append(f"{start} {y} {col - start} 1 re")
+                    start = None
+        c.beginForm(name)
+        c.scale(QR_SIZE / size, QR_SIZE / size)
+        c.addLiteral(" ".join(rects) + " f")
+        c.endForm()
+
+    def draw(self, data):
+        """Vẽ một tem trên một trang mới."""
+        started = time.perf_counter()
+        c = self.canvas
+        for font, size, y, prefix, key in self.lines:
+            c.setFont(font, size)
+            c.drawString(TEXT_X, y, prefix + data[key])
+        name = f"qr{self.count}"
+        self.draw_qr(data['ID'], name)
+        for y in (PAGE_HEIGHT - QR_SIZE - QR_MARGIN, QR_MARGIN):
+            c.saveState()
+            c.translate(PAGE_WIDTH - QR_SIZE - QR_MARGIN, y)
+            c.doForm(name)
+            c.restoreState()
+        # Vẽ tem cảnh báo lên tem
+        # if self.canh_bao is not None:
+        #     c.drawImage(self.canh_bao, 10, 10, width=1.5 * inch, height=1.5 * inch)
+        c.showPage()
+        self.count += 1
+        self.seconds += time.perf_counter() - started
+
+    def save(self):
+        started = time.perf_counter()
+        self.canvas.save()
+        self.seconds += time.perf_counter() - started
+
+    @property
+    def labels_per_second(self):
+        return self.count / self.seconds if self.seconds else 0.0
+
+def render_labels(output, data_list, canh_bao=None):
+    """Vẽ toàn bộ tem ra output (đường dẫn hoặc file-like), trả về LabelRenderer để xem tốc độ."""
+    renderer = LabelRenderer(output, canh_bao)
+    for data in data_list:
+        renderer.draw(data)
+    renderer.save()
+    return renderer
+
+class LabelJob():
+    """Kết quả một lượt in tem: số tem, số lô đã gửi máy in và thời gian chạy."""
+    def __init__(self, total, chunks):
+        self.total = total
+        self.chunks = chunks
+        self.count = 0
+        self.printed = 0
+        self.seconds = 0.0
+
+    @property
+    def labels_per_second(self):
+        return self.count / self.seconds if self.seconds else 0.0
+
+def _render_chunk(path, data_list, canh_bao):
+    """Vẽ một lô tem ra file PDF (chạy trong tiến trình con)."""
+    return render_labels(path, data_list, canh_bao).count
+
+def _clear_output_dir(output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        try:
+            os.remove(os.path.join(output_dir, name))
+        except OSError:
+            pass  # file còn đang mở trong hàng đợi máy in
+
+def print_labels(token, report_progress, data_list, print_file, canh_bao=None,
+                 chunk_size=settings.LABEL_CHUNK_SIZE, workers=settings.LABEL_WORKERS, output_dir=LABEL_DIR):
+    """Chia tem thành từng lô, vẽ song song bằng nhiều tiến trình và gửi máy in từng lô (chạy trong TaskManager).
+
+    Các lô được gửi máy in theo đúng thứ tự ngay khi vẽ xong nên máy in bắt
+    đầu in sau lô đầu tiên, không phải chờ cả lượt. print_file(path) gửi một
+    file PDF tới máy in. Trả về LabelJob.
+    """
+    started = time.perf_counter()
+    _clear_output_dir(output_dir)
+    chunks = [data_list[i:i + chunk_size] for i in range(0, len(data_list), chunk_size)]
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    paths = [os.path.join(output_dir, f"labels_3x2_{stamp}_{number:03d}.pdf") for number in range(1, len(chunks) + 1)]
+    job = LabelJob(len(data_list), len(chunks))
+    report_progress(0)
+
+    def send(path, count):
+        token.check()
+        with tracer.span("print.send", rows=count):
+            print_file(path)
+        job.count += count
+        job.printed += 1
+        report_progress(100 * job.printed / job.chunks)
+
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    if workers <= 1:
+        for path, chunk in zip(paths, chunks):
+            token.check()
+            send(path, _render_chunk(path, chunk, canh_bao))
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(_render_chunk, path, chunk, canh_bao) for path, chunk in zip(paths, chunks)]
+            for path, future in zip(paths, futures):
+                while not future.done():
+                    token.check()
+                    wait([future], timeout=0.2)
+                send(path, future.result())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    job.seconds = time.perf_counter() - started
+    tracer.annotate(rows=job.count)
+    return job
@@ -0,0 +1,87 @@
+from pagination import KeysetQuery
+
+# Các cuộn đang nằm trên kệ của một nhà máy (xả vải / xuất kho xóa VI_TRI về rỗng)
+LOCATED_WHERE = "NHA_MAY = ? AND VI_TRI <> ''"
+
+def located_query(nha_may):
+    """KeysetQuery (ID, VI_TRI) của các cuộn đang có vị trí; dùng chung cho lần tải đầu và lấy thay đổi."""
+    return KeysetQuery("ID, VI_TRI", LOCATED_WHERE, (nha_may,))
+
+def index_rows(rows, row_version=None):
+    """Chuyển kết quả truy vấn thành [(ID, VI_TRI)] (chạy ở luồng nền), kèm mốc rowversion nếu có."""
+    return [(int(row[0]), (row[1] or '').strip()) for row in rows], row_version
+
+class LocationIndex():
+    """Chỉ mục vị trí trong bộ nhớ: ID -> VI_TRI và VI_TRI -> tập ID của nhà máy đang đăng nhập.
+
+    Tải một lần khi đăng nhập, sau đó cập nhật theo từng lần quét của máy này
+    và theo thay đổi định kỳ (delta_refresh) của các máy khác. Tra cứu theo ID
+    hoặc theo vị trí đều là O(1). Chỉ dùng từ luồng giao diện.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.nha_may = None
+        self.row_version = None  # mốc rowversion cho lần lấy thay đổi sau (None: chưa tải)
+        self.by_id = {}
+        self.by_location = {}
+
+    @property
+    def loaded(self):
+        return self.nha_may is not None
+
+    def load(self, nha_may, rows, row_version=None):
+        """Nạp toàn bộ [(ID, VI_TRI)] của nhà máy nha_may."""
+        self.clear()
+        self.nha_may = nha_may
+        self.row_version = row_version
+        for roll_id, vi_tri in rows:
+            self.move(roll_id, vi_tri)
+
+    def move(self, roll_id, vi_tri):
+        """Ghi nhận cuộn roll_id đang ở vị trí vi_tri (rỗng là không còn trên kệ)."""
+        roll_id = int(roll_id)
+        vi_tri = (vi_tri or '').strip()
+        old = self.by_id.pop(roll_id, None)
+        if old is not None:
+            rolls = self.by_location[old]
+            rolls.discard(roll_id)
+            if not rolls:
+                del self.by_location[old]
+        if vi_tri:
+            self.by_id[roll_id] = vi_tri
+            self.by_location.setdefault(vi_tri, set()).add(roll_id)
+
+    def remove(self, roll_id):
+        self.move(roll_id, None)
+
+    def apply(self, changes):
+        """Gộp ChangeSet của delta_refresh.fetch_changes(located_query(...)), trả về số cuộn thay đổi."""
+        rows, _ = changes.result
+        for (roll_id, vi_tri), located in zip(rows, changes.matches):
+            self.move(roll_id, vi_tri if located else None)
+        for roll_id in changes.deleted:
+            self.remove(roll_id)
+        self.row_version = changes.row_version
+        return len(changes)
+
+    def locate(self, roll_id):
+        """Vị trí của cuộn roll_id, None nếu cuộn không nằm trên kệ (hoặc không có)."""
+        try:
+            return self.by_id.get(int(roll_id))
+        except (TypeError, ValueError):
+            return None
+
+    def rolls_at(self, vi_tri):
+        """Tập ID các cuộn đang ở vị trí vi_tri."""
+        return frozenset(self.by_location.get((vi_tri or '').strip(), ()))
+
+    def is_known_location(self, vi_tri):
+        return (vi_tri or '').strip() in self.by_location
+
+    def locations(self):
+        return sorted(self.by_location)
+
+    def snapshot(self):
+        return {'rolls': len(self.by_id), 'locations': len(self.by_location), 'row_version': self.row_version}
@@ -0,0 +1,77 @@
+"""Áp dụng các migration DDL trong thư mục migrations/ theo thứ tự phiên bản.
+
+Mỗi file có dạng V<số phiên bản>__<mô tả>.sql, các lô lệnh ngăn cách bởi dòng GO.
+Phiên bản đã chạy được ghi vào bảng SCHEMA_MIGRATIONS nên chạy lại nhiều lần
+vẫn an toàn.
+
+    python migrate.py
+"""
+import os
+import re
+import sys
+
+from config import get_resource_path
+from database import ket_noi_db
+
+MIGRATIONS_DIR = get_resource_path('migrations')
+FILE_PATTERN = re.compile(r'^V(\d+)__(.+)\.sql$')
+GO_PATTERN = re.compile(r'^\s*GO\s*$', re.IGNORECASE | re.MULTILINE)
+
+CREATE_VERSION_TABLE = """
+    IF OBJECT_ID('dbo.SCHEMA_MIGRATIONS') IS NULL
+    CREATE TABLE dbo.SCHEMA_MIGRATIONS (
+        VERSION INT NOT NULL PRIMARY KEY,
+        NAME NVARCHAR(200) NOT NULL,
+        APPLIED_AT DATETIME NOT NULL DEFAULT GETDATE()
+    )
+"""
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """Danh sách (phiên bản, tên, đường dẫn) của các file migration, đã sắp xếp."""
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = FILE_PATTERN.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    return sorted(migrations)
+
+def split_batches(sql):
+    """Tách script thành các lô lệnh theo dòng GO."""
+    return [batch.strip() for batch in GO_PATTERN.split(sql) if batch.strip()]
+
+def migrate(connection, directory=MIGRATIONS_DIR, log=print):
+    """Chạy các migration chưa áp dụng, mỗi phiên bản commit riêng. Trả về số phiên bản đã chạy."""
+    cursor = connection.cursor()
+    cursor.execute(CREATE_VERSION_TABLE)
+    connection.commit()
+    cursor.execute("SELECT VERSION FROM dbo.SCHEMA_MIGRATIONS")
+    applied = {row[0] for row in cursor.fetchall()}
+    count = 0
+    for version, name, path in list_migrations(directory):
+        if version in applied:
+            continue
+        log(f"Đang áp dụng migration V{version:03d} {name}...")
+        with open(path, encoding='utf-8') as f:
+            batches = split_batches(f.read())
+        try:
+            for batch in batches:
+                cursor.execute(batch)
+            cursor.execute("INSERT INTO dbo.SCHEMA_MIGRATIONS (VERSION, NAME) VALUES (?, ?)", (version, name))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        count += 1
+    return count
+
+def main():
+    with ket_noi_db() as connection:
+        if connection is None:
+            print("Không thể kết nối tới cơ sở dữ liệu!")
+            return 1
+        count = migrate(connection)
+    print(f"Đã áp dụng {count} migration.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
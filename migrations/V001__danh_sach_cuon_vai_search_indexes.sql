@@ -0,0 +1,43 @@
+-- V001: Index phục vụ các tab tìm kiếm trên DANH_SACH_CUON_VAI.
+-- Câu tìm kiếm (query_builder.py) luôn lọc NHA_MAY = ?, TRANG_THAI = N'...' (hằng số)
+-- và khoảng ngày nửa mở, nên mỗi tab dùng một index seek thay cho quét toàn bảng.
+-- Các cột hiển thị được INCLUDE để không phải tra lại bảng gốc (key lookup).
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+-- Tab Nhập kho: NHA_MAY = ? AND NGAY_NHAN >= ? AND NGAY_NHAN < ?
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DSCV_NHA_MAY_NGAY_NHAN'
+               AND object_id = OBJECT_ID('dbo.DANH_SACH_CUON_VAI'))
+CREATE NONCLUSTERED INDEX IX_DSCV_NHA_MAY_NGAY_NHAN
+    ON dbo.DANH_SACH_CUON_VAI (NHA_MAY, NGAY_NHAN)
+    INCLUDE (STYLE, MO, LOAI_VAI, DVT, LOT, MAU, CUON_SO, SO_YARD, VI_TRI,
+             THOI_GIAN_XA, THOI_GIAN_XUAT_KHO, TRANG_THAI);
+GO
+
+-- Tab Xả vải: NHA_MAY = ? AND TRANG_THAI = N'Xả vải' AND THOI_GIAN_XA >= ? AND THOI_GIAN_XA < ?
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DSCV_XA_VAI'
+               AND object_id = OBJECT_ID('dbo.DANH_SACH_CUON_VAI'))
+CREATE NONCLUSTERED INDEX IX_DSCV_XA_VAI
+    ON dbo.DANH_SACH_CUON_VAI (NHA_MAY, THOI_GIAN_XA)
+    INCLUDE (NGAY_NHAN, STYLE, MO, LOAI_VAI, DVT, LOT, MAU, CUON_SO, SO_YARD, VI_TRI)
+    WHERE TRANG_THAI = N'Xả vải';
+GO
+
+-- Tab Xuất kho: NHA_MAY = ? AND TRANG_THAI = N'Xuất kho' AND THOI_GIAN_XUAT_KHO >= ? AND THOI_GIAN_XUAT_KHO < ?
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DSCV_XUAT_KHO'
+               AND object_id = OBJECT_ID('dbo.DANH_SACH_CUON_VAI'))
+CREATE NONCLUSTERED INDEX IX_DSCV_XUAT_KHO
+    ON dbo.DANH_SACH_CUON_VAI (NHA_MAY, THOI_GIAN_XUAT_KHO)
+    INCLUDE (NGAY_NHAN, STYLE, MO, LOAI_VAI, DVT, LOT, MAU, CUON_SO, SO_YARD, VI_TRI, THOI_GIAN_XA)
+    WHERE TRANG_THAI = N'Xuất kho';
+GO
+
+-- Tab Tồn kho: NHA_MAY = ? AND TRANG_THAI = N'Nhập kho', phân trang theo ID
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DSCV_TON_KHO'
+               AND object_id = OBJECT_ID('dbo.DANH_SACH_CUON_VAI'))
+CREATE NONCLUSTERED INDEX IX_DSCV_TON_KHO
+    ON dbo.DANH_SACH_CUON_VAI (NHA_MAY, ID)
+    INCLUDE (NGAY_NHAN, STYLE, MO, LOAI_VAI, DVT, LOT, MAU, CUON_SO, SO_YARD, VI_TRI)
+    WHERE TRANG_THAI = N'Nhập kho';
+GO
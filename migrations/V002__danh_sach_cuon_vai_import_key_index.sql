@@ -0,0 +1,12 @@
+-- V002: Index cho khóa chống trùng khi nhập file Excel (bulk_import.py).
+-- Câu MERGE so khớp từng lô nhập với DANH_SACH_CUON_VAI trên
+-- (STYLE, MO, LOAI_VAI, LOT, MAU, CUON_SO, NHA_MAY) nên cần index seek theo khóa này.
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DSCV_KHOA_NHAP'
+               AND object_id = OBJECT_ID('dbo.DANH_SACH_CUON_VAI'))
+CREATE NONCLUSTERED INDEX IX_DSCV_KHOA_NHAP
+    ON dbo.DANH_SACH_CUON_VAI (NHA_MAY, STYLE, MO, LOT, CUON_SO, MAU, LOAI_VAI);
+GO
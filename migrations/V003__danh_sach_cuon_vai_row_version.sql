@@ -0,0 +1,46 @@
+-- V003: Cột rowversion và bảng ghi cuộn đã xóa cho việc làm mới bảng theo thay đổi (delta_refresh.py).
+-- Mỗi lần INSERT/UPDATE, SQL Server tự tăng ROW_VER; các tab tìm kiếm nhớ mốc ROW_VER
+-- lúc tải và định kỳ chỉ lấy các dòng có ROW_VER lớn hơn mốc, nên chi phí làm mới theo
+-- số dòng thay đổi chứ không theo kích thước kho.
+-- Lưu ý: thêm cột rowversion ghi lại mọi dòng của bảng, nên chạy ngoài giờ làm việc.
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+
+IF COL_LENGTH('dbo.DANH_SACH_CUON_VAI', 'ROW_VER') IS NULL
+ALTER TABLE dbo.DANH_SACH_CUON_VAI ADD ROW_VER ROWVERSION;
+GO
+
+-- Câu lấy thay đổi: ROW_VER > ? (index seek, số dòng đọc bằng số dòng đã thay đổi)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DSCV_ROW_VER'
+               AND object_id = OBJECT_ID('dbo.DANH_SACH_CUON_VAI'))
+CREATE UNIQUE NONCLUSTERED INDEX IX_DSCV_ROW_VER
+    ON dbo.DANH_SACH_CUON_VAI (ROW_VER);
+GO
+
+-- Dòng bị xóa không còn ROW_VER, trigger ghi lại ID kèm một rowversion mới
+-- (rowversion tăng chung cho cả database nên dùng chung mốc với bảng chính)
+IF OBJECT_ID('dbo.DANH_SACH_CUON_VAI_DA_XOA') IS NULL
+CREATE TABLE dbo.DANH_SACH_CUON_VAI_DA_XOA (
+    ID INT NOT NULL,
+    NHA_MAY VARCHAR(5) NULL,
+    THOI_GIAN_XOA DATETIME NOT NULL DEFAULT GETDATE(),
+    ROW_VER ROWVERSION
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DSCV_DA_XOA_ROW_VER'
+               AND object_id = OBJECT_ID('dbo.DANH_SACH_CUON_VAI_DA_XOA'))
+CREATE UNIQUE CLUSTERED INDEX IX_DSCV_DA_XOA_ROW_VER
+    ON dbo.DANH_SACH_CUON_VAI_DA_XOA (ROW_VER);
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_DSCV_GHI_XOA ON dbo.DANH_SACH_CUON_VAI
+AFTER DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.DANH_SACH_CUON_VAI_DA_XOA (ID, NHA_MAY)
+    SELECT ID, NHA_MAY FROM deleted;
+END;
+GO
@@ -0,0 +1,50 @@
+from config import settings
+
+PAGE_SIZE = settings.SEARCH_PAGE_SIZE
+
+# Hệ quản trị CSDL: cú pháp khác nhau ở phân trang, định dạng ngày giờ và LIKE
+MSSQL = 'mssql'
+SQLITE = 'sqlite'
+
+class KeysetQuery():
+    """Truy vấn tìm kiếm phân trang theo khóa (keyset) trên cột ID.
+
+    Mỗi trang là một câu SELECT TOP (n) ... WHERE ID > <ID cuối trang trước>
+    ORDER BY ID nên thời gian trả về trang đầu không phụ thuộc kích thước kho.
+    Tổng số dòng (và tổng số yard nếu cần) lấy bằng một câu COUNT riêng.
+    Trên SQLite (dialect=SQLITE) trang được giới hạn bằng LIMIT thay cho TOP.
+    """
+    def __init__(self, columns, where, params=(), table='DANH_SACH_CUON_VAI', key='ID',
+                 page_size=PAGE_SIZE, sum_column=None, dialect=MSSQL):
+        self.columns = columns
+        self.where = where
+        self.params = tuple(params)
+        self.table = table
+        self.key = key
+        self.page_size = int(page_size)
+        self.sum_column = sum_column
+        self.dialect = dialect
+
+    def page(self, after=None):
+        """Câu truy vấn cho trang tiếp theo sau khóa after (None là trang đầu)."""
+        where = self.where
+        params = list(self.params)
+        if after is not None:
+            where = f"({where}) AND {self.key} > ?"
+            params.append(after)
+        if self.dialect == SQLITE:
+            sql = f"SELECT {self.columns} FROM {self.table} WHERE {where} ORDER BY {self.key} LIMIT {self.page_size}"
+        else:
+            sql = f"SELECT TOP ({self.page_size}) {self.columns} FROM {self.table} WHERE {where} ORDER BY {self.key}"
+        return sql, tuple(params)
+
+    def count(self):
+        """Câu truy vấn đếm số dòng (kèm tổng sum_column nếu có)."""
+        sums = f", SUM({self.sum_column})" if self.sum_column else ""
+        sql = f"SELECT COUNT(*){sums} FROM {self.table} WHERE {self.where}"
+        return sql, self.params
+
+    def all(self):
+        """Câu truy vấn lấy toàn bộ kết quả (dùng khi xuất file)."""
+        sql = f"SELECT {self.columns} FROM {self.table} WHERE {self.where} ORDER BY {self.key}"
+        return sql, self.params
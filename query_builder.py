@@ -0,0 +1,169 @@
+from datetime import date, datetime, time, timedelta
+
+from pagination import KeysetQuery, MSSQL, SQLITE
+
+# Cột trả về cho từng loại tìm kiếm (thứ tự khớp với tiêu đề bảng trong table_models)
+COLUMNS_NHAP_KHO = """NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
+                CONVERT(VARCHAR, THOI_GIAN_XA, 120) AS THOI_GIAN_XA,
+                CONVERT(VARCHAR, THOI_GIAN_XUAT_KHO, 120) AS THOI_GIAN_XUAT_KHO,
+                TRANG_THAI"""
+COLUMNS_XA_VAI = """NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
+                CONVERT(VARCHAR, THOI_GIAN_XA, 120) AS THOI_GIAN_XA,
+                CAST(DATEDIFF(MINUTE,THOI_GIAN_XA,GETDATE())/60.0 AS DEC(10,2)) AS SO_GIO"""
+COLUMNS_XUAT_KHO = """NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
+                CONVERT(VARCHAR, THOI_GIAN_XA, 120) AS THOI_GIAN_XA,
+                CONVERT(VARCHAR, THOI_GIAN_XUAT_KHO, 120) AS THOI_GIAN_XUAT_KHO"""
+COLUMNS_TON_KHO = """NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID"""
+
+# Các cột tương ứng trên SQLite (ngày giờ lưu sẵn dạng chuỗi 'YYYY-MM-DD HH:MM:SS')
+SQLITE_COLUMNS = {
+    'nhap_kho': """NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
+                THOI_GIAN_XA,THOI_GIAN_XUAT_KHO,TRANG_THAI""",
+    'xa_vai': """NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,THOI_GIAN_XA,
+                ROUND((julianday('now', 'localtime') - julianday(THOI_GIAN_XA)) * 24, 2) AS SO_GIO""",
+    'xuat_kho': """NGAY_NHAN,STYLE,MO,LOAI_VAI,DVT,LOT,MAU,CUON_SO,SO_YARD,VI_TRI,ID,
+                THOI_GIAN_XA,THOI_GIAN_XUAT_KHO""",
+    'ton_kho': COLUMNS_TON_KHO,
+}
+
+# Trạng thái cuộn vải
+TRANG_THAI_NHAP_KHO = 'Nhập kho'
+TRANG_THAI_XA_VAI = 'Xả vải'
+TRANG_THAI_XUAT_KHO = 'Xuất kho'
+
+# Cấu hình từng loại tìm kiếm: cột trả về, cột ngày lọc (và có phải DATETIME không),
+# trạng thái, cột cộng tổng
+SEARCH_KINDS = {
+    'nhap_kho': {'columns': COLUMNS_NHAP_KHO, 'date_column': 'NGAY_NHAN', 'datetime': False,
+                 'trang_thai': None, 'sum_column': None},
+    'xa_vai': {'columns': COLUMNS_XA_VAI, 'date_column': 'THOI_GIAN_XA', 'datetime': True,
+               'trang_thai': TRANG_THAI_XA_VAI, 'sum_column': None},
+    'xuat_kho': {'columns': COLUMNS_XUAT_KHO, 'date_column': 'THOI_GIAN_XUAT_KHO', 'datetime': True,
+                 'trang_thai': TRANG_THAI_XUAT_KHO, 'sum_column': None},
+    'ton_kho': {'columns': COLUMNS_TON_KHO, 'date_column': None, 'datetime': False,
+                'trang_thai': TRANG_THAI_NHAP_KHO, 'sum_column': 'SO_YARD'},
+}
+
+# Các ô lọc chữ, theo thứ tự cột trong bảng
+TEXT_FILTERS = ('STYLE', 'MO', 'LOT', 'MAU', 'VI_TRI')
+
+def escape_like(value, dialect=MSSQL):
+    """Thoát các ký tự đại diện của LIKE: SQL Server dùng [%], SQLite dùng ký tự thoát \\."""
+    if dialect == SQLITE:
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return value.replace('[', '[[]').replace('%', '[%]').replace('_', '[_]')
+
+def search_columns(kind, dialect=MSSQL):
+    return SQLITE_COLUMNS[kind] if dialect == SQLITE else SEARCH_KINDS[kind]['columns']
+
+def parse_text_filter(value):
+    """Phân tích nội dung ô lọc thành (kiểu so khớp, giá trị).
+
+    - "=ABC"  : so khớp chính xác (dùng được index)
+    - "ABC*"  : bắt đầu bằng ABC (LIKE 'ABC%', dùng được index)
+    - "ABC"   : chứa ABC (như trước đây)
+    - rỗng    : bỏ qua điều kiện
+    """
+    value = (value or '').strip()
+    if not value:
+        return None, ''
+    if value.startswith('=') and len(value) > 1:
+        return 'exact', value[1:].strip()
+    if value.endswith('*') and len(value) > 1:
+        return 'prefix', value[:-1].strip()
+    return 'contains', value
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), "%Y-%m-%d").date()
+
+class WhereBuilder():
+    """Ghép mệnh đề WHERE có tham số, mỗi điều kiện đều có thể dùng index.
+
+    Điều kiện rỗng được bỏ hẳn để câu lệnh gọn và kế hoạch thực thi được dùng lại.
+    """
+    def __init__(self, dialect=MSSQL):
+        self.dialect = dialect
+        self.clauses = []
+        self.params = []
+        self.like = "LIKE ? ESCAPE '\\'" if dialect == SQLITE else "LIKE ?"
+
+    def equals(self, column, value):
+        if value not in (None, ''):
+            self.clauses.append(f"{column} = ?")
+            self.params.append(value)
+        return self
+
+    def constant(self, column, value):
+        # Giá trị cố định do chương trình đặt (không phải người dùng nhập) được
+        # ghi thẳng vào câu lệnh để SQL Server dùng được filtered index.
+        if value is not None:
+            literal = str(value).replace("'", "''")
+            prefix = "" if self.dialect == SQLITE else "N"
+            self.clauses.append(f"{column} = {prefix}'{literal}'")
+        return self
+
+    def date_range(self, column, tu_ngay, den_ngay, as_datetime=False):
+        # Khoảng nửa mở [tu_ngay, den_ngay + 1 ngày) thay cho CAST(... AS DATE) BETWEEN.
+        # Tham số cùng kiểu với cột (DATE/DATETIME) để không phải chuyển kiểu trên cột.
+        convert = (lambda d: datetime.combine(d, time.min)) if as_datetime else (lambda d: d)
+        if tu_ngay:
+            self.clauses.append(f"{column} >= ?")
+            self.params.append(convert(to_date(tu_ngay)))
+        if den_ngay:
+            self.clauses.append(f"{column} < ?")
+            self.params.append(convert(to_date(den_ngay) + timedelta(days=1)))
+        return self
+
+    def text(self, column, value):
+        mode, text = parse_text_filter(value)
+        if mode == 'exact':
+            self.clauses.append(f"{column} = ?")
+            self.params.append(text)
+        elif mode == 'prefix':
+            self.clauses.append(f"{column} {self.like}")
+            self.params.append(escape_like(text, self.dialect) + '%')
+        elif mode == 'contains':
+            self.clauses.append(f"{column} {self.like}")
+            self.params.append('%' + escape_like(text, self.dialect) + '%')
+        return self
+
+    def build(self):
+        where = "\n                AND ".join(self.clauses) if self.clauses else "1 = 1"
+        return where, tuple(self.params)
+
+def normalize_filters(filters):
+    """Chuẩn hóa bộ lọc (bỏ khoảng trắng, ngày dạng date) để so sánh/làm khóa."""
+    normalized = {}
+    for key in ('tu_ngay', 'den_ngay'):
+        if filters.get(key):
+            normalized[key] = to_date(filters[key])
+    for column in TEXT_FILTERS:
+        value = (filters.get(column) or '').strip()
+        if value:
+            normalized[column] = value
+    return normalized
+
+def build_where(kind, filters, nha_may, dialect=MSSQL):
+    """Trả về (where, params) cho loại tìm kiếm kind với bộ lọc filters."""
+    spec = SEARCH_KINDS[kind]
+    filters = normalize_filters(filters)
+    builder = WhereBuilder(dialect)
+    builder.equals('NHA_MAY', nha_may)
+    builder.constant('TRANG_THAI', spec['trang_thai'])
+    if spec['date_column']:
+        builder.date_range(spec['date_column'], filters.get('tu_ngay'), filters.get('den_ngay'),
+                           as_datetime=spec['datetime'])
+    for column in TEXT_FILTERS:
+        builder.text(column, filters.get(column))
+    return builder.build()
+
+def build_search(kind, filters, nha_may, dialect=MSSQL):
+    """Tạo KeysetQuery cho một tab tìm kiếm (nhap_kho, xa_vai, xuat_kho, ton_kho)."""
+    spec = SEARCH_KINDS[kind]
+    where, params = build_where(kind, filters, nha_may, dialect)
+    return KeysetQuery(search_columns(kind, dialect), where, params, sum_column=spec['sum_column'],
+                       dialect=dialect)
@@ -0,0 +1,140 @@
+import sys
+import time
+from collections import OrderedDict
+
+from config import settings
+from query_builder import normalize_filters, TRANG_THAI_NHAP_KHO, TRANG_THAI_XA_VAI, TRANG_THAI_XUAT_KHO
+from scan_engine import TRANSITIONS
+
+# Tab tìm kiếm có thể chứa một cuộn vải ở từng trạng thái (tab Nhập kho hiện mọi trạng thái)
+KINDS_BY_STATE = {
+    TRANG_THAI_NHAP_KHO: ('nhap_kho', 'ton_kho'),
+    TRANG_THAI_XA_VAI: ('nhap_kho', 'xa_vai'),
+    TRANG_THAI_XUAT_KHO: ('nhap_kho', 'xuat_kho'),
+}
+ALL_KINDS = ('nhap_kho', 'xa_vai', 'xuat_kho', 'ton_kho')
+
+def kinds_for_states(states):
+    """Các tab bị ảnh hưởng khi cuộn vải rời khỏi hoặc chuyển vào các trạng thái states."""
+    kinds = set()
+    for state in states:
+        kinds.update(KINDS_BY_STATE.get(state, ALL_KINDS))
+    return kinds
+
+def kinds_for_action(action):
+    """Các tab bị ảnh hưởng bởi một thao tác quét (trạng thái trước và sau khi quét)."""
+    transition = TRANSITIONS[action]
+    return kinds_for_states(transition['from'] + ((transition['to'],) if transition['to'] else ()))
+
+def estimate_size(value):
+    """Ước lượng số byte của một kết quả (DataFrame trong dict của build_result, tuple, list)."""
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+class CacheStats():
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0       # số lần bỏ mục hết hạn TTL
+        self.evicted = 0       # số mục bị đẩy ra do vượt giới hạn bộ nhớ
+        self.invalidated = 0   # số mục bị xóa do chính máy này thay đổi dữ liệu
+
+class QueryCache():
+    """Bộ nhớ đệm kết quả tìm kiếm theo (tab, bộ lọc đã chuẩn hóa, nhà máy).
+
+    Mỗi lượt tìm gồm nhiều phần (trang đầu, các trang sau, câu COUNT), mỗi phần
+    là một mục riêng. Mục hết hạn sau ttl giây; khi tổng dung lượng vượt
+    max_bytes, mục lâu không dùng nhất bị bỏ trước (LRU). Khi máy này thay đổi
+    dữ liệu (quét, nhập file, xóa), invalidate() xóa đúng các tab và nhà máy bị
+    ảnh hưởng. Chỉ dùng từ luồng giao diện.
+    """
+    def __init__(self, max_bytes=settings.QUERY_CACHE_MB * 1024 * 1024, ttl=settings.QUERY_CACHE_TTL,
+                 clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # khóa -> (hết hạn lúc, số byte, giá trị)
+        self.bytes = 0
+        self.generation = 0  # tăng mỗi lần invalidate, kết quả của truy vấn cũ hơn không được lưu
+        self.stats = CacheStats()
+
+    @staticmethod
+    def key(kind, filters, nha_may):
+        """Khóa của một lượt tìm: bộ lọc rỗng/khoảng trắng/kiểu ngày khác nhau cho cùng một khóa."""
+        return (kind, tuple(sorted(normalize_filters(filters).items())), nha_may)
+
+    def get(self, key, part):
+        entry = self._entries.get((key, part))
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires, size, value = entry
+        if self.clock() >= expires:
+            self._remove((key, part))
+            self.stats.expired += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end((key, part))
+        self.stats.hits += 1
+        return value
+
+    def put(self, key, part, value, generation=None, size=None):
+        """Lưu kết quả; bỏ qua nếu dữ liệu đã bị invalidate sau khi truy vấn bắt đầu (generation cũ)."""
+        if generation is not None and generation != self.generation:
+            return False
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes or self.ttl <= 0:
+            return False
+        self._remove((key, part))
+        self._entries[(key, part)] = (self.clock() + self.ttl, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats.evicted += 1
+        return True
+
+    def invalidate(self, kinds=ALL_KINDS, nha_may=None):
+        """Xóa các mục của các tab kinds (của nhà máy nha_may, hoặc mọi nhà máy nếu None)."""
+        self.generation += 1
+        kinds = set(kinds)
+        stale = [entry_key for entry_key in self._entries
+                 if entry_key[0][0] in kinds and (nha_may is None or entry_key[0][2] == nha_may)]
+        for entry_key in stale:
+            self._remove(entry_key)
+        self.stats.invalidated += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self.bytes = 0
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def snapshot(self):
+        """Thống kê để tinh chỉnh dung lượng và TTL."""
+        stats = self.stats
+        lookups = stats.hits + stats.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'ttl_s': self.ttl,
+            'hits': stats.hits,
+            'misses': stats.misses,
+            'hit_rate': round(stats.hits / lookups, 3) if lookups else 0.0,
+            'expired': stats.expired,
+            'evicted': stats.evicted,
+            'invalidated': stats.invalidated,
+        }
@@ -0,0 +1,349 @@
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+from config import settings
+from database import ket_noi_db
+from pagination import MSSQL, SQLITE
+from query_builder import build_search, TRANG_THAI_NHAP_KHO
+from scan_engine import (ScanEngine, ScanResult, LatencyStats, TRANSITIONS, CHUYEN_VI_TRI, OK, UNKNOWN_ID,
+                         validate_scan, rejection_reason)
+
+# Các cột của một cuộn vải khi tra cứu
+ROLL_COLUMNS = ('ID', 'NHA_MAY', 'NGAY_NHAN', 'STYLE', 'MO', 'LOAI_VAI', 'DVT', 'LOT', 'MAU', 'CUON_SO',
+                'SO_YARD', 'VI_TRI', 'TRANG_THAI', 'THOI_GIAN_XA', 'THOI_GIAN_XUAT_KHO')
+
+# Nhân viên đăng nhập: (macongty, masothe, hoten, phongban, Kho)
+EMPLOYEE_COLUMNS = "macongty, masothe, hoten, phongban, Kho"
+
+def rows_to_dicts(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+def insert_roll_sql(columns, output=''):
+    return (f"INSERT INTO DANH_SACH_CUON_VAI ({', '.join(columns)}) {output}"
+            f"VALUES ({', '.join('?' for _ in columns)})")
+
+class RollStore():
+    """Phần dùng chung của các kho dữ liệu: cuộn vải (tra cứu, tìm kiếm, quét, xóa) và nhân viên.
+
+    Lớp con cung cấp dialect, employee_table, _fetch(sql, params) -> (tên cột,
+    các dòng), _execute(sql, params) -> số dòng bị ảnh hưởng, add_rolls(rolls)
+    và transition_many(scans) cùng ý nghĩa với ScanEngine.transition_many.
+    Cả hai lớp con phải qua cùng bộ kiểm tra check_repository.py.
+    """
+    dialect = MSSQL
+    employee_table = 'NHANVIEN'
+
+    def _fetch(self, sql, params=()):
+        raise NotImplementedError
+
+    def _execute(self, sql, params=()):
+        raise NotImplementedError
+
+    def authenticate(self, macongty, masothe, matkhau):
+        """Nhân viên kho có mã thẻ và mật khẩu khớp: (macongty, masothe, hoten, phongban, Kho), None nếu sai."""
+        sql = (f"SELECT {EMPLOYEE_COLUMNS} FROM {self.employee_table} "
+               f"WHERE macongty = ? AND masothe = ? AND matkhau = ? AND Kho IS NOT NULL")
+        _, rows = self._fetch(sql, (macongty, masothe, matkhau))
+        return tuple(rows[0]) if rows else None
+
+    def delete_rolls(self, roll_ids):
+        """Xóa các cuộn vải theo ID, trả về số dòng đã xóa."""
+        roll_ids = [int(roll_id) for roll_id in roll_ids]
+        if not roll_ids:
+            return 0
+        placeholders = ", ".join("?" for _ in roll_ids)
+        return self._execute(f"DELETE FROM DANH_SACH_CUON_VAI WHERE ID IN ({placeholders})", roll_ids)
+
+    def get_roll(self, roll_id):
+        """Thông tin một cuộn vải (dict), None nếu không có."""
+        sql = f"SELECT {', '.join(ROLL_COLUMNS)} FROM DANH_SACH_CUON_VAI WHERE ID = ?"
+        columns, rows = self._fetch(sql, (int(roll_id),))
+        return rows_to_dicts(columns, rows)[0] if rows else None
+
+    def rolls_at(self, nha_may, vi_tri):
+        """Các cuộn vải đang ở vị trí vi_tri của nhà máy nha_may."""
+        sql = (f"SELECT {', '.join(ROLL_COLUMNS)} FROM DANH_SACH_CUON_VAI "
+               f"WHERE NHA_MAY = ? AND VI_TRI = ? ORDER BY ID")
+        return rows_to_dicts(*self._fetch(sql, (nha_may, vi_tri)))
+
+    def search(self, kind, filters, nha_may, after=None, page_size=None):
+        """Một trang kết quả tìm kiếm của tab kind, kèm ID để lấy trang sau (None khi hết)."""
+        query = build_search(kind, filters, nha_may, self.dialect)
+        if page_size:
+            query.page_size = min(int(page_size), query.page_size)
+        columns, rows = self._fetch(*query.page(after))
+        key = columns.index(query.key)
+        after = rows[-1][key] if len(rows) == query.page_size else None
+        return {'rows': rows_to_dicts(columns, rows), 'after': after}
+
+    def transition(self, action, roll_id, vi_tri=None, thoi_gian=None):
+        return self.transition_many([(action, roll_id, vi_tri, thoi_gian)])[0]
+
+class SqlServerStore(RollStore):
+    """Kho dữ liệu trên SQL Server: đọc qua pool dùng chung, quét qua ScanEngine (kết nối giữ sẵn)."""
+    dialect = MSSQL
+    employee_table = 'HR.DBO.NHANVIEN'
+
+    def __init__(self, engine=None):
+        self.engine = engine or ScanEngine()
+
+    @property
+    def db_latency(self):
+        return self.engine.db_latency
+
+    def _fetch(self, sql, params=()):
+        with ket_noi_db() as connection:
+            if connection is None:
+                raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql, params)
+                columns = [column[0] for column in cursor.description]
+                return columns, cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def _execute(self, sql, params=()):
+        with ket_noi_db() as connection:
+            if connection is None:
+                raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql, params)
+                count = cursor.rowcount
+                connection.commit()
+                return count
+            finally:
+                cursor.close()
+
+    def add_rolls(self, rolls):
+        """Thêm các cuộn vải (dict theo tên cột, không gồm ID) trong một giao dịch, trả về các ID mới."""
+        rolls = list(rolls)
+        if not rolls:
+            return []
+        columns = [column for column in ROLL_COLUMNS if column in rolls[0] and column != 'ID']
+        sql = insert_roll_sql(columns, output="OUTPUT inserted.ID ")
+        with ket_noi_db() as connection:
+            if connection is None:
+                raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+            cursor = connection.cursor()
+            try:
+                ids = []
+                for roll in rolls:
+                    cursor.execute(sql, [roll.get(column) for column in columns])
+                    ids.append(cursor.fetchone()[0])
+                connection.commit()
+                return ids
+            finally:
+                cursor.close()
+
+    def transition_many(self, scans):
+        return self.engine.transition_many(scans)
+
+    def close(self):
+        self.engine.close()
+
+# Ngày giờ lưu dạng chuỗi ISO (so sánh chuỗi đúng thứ tự thời gian, khớp định dạng 120 của SQL Server)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' ', timespec='seconds'))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, float)
+
+# Bảng cuộn vải trên SQLite, cùng tên cột với SQL Server; các index tương ứng migrations/V001, V002.
+# Cột chữ so sánh không phân biệt hoa thường như collation mặc định của SQL Server
+# (LIKE 'ABC%' trên cột NOCASE cũng dùng được index).
+SQLITE_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS DANH_SACH_CUON_VAI (
+        ID INTEGER PRIMARY KEY,
+        NGAY_NHAN TEXT,
+        STYLE TEXT COLLATE NOCASE,
+        MO TEXT COLLATE NOCASE,
+        LOAI_VAI TEXT COLLATE NOCASE,
+        DVT TEXT COLLATE NOCASE,
+        LOT TEXT COLLATE NOCASE,
+        MAU TEXT COLLATE NOCASE,
+        CUON_SO INTEGER,
+        SO_YARD REAL,
+        NHA_MAY TEXT COLLATE NOCASE,
+        VI_TRI TEXT COLLATE NOCASE NOT NULL DEFAULT '',
+        TRANG_THAI TEXT NOT NULL DEFAULT '{TRANG_THAI_NHAP_KHO}',
+        THOI_GIAN_XA TEXT,
+        THOI_GIAN_XUAT_KHO TEXT
+    );
+    CREATE INDEX IF NOT EXISTS IX_DSCV_NHA_MAY_NGAY_NHAN ON DANH_SACH_CUON_VAI (NHA_MAY, NGAY_NHAN);
+    CREATE INDEX IF NOT EXISTS IX_DSCV_XA_VAI ON DANH_SACH_CUON_VAI (NHA_MAY, THOI_GIAN_XA)
+        WHERE TRANG_THAI = 'Xả vải';
+    CREATE INDEX IF NOT EXISTS IX_DSCV_XUAT_KHO ON DANH_SACH_CUON_VAI (NHA_MAY, THOI_GIAN_XUAT_KHO)
+        WHERE TRANG_THAI = 'Xuất kho';
+    CREATE INDEX IF NOT EXISTS IX_DSCV_TON_KHO ON DANH_SACH_CUON_VAI (NHA_MAY, ID)
+        WHERE TRANG_THAI = '{TRANG_THAI_NHAP_KHO}';
+    CREATE INDEX IF NOT EXISTS IX_DSCV_KHOA_NHAP ON DANH_SACH_CUON_VAI (NHA_MAY, STYLE, MO, LOT, CUON_SO, MAU, LOAI_VAI);
+    CREATE INDEX IF NOT EXISTS IX_DSCV_VI_TRI ON DANH_SACH_CUON_VAI (NHA_MAY, VI_TRI);
+    CREATE TABLE IF NOT EXISTS NHANVIEN (
+        macongty TEXT NOT NULL,
+        masothe TEXT NOT NULL,
+        hoten TEXT,
+        phongban TEXT,
+        matkhau TEXT,
+        Kho TEXT,
+        PRIMARY KEY (macongty, masothe)
+    ) WITHOUT ROWID;
+"""
+
+# Chuỗi N'...' của SQL Server viết thành '...' trên SQLite
+NATIONAL_LITERAL = re.compile(r"\bN'")
+
+def sqlite_transition_sql(action):
+    """UPDATE có điều kiện cho một lần quét trên SQLite (cần SQLite 3.35+ cho RETURNING).
+
+    Trả về TRANG_THAI, VI_TRI khi cập nhật thành công, không dòng nào khi bị
+    từ chối hoặc ID không tồn tại. Tham số: (giá trị cập nhật, ID).
+    """
+    spec = TRANSITIONS[action]
+    allowed = ", ".join(f"'{state}'" for state in spec['from'])
+    assignments = NATIONAL_LITERAL.sub("'", spec['set'].format(value='?'))
+    return f"""UPDATE DANH_SACH_CUON_VAI SET {assignments}
+        WHERE ID = ? AND TRANG_THAI IN ({allowed})
+        RETURNING TRANG_THAI, VI_TRI"""
+
+SQLITE_STATE_SQL = "SELECT TRANG_THAI, VI_TRI FROM DANH_SACH_CUON_VAI WHERE ID = ?"
+
+class SqliteStore(RollStore):
+    """Kho dữ liệu SQLite cục bộ (chế độ WAL), dùng cho kho vệ tinh và để thử nghiệm.
+
+    Mỗi luồng đọc có kết nối riêng nên các lượt đọc chạy song song với lượt
+    ghi; các lượt ghi dùng chung một kết nối, mỗi lô quét là một giao dịch.
+    Câu lệnh có tham số được sqlite3 giữ sẵn dạng đã biên dịch (cached_statements).
+    Với path ':memory:' mọi lượt đọc/ghi dùng chung một kết nối.
+    """
+    dialect = SQLITE
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        self.db_latency = LatencyStats()
+        self.connection = self._connect()
+        with self._lock:
+            self.connection.executescript(SQLITE_SCHEMA)
+        self.transition_sql = {action: sqlite_transition_sql(action) for action in TRANSITIONS}
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                     cached_statements=256)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.execute("PRAGMA mmap_size=268435456")  # đọc trang qua bộ nhớ ánh xạ, tra cứu không cần gọi read()
+        self._connections.append(connection)
+        return connection
+
+    def _fetch(self, sql, params=()):
+        if self.path == ':memory:':
+            with self._lock:
+                cursor = self.connection.execute(sql, params)
+                return [column[0] for column in cursor.description], cursor.fetchall()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        cursor = connection.execute(sql, params)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).rowcount
+
+    @contextmanager
+    def _transaction(self):
+        """Giao dịch ghi trên kết nối ghi dùng chung (lấy khóa ghi ngay từ đầu)."""
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def add_rolls(self, rolls):
+        """Thêm các cuộn vải (dict theo tên cột) trong một giao dịch, trả về các ID.
+
+        Dict có ID thì giữ nguyên ID đó (nạp dữ liệu có sẵn), nếu không ID được cấp tự động.
+        """
+        rolls = list(rolls)
+        if not rolls:
+            return []
+        columns = [column for column in ROLL_COLUMNS if column in rolls[0]]
+        sql = insert_roll_sql(columns)
+        with self._transaction() as connection:
+            if 'ID' in columns:
+                connection.executemany(sql, [[roll.get(column) for column in columns] for roll in rolls])
+                return [roll['ID'] for roll in rolls]
+            return [connection.execute(sql, [roll.get(column) for column in columns]).lastrowid for roll in rolls]
+
+    def analyze(self):
+        """Cập nhật thống kê cho bộ tối ưu truy vấn sau khi nạp nhiều dữ liệu."""
+        with self._lock:
+            self.connection.execute("ANALYZE")
+
+    def add_employees(self, employees):
+        """Thêm/cập nhật nhân viên (macongty, masothe, hoten, phongban, matkhau, Kho)."""
+        sql = ("INSERT OR REPLACE INTO NHANVIEN (macongty, masothe, hoten, phongban, matkhau, Kho) "
+               "VALUES (?, ?, ?, ?, ?, ?)")
+        with self._transaction() as connection:
+            connection.executemany(sql, [tuple(employee) for employee in employees])
+
+    def transition_many(self, scans):
+        """Như ScanEngine.transition_many: các lần quét áp dụng đúng thứ tự, trong một giao dịch."""
+        results = [None] * len(scans)
+        pending = []
+        for index, (action, roll_id, vi_tri, thoi_gian) in enumerate(scans):
+            roll_id = str(roll_id).strip()
+            reason = validate_scan(action, roll_id, vi_tri)
+            if reason:
+                results[index] = ScanResult(action, roll_id, reason)
+                continue
+            thoi_gian = thoi_gian or datetime.now()
+            results[index] = ScanResult(action, roll_id, UNKNOWN_ID)
+            pending.append((index, action, int(roll_id), vi_tri if action == CHUYEN_VI_TRI else thoi_gian, thoi_gian))
+        if not pending:
+            return results
+
+        start = time.perf_counter()
+        with self._transaction() as connection:
+            for index, action, roll_id, value, thoi_gian in pending:
+                result = results[index]
+                rows = connection.execute(self.transition_sql[action], (value, roll_id)).fetchall()
+                if rows:
+                    result.reason = OK
+                    result.thoi_gian = thoi_gian
+                else:
+                    rows = connection.execute(SQLITE_STATE_SQL, (roll_id,)).fetchall()
+                    if rows:
+                        result.reason = rejection_reason(action, rows[0][0])
+                if rows:
+                    result.trang_thai, result.vi_tri = rows[0]
+        elapsed = (time.perf_counter() - start) * 1000
+        self.db_latency.record(elapsed)
+        for index, *_ in pending:
+            results[index].db_ms = elapsed
+        return results
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self._connections = []
+
+def open_store(sqlite_path=settings.LOCAL_DB_PATH):
+    """Kho dữ liệu SQLite tại sqlite_path nếu có, nếu không là SQL Server theo cấu hình .env."""
+    if sqlite_path:
+        return SqliteStore(sqlite_path)
+    return SqlServerStore()
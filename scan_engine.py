@@ -0,0 +1,365 @@
+import re
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+from config import settings
+from database import get_engine
+from query_builder import TRANG_THAI_NHAP_KHO, TRANG_THAI_XA_VAI, TRANG_THAI_XUAT_KHO
+from tracing import tracer
+
+# Các thao tác quét: trạng thái được phép trước khi quét, trạng thái sau khi quét và các cột được cập nhật
+# ({value} là tham số ? khi quét từng cuộn, hoặc cột của bảng tạm khi cập nhật theo lô)
+XA_VAI = 'xa_vai'
+XUAT_KHO = 'xuat_kho'
+CHUYEN_VI_TRI = 'chuyen_vi_tri'
+
+TRANSITIONS = {
+    XA_VAI: {
+        'from': (TRANG_THAI_NHAP_KHO,),
+        'to': TRANG_THAI_XA_VAI,
+        'set': "THOI_GIAN_XA = {value}, TRANG_THAI = N'Xả vải', VI_TRI = ''",
+    },
+    XUAT_KHO: {
+        'from': (TRANG_THAI_NHAP_KHO, TRANG_THAI_XA_VAI),
+        'to': TRANG_THAI_XUAT_KHO,
+        'set': "THOI_GIAN_XUAT_KHO = {value}, TRANG_THAI = N'Xuất kho', VI_TRI = ''",
+    },
+    CHUYEN_VI_TRI: {
+        'from': (TRANG_THAI_NHAP_KHO, TRANG_THAI_XA_VAI),
+        'to': None,  # giữ nguyên trạng thái
+        'set': "VI_TRI = {value}",
+    },
+}
+
+# Lý do từ chối
+OK = 'ok'
+INVALID_ID = 'invalid_id'
+UNKNOWN_ID = 'unknown_id'
+ALREADY_RELEASED = 'already_released'
+ALREADY_DISPATCHED = 'already_dispatched'
+WRONG_STATE = 'wrong_state'
+NO_LOCATION = 'no_location'
+INVALID_LOCATION = 'invalid_location'
+NOT_ELIGIBLE = 'not_eligible'  # không có trong danh sách cuộn hợp lệ đã tải (quét nhanh)
+QUEUED = 'queued'  # đã ghi vào nhật ký offline, chờ đồng bộ lên máy chủ
+WRITE_FAILED = 'write_failed'  # máy chủ báo lỗi (không phải mất kết nối) khi đồng bộ lại
+
+MESSAGES = {
+    INVALID_ID: "Mã QR không hợp lệ!",
+    UNKNOWN_ID: "Không tìm thấy cuộn vải!",
+    ALREADY_RELEASED: "Cuộn vải đã được xả trước đó!",
+    ALREADY_DISPATCHED: "Cuộn vải đã xuất kho!",
+    NO_LOCATION: "Vui lòng quét mã QR vị trí trước khi quét mã cuộn vải!",
+    INVALID_LOCATION: "Mã vị trí không hợp lệ!",
+    NOT_ELIGIBLE: "Cuộn vải không tồn tại hoặc không ở trạng thái cho phép!",
+    QUEUED: "Đã lưu, chờ đồng bộ",
+    WRITE_FAILED: "Máy chủ báo lỗi khi ghi lần quét!",
+}
+
+# Quy ước mã vị trí (mã QR dán tại ô kệ)
+LOCATION_CODE = re.compile(settings.LOCATION_CODE_PATTERN)
+MAX_ROLL_ID = 2 ** 31 - 1  # giá trị lớn nhất của cột ID (INT)
+
+def is_location_code(code):
+    return LOCATION_CODE.fullmatch(code or '') is not None
+
+def is_roll_id(value):
+    # ID là INT: chuỗi số ASCII không vượt quá MAX_ROLL_ID, nếu không sẽ lỗi khi gửi lên máy chủ
+    text = str(value).strip()
+    return text.isascii() and text.isdigit() and int(text) <= MAX_ROLL_ID
+
+def validate_scan(action, roll_id, vi_tri=None):
+    """Kiểm tra ngay tại máy trạm, không cần máy chủ. Trả về lý do từ chối hoặc None."""
+    if action not in TRANSITIONS:
+        raise ValueError(f"Thao tác quét không hợp lệ: {action}")
+    if not is_roll_id(roll_id):
+        return INVALID_ID
+    if action == CHUYEN_VI_TRI and not vi_tri:
+        return NO_LOCATION
+    if action == CHUYEN_VI_TRI and not is_location_code(vi_tri):
+        return INVALID_LOCATION
+    return None
+
+def transition_statement(action):
+    """UPDATE có điều kiện cho một lần quét, ghi kết quả vào @KET_QUA.
+
+    OK = 1 khi cập nhật thành công; OK = 0 kèm trạng thái hiện tại khi bị từ chối;
+    không có dòng nào khi ID không tồn tại. Điều kiện TRANG_THAI nằm ngay trong
+    UPDATE nên hai trạm quét cùng một cuộn thì chỉ một trạm thành công.
+    Tham số: (giá trị cập nhật, ID, số thứ tự, số thứ tự, ID).
+    """
+    spec = TRANSITIONS[action]
+    allowed = ", ".join(f"N'{state}'" for state in spec['from'])
+    return f"""
+        DELETE FROM @KQ;
+        UPDATE DANH_SACH_CUON_VAI
+        SET {spec['set'].format(value='?')}
+        OUTPUT inserted.TRANG_THAI, inserted.VI_TRI INTO @KQ
+        WHERE ID = ? AND TRANG_THAI IN ({allowed});
+        IF EXISTS (SELECT 1 FROM @KQ)
+            INSERT INTO @KET_QUA SELECT ?, 1, TRANG_THAI, VI_TRI FROM @KQ;
+        ELSE
+            INSERT INTO @KET_QUA SELECT ?, 0, TRANG_THAI, VI_TRI FROM DANH_SACH_CUON_VAI WHERE ID = ?;"""
+
+def transition_sql(actions):
+    """Một lô lệnh (một lượt đi-về) cho một hoặc nhiều lần quét, chạy trong một giao dịch.
+
+    Trả về một tập kết quả (SO_TT, OK, TRANG_THAI, VI_TRI) theo thứ tự quét.
+    """
+    statements = "".join(transition_statement(action) for action in actions)
+    return f"""
+        SET NOCOUNT ON;
+        SET XACT_ABORT ON;
+        DECLARE @KQ TABLE (TRANG_THAI NVARCHAR(50), VI_TRI NVARCHAR(50));
+        DECLARE @KET_QUA TABLE (SO_TT INT, OK BIT, TRANG_THAI NVARCHAR(50), VI_TRI NVARCHAR(50));
+        BEGIN TRANSACTION;{statements}
+        COMMIT TRANSACTION;
+        SELECT SO_TT, OK, TRANG_THAI, VI_TRI FROM @KET_QUA ORDER BY SO_TT;
+    """
+
+def transition_set_sql(action):
+    """Cập nhật một lô cuộn vải (đã nạp vào bảng tạm #QUET_LO) bằng một câu UPDATE ... FROM.
+
+    Trả về (SO_TT, OK, TRANG_THAI, VI_TRI) cho mọi dòng của lô; ID không tồn tại
+    có TRANG_THAI là NULL.
+    """
+    spec = TRANSITIONS[action]
+    allowed = ", ".join(f"N'{state}'" for state in spec['from'])
+    return f"""
+        SET NOCOUNT ON;
+        DECLARE @KQ TABLE (ID INT);
+        UPDATE d
+        SET {spec['set'].format(value='q.GIA_TRI')}
+        OUTPUT inserted.ID INTO @KQ
+        FROM DANH_SACH_CUON_VAI d
+        JOIN (SELECT ID, MIN(GIA_TRI) AS GIA_TRI FROM #QUET_LO GROUP BY ID) q ON q.ID = d.ID
+        WHERE d.TRANG_THAI IN ({allowed});
+        SELECT q.SO_TT, CASE WHEN k.ID IS NULL THEN 0 ELSE 1 END, d.TRANG_THAI, d.VI_TRI
+        FROM #QUET_LO q
+        LEFT JOIN @KQ k ON k.ID = q.ID
+        LEFT JOIN DANH_SACH_CUON_VAI d ON d.ID = q.ID
+        ORDER BY q.SO_TT;
+    """
+
+# Bảng tạm theo phiên kết nối, tạo một lần và làm rỗng trước mỗi lô
+PREPARE_STAGING = """
+    IF OBJECT_ID('tempdb..#QUET_LO') IS NULL
+        CREATE TABLE #QUET_LO (SO_TT INT NOT NULL, ID INT NOT NULL, GIA_TRI DATETIME NOT NULL);
+    TRUNCATE TABLE #QUET_LO;
+"""
+
+def rejection_reason(action, trang_thai):
+    """Lý do từ chối dựa trên trạng thái hiện tại của cuộn vải."""
+    if trang_thai is None:
+        return UNKNOWN_ID
+    if trang_thai == TRANG_THAI_XUAT_KHO:
+        return ALREADY_DISPATCHED
+    if action == XA_VAI and trang_thai == TRANG_THAI_XA_VAI:
+        return ALREADY_RELEASED
+    return WRONG_STATE
+
+class ScanResult():
+    """Kết quả một lần quét."""
+    def __init__(self, action, roll_id, reason, trang_thai=None, vi_tri=None, thoi_gian=None):
+        self.action = action
+        self.roll_id = roll_id
+        self.reason = reason
+        self.trang_thai = trang_thai
+        self.vi_tri = vi_tri
+        self.thoi_gian = thoi_gian
+        self.db_ms = 0.0
+
+    @property
+    def ok(self):
+        return self.reason in (OK, QUEUED)
+
+    @property
+    def queued(self):
+        return self.reason == QUEUED
+
+    @property
+    def message(self):
+        if self.reason == OK:
+            return "OK"
+        if self.reason == WRONG_STATE:
+            return f"Cuộn vải đang ở trạng thái {self.trang_thai}!"
+        return MESSAGES[self.reason]
+
+class LatencyStats():
+    """Độ trễ của các lần quét gần nhất (mili giây)."""
+    def __init__(self, size=500):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def record(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {'count': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+        pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))], 1)
+        return {'count': len(samples), 'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'max_ms': round(samples[-1], 1)}
+
+def is_connection_error(e):
+    """Lỗi do mất kết nối (SQLSTATE 08xxx, hết thời gian chờ) chứ không phải lỗi câu lệnh."""
+    state = str(e.args[0]) if e.args else ''
+    return state.startswith('08') or state in ('HYT00', 'HYT01') or isinstance(e, OSError)
+
+def open_dedicated_connection():
+    """Mở kết nối riêng cho trạm quét, tách khỏi pool và bật autocommit.
+
+    Mỗi lần quét chỉ là một câu lệnh nguyên tử nên không cần thêm lượt commit.
+    """
+    connection = get_engine().raw_connection()
+    connection.detach()
+    connection.dbapi_connection.autocommit = True
+    return connection
+
+class ScanEngine():
+    """Thực hiện chuyển trạng thái khi quét trên một kết nối giữ sẵn, một lượt đi-về mỗi lần quét."""
+    def __init__(self, connect=open_dedicated_connection):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self.connection = None
+        self.latency = LatencyStats()   # từ lúc quét tới lúc phát âm thanh (do giao diện ghi)
+        self.db_latency = LatencyStats()  # riêng phần truy vấn máy chủ
+
+    def _call(self, work):
+        """Chạy work(connection) trên kết nối giữ sẵn, thử lại một lần khi mất kết nối."""
+        with self._lock:
+            for attempt in range(2):
+                if self.connection is None:
+                    try:
+                        self.connection = self._connect()
+                    except Exception as e:
+                        raise ConnectionError(f"Không thể kết nối tới cơ sở dữ liệu! ({e})") from e
+                try:
+                    return work(self.connection)
+                except Exception as e:
+                    self.reset()
+                    if not is_connection_error(e):
+                        raise
+                    if attempt == 1:
+                        raise ConnectionError(f"Không thể kết nối tới cơ sở dữ liệu! ({e})") from e
+
+    def _execute(self, sql, params):
+        def work(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        return self._call(work)
+
+    def transition(self, action, roll_id, vi_tri=None, thoi_gian=None):
+        """Quét cuộn vải roll_id cho thao tác action, trả về ScanResult.
+
+        Lỗi kết nối được thử lại một lần với kết nối mới; nếu vẫn lỗi thì ném
+        ConnectionError để nơi gọi xử lý (ví dụ ghi vào nhật ký offline).
+        """
+        return self.transition_many([(action, roll_id, vi_tri, thoi_gian)])[0]
+
+    def transition_many(self, scans):
+        """Thực hiện nhiều lần quét (action, roll_id, vi_tri, thoi_gian) trong một lượt đi-về.
+
+        Các lần quét được áp dụng đúng thứ tự truyền vào; trả về danh sách ScanResult cùng thứ tự.
+        """
+        results = [None] * len(scans)
+        times = {}
+        actions = []
+        params = []
+        for index, (action, roll_id, vi_tri, thoi_gian) in enumerate(scans):
+            roll_id = str(roll_id).strip()
+            reason = validate_scan(action, roll_id, vi_tri)
+            if reason:
+                results[index] = ScanResult(action, roll_id, reason)
+                continue
+            thoi_gian = thoi_gian or datetime.now()
+            value = vi_tri if action == CHUYEN_VI_TRI else thoi_gian
+            results[index] = ScanResult(action, roll_id, UNKNOWN_ID)
+            times[index] = thoi_gian
+            actions.append(action)
+            params.extend((value, int(roll_id), index, index, int(roll_id)))
+        if not actions:
+            return results
+
+        start = time.perf_counter()
+        rows = self._execute(transition_sql(actions), params)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.db_latency.record(elapsed)
+        tracer.record("db.scan", elapsed, rows=len(actions))
+
+        # Dòng không có trong kết quả là ID không tồn tại (giữ UNKNOWN_ID)
+        for index, ok, trang_thai, vi_tri in rows:
+            result = results[index]
+            result.trang_thai = trang_thai
+            result.vi_tri = vi_tri
+            if ok:
+                result.reason = OK
+                result.thoi_gian = times[index]
+            else:
+                result.reason = rejection_reason(result.action, trang_thai)
+        for index in times:
+            results[index].db_ms = elapsed
+        return results
+
+    def transition_set(self, action, scans):
+        """Xả vải / xuất kho cả lô [(roll_id, thoi_gian)] bằng một câu UPDATE theo tập hợp.
+
+        Lô được nạp vào bảng tạm bằng fast_executemany rồi cập nhật trong một câu
+        lệnh; trả về danh sách ScanResult cùng thứ tự.
+        """
+        if action == CHUYEN_VI_TRI:
+            raise ValueError("Chuyển vị trí không hỗ trợ cập nhật theo lô")
+        results = [ScanResult(action, str(roll_id), UNKNOWN_ID) for roll_id, thoi_gian in scans]
+        rows = [(index, int(roll_id), thoi_gian) for index, (roll_id, thoi_gian) in enumerate(scans)]
+        if not rows:
+            return results
+
+        def work(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(PREPARE_STAGING)
+                cursor.fast_executemany = True
+                cursor.executemany("INSERT INTO #QUET_LO (SO_TT, ID, GIA_TRI) VALUES (?, ?, ?)", rows)
+                cursor.execute(transition_set_sql(action))
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+        start = time.perf_counter()
+        fetched = self._call(work)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.db_latency.record(elapsed)
+        tracer.record("db.scan_set", elapsed, rows=len(rows))
+        for index, ok, trang_thai, vi_tri in fetched:
+            result = results[index]
+            result.trang_thai = trang_thai
+            result.vi_tri = vi_tri
+            if ok:
+                result.reason = OK
+                result.thoi_gian = scans[index][1]
+            else:
+                result.reason = rejection_reason(action, trang_thai)
+        for result in results:
+            result.db_ms = elapsed
+        return results
+
+    def reset(self):
+        """Đóng kết nối hiện tại (lần quét sau sẽ mở kết nối mới)."""
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def close(self):
+        with self._lock:
+            self.reset()
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from config import settings
+from scan_engine import ScanResult, WRITE_FAILED
+
+# Trạng thái của một lần quét trong nhật ký
+PENDING = 'pending'    # chờ đồng bộ lên máy chủ
+SENDING = 'sending'    # đang gửi trực tiếp từ màn hình quét
+APPLIED = 'applied'    # máy chủ đã cập nhật
+REJECTED = 'rejected'  # máy chủ từ chối (xem cột REASON)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS SCANS (
+        SEQ INTEGER PRIMARY KEY AUTOINCREMENT,
+        ACTION TEXT NOT NULL,
+        ROLL_ID TEXT NOT NULL,
+        VI_TRI TEXT,
+        THOI_GIAN TEXT NOT NULL,
+        STATUS TEXT NOT NULL,
+        REASON TEXT,
+        TRANG_THAI TEXT,
+        SYNCED_AT TEXT
+    );
+    CREATE INDEX IF NOT EXISTS IX_SCANS_STATUS ON SCANS (STATUS, SEQ);
+"""
+
+class ScanJournal():
+    """Nhật ký quét cục bộ (SQLite, chế độ WAL).
+
+    Mọi lần quét được ghi vào đây trước khi gửi lên máy chủ nên mất kết nối
+    không làm mất lần quét nào; các lần quét còn PENDING được đồng bộ lại theo
+    lô bằng replay().
+    """
+    def __init__(self, path=settings.SCAN_JOURNAL_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.executescript(SCHEMA)
+        # Lần quét đang gửi dở khi chương trình tắt đột ngột: đưa lại vào hàng chờ
+        self.connection.execute("UPDATE SCANS SET STATUS = ? WHERE STATUS = ?", (PENDING, SENDING))
+
+    def record(self, action, roll_id, vi_tri=None, thoi_gian=None, status=PENDING):
+        """Ghi một lần quét, trả về số thứ tự SEQ."""
+        thoi_gian = thoi_gian or datetime.now()
+        with self._lock:
+            cursor = self.connection.execute(
+                "INSERT INTO SCANS (ACTION, ROLL_ID, VI_TRI, THOI_GIAN, STATUS) VALUES (?, ?, ?, ?, ?)",
+                (action, str(roll_id), vi_tri, thoi_gian.isoformat(sep=' '), status))
+            return cursor.lastrowid
+
+    def requeue(self, seq):
+        """Đưa lần quét gửi trực tiếp không thành công về hàng chờ."""
+        with self._lock:
+            self.connection.execute("UPDATE SCANS SET STATUS = ? WHERE SEQ = ?", (PENDING, seq))
+
+    def complete(self, items):
+        """Ghi kết quả từ máy chủ cho các cặp (seq, ScanResult) trong một giao dịch."""
+        now = datetime.now().isoformat(sep=' ')
+        rows = [(APPLIED if result.ok else REJECTED, None if result.ok else result.reason,
+                 result.trang_thai, now, seq) for seq, result in items]
+        with self._lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                "UPDATE SCANS SET STATUS = ?, REASON = ?, TRANG_THAI = ?, SYNCED_AT = ? WHERE SEQ = ?", rows)
+            self.connection.execute("COMMIT")
+
+    def pending(self, limit=settings.SCAN_REPLAY_BATCH):
+        """Các lần quét chờ đồng bộ, theo đúng thứ tự đã quét: [(seq, action, roll_id, vi_tri, thoi_gian)]."""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT SEQ, ACTION, ROLL_ID, VI_TRI, THOI_GIAN FROM SCANS WHERE STATUS = ? ORDER BY SEQ LIMIT ?",
+                (PENDING, int(limit))).fetchall()
+        return [(seq, action, roll_id, vi_tri, datetime.fromisoformat(thoi_gian))
+                for seq, action, roll_id, vi_tri, thoi_gian in rows]
+
+    def pending_count(self, include_sending=True):
+        """Số lần quét chưa đồng bộ (kể cả đang gửi, trừ khi include_sending=False)."""
+        statuses = (PENDING, SENDING) if include_sending else (PENDING, PENDING)
+        with self._lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM SCANS WHERE STATUS IN (?, ?)", statuses).fetchone()[0]
+
+    def rejected(self, since=None):
+        """Các lần quét bị máy chủ từ chối khi đồng bộ lại (từ thời điểm since nếu có)."""
+        sql = "SELECT SEQ, ACTION, ROLL_ID, VI_TRI, THOI_GIAN, REASON, TRANG_THAI FROM SCANS WHERE STATUS = ?"
+        params = [REJECTED]
+        if since:
+            sql += " AND SYNCED_AT >= ?"
+            params.append(since.isoformat(sep=' '))
+        with self._lock:
+            return self.connection.execute(sql + " ORDER BY SEQ", params).fetchall()
+
+    def purge(self, keep_days=settings.SCAN_JOURNAL_KEEP_DAYS):
+        """Xóa các lần quét đã đồng bộ quá keep_days ngày."""
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat(sep=' ')
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM SCANS WHERE STATUS IN (?, ?) AND SYNCED_AT < ?", (APPLIED, REJECTED, cutoff))
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+def replay(token, report_progress, journal, engine, batch_size=settings.SCAN_REPLAY_BATCH):
+    """Đồng bộ các lần quét chờ lên máy chủ theo lô (chạy trong TaskManager).
+
+    Quy tắc xử lý xung đột cố định: các lần quét được áp dụng theo đúng thứ tự
+    quét, mỗi lần quét mang thời điểm quét gốc và đi qua cùng câu UPDATE có điều
+    kiện như khi quét trực tiếp. Nếu cuộn vải đã chuyển sang trạng thái khác
+    trong lúc mất kết nối (ví dụ trạm khác đã xuất kho) thì lần quét bị từ chối
+    kèm lý do, không ghi đè trạng thái mới hơn. Với chuyển vị trí, lần quét sau
+    cùng thắng. Lô bị máy chủ báo lỗi (không phải mất kết nối) được gửi lại
+    từng lần quét một; lần quét vẫn lỗi bị từ chối với lý do WRITE_FAILED để
+    không chặn hàng chờ mãi. Trả về (số lần quét thành công, số lần bị từ chối).
+    """
+    applied = rejected = 0
+    while True:
+        token.check()
+        batch = journal.pending(batch_size)
+        if not batch:
+            break
+        try:
+            results = engine.transition_many([scan[1:] for scan in batch])
+        except ConnectionError:
+            raise
+        except Exception:
+            results = replay_each(journal, engine, batch)
+        else:
+            journal.complete([(scan[0], result) for scan, result in zip(batch, results)])
+        for result in results:
+            if result.ok:
+                applied += 1
+            else:
+                rejected += 1
+        if len(batch) < batch_size:
+            break
+    report_progress(100)
+    return applied, rejected
+
+def replay_each(journal, engine, batch):
+    """Gửi lại từng lần quét của một lô bị lỗi, ghi kết quả vào nhật ký ngay sau mỗi lần.
+
+    Lô lỗi đã bị hủy cả câu lệnh nên không lần quét nào bị ghi trùng. Mất kết
+    nối giữa chừng thì ném ConnectionError, các lần quét chưa gửi vẫn PENDING.
+    """
+    results = []
+    for seq, action, roll_id, vi_tri, thoi_gian in batch:
+        try:
+            result = engine.transition(action, roll_id, vi_tri, thoi_gian)
+        except ConnectionError:
+            raise
+        except Exception:
+            result = ScanResult(action, roll_id, WRITE_FAILED)
+        journal.complete([(seq, result)])
+        results.append(result)
+    return results
@@ -0,0 +1,225 @@
+"""Dịch vụ HTTP cho máy quét cầm tay: xả vải, xuất kho, chuyển vị trí, tra cứu và tìm kiếm.
+
+Máy quét gọi thẳng dịch vụ này thay cho việc nhập mã vào ứng dụng trên máy tính.
+Các lần quét đến cùng lúc được gom thành một lô ghi (một giao dịch) nên số lượt
+ghi xuống máy chủ không tăng theo số máy quét.
+
+Cách dùng:
+    python scan_service.py                      # SQL Server theo file .env
+    python scan_service.py --sqlite kho.db      # SQLite cục bộ (kho vệ tinh, thử nghiệm)
+    python scan_service.py --host 0.0.0.0 --port 8000
+
+    POST /scan/xa_vai          {"id": "123"}
+    POST /scan/xuat_kho        {"id": "123"}
+    POST /scan/chuyen_vi_tri   {"id": "123", "vi_tri": "A01"}
+    GET  /rolls/123
+    GET  /locations/A01?nha_may=NT1
+    GET  /search/ton_kho?nha_may=NT1&style=...&after=<ID cuối trang trước>&limit=100
+    GET  /health
+"""
+import argparse
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager, suppress
+from datetime import date, datetime
+from typing import Optional
+
+import anyio
+from fastapi import FastAPI, HTTPException, Path, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from config import settings
+from query_builder import SEARCH_KINDS
+from repository import open_store
+from scan_engine import TRANSITIONS, MAX_ROLL_ID, LatencyStats
+
+class ScanRequest(BaseModel):
+    id: str
+    vi_tri: Optional[str] = None
+
+def scan_response(result):
+    return {
+        'id': result.roll_id,
+        'action': result.action,
+        'ok': result.ok,
+        'reason': result.reason,
+        'message': result.message,
+        'trang_thai': result.trang_thai,
+        'vi_tri': result.vi_tri,
+        'thoi_gian': result.thoi_gian,
+        'db_ms': round(result.db_ms, 1),
+    }
+
+class WriteBatcher():
+    """Gom các lần quét đang chờ thành một lô và ghi bằng store.transition_many.
+
+    Một tác vụ ghi duy nhất lấy mọi lần quét đang có trong hàng đợi (tối đa
+    max_batch) rồi ghi trên luồng riêng; lần quét đến trong lúc lô trước đang
+    ghi sẽ vào lô sau. Không chờ để gom lô: lúc vắng mỗi lần quét được ghi ngay,
+    lúc đông kích thước lô tăng thay cho độ dài hàng đợi. Khi cả lô lỗi (không
+    phải do mất kết nối), từng lần quét được ghi lại riêng để một mã quét hỏng
+    chỉ làm lỗi đúng yêu cầu của nó.
+    """
+    def __init__(self, store, max_batch=settings.SERVICE_WRITE_BATCH):
+        self.store = store
+        self.max_batch = max(1, max_batch)
+        self.queue = None
+        self.task = None
+        self.batches = 0
+        self.scans = 0
+        self.largest = 0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+    async def submit(self, action, roll_id, vi_tri=None):
+        """Xếp một lần quét vào lô kế tiếp và chờ kết quả (ScanResult)."""
+        future = asyncio.get_running_loop().create_future()
+        # Thời điểm quét là lúc máy quét gửi, không phải lúc lô được ghi
+        self.queue.put_nowait(((action, roll_id, vi_tri, datetime.now()), future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            results = await self._write([scan for scan, _ in batch])
+            self.batches += 1
+            self.scans += len(batch)
+            self.largest = max(self.largest, len(batch))
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue  # máy quét đã ngắt kết nối
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def _write(self, scans):
+        """Kết quả (ScanResult hoặc lỗi) của từng lần quét trong lô."""
+        try:
+            return await anyio.to_thread.run_sync(self.store.transition_many, scans)
+        except Exception as e:
+            if len(scans) == 1 or isinstance(e, ConnectionError):
+                return [e] * len(scans)
+        # Lô bị hủy cả giao dịch nên ghi lại từng lần quét không bị ghi trùng
+        results = []
+        for scan in scans:
+            try:
+                results.extend(await anyio.to_thread.run_sync(self.store.transition_many, [scan]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def snapshot(self):
+        return {
+            'batches': self.batches,
+            'scans': self.scans,
+            'avg_batch': round(self.scans / self.batches, 2) if self.batches else 0.0,
+            'max_batch': self.largest,
+            'waiting': self.queue.qsize() if self.queue is not None else 0,
+        }
+
+def create_app(store):
+    """Ứng dụng FastAPI trên kho dữ liệu store (SqlServerStore hoặc SqliteStore của repository)."""
+    batcher = WriteBatcher(store)
+    latency = {'scan': LatencyStats(), 'read': LatencyStats()}
+    # Số lượt đọc chạy song song bằng đúng số kết nối tối đa của pool, lượt đọc
+    # thừa chờ trong vòng lặp sự kiện thay vì giữ luồng chờ pool
+    readers = {}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        readers['limiter'] = anyio.CapacityLimiter(settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW)
+        batcher.start()
+        try:
+            yield
+        finally:
+            await batcher.stop()
+
+    app = FastAPI(title="Fb_Whs scan service", lifespan=lifespan)
+
+    async def read(fn, *args):
+        start = time.perf_counter()
+        try:
+            return await anyio.to_thread.run_sync(fn, *args, limiter=readers['limiter'])
+        finally:
+            latency['read'].record((time.perf_counter() - start) * 1000)
+
+    @app.exception_handler(ConnectionError)
+    async def connection_error(request: Request, e: ConnectionError):
+        return JSONResponse(status_code=503, content={'detail': str(e)})
+
+    @app.post("/scan/{action}")
+    async def scan(action: str, body: ScanRequest):
+        if action not in TRANSITIONS:
+            raise HTTPException(status_code=404, detail=f"Thao tác quét không hợp lệ: {action}")
+        start = time.perf_counter()
+        result = await batcher.submit(action, body.id, (body.vi_tri or '').strip() or None)
+        latency['scan'].record((time.perf_counter() - start) * 1000)
+        return scan_response(result)
+
+    @app.get("/rolls/{roll_id}")
+    async def get_roll(roll_id: int = Path(ge=0, le=MAX_ROLL_ID)):
+        roll = await read(store.get_roll, roll_id)
+        if roll is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy cuộn vải!")
+        return roll
+
+    @app.get("/locations/{vi_tri}")
+    async def rolls_at(vi_tri: str, nha_may: str):
+        rolls = await read(store.rolls_at, nha_may, vi_tri.strip())
+        return {'vi_tri': vi_tri.strip(), 'rolls': rolls}
+
+    @app.get("/search/{kind}")
+    async def search(kind: str, nha_may: str, tu_ngay: Optional[date] = None, den_ngay: Optional[date] = None,
+                     style: str = '', mo: str = '', lot: str = '', mau: str = '', vi_tri: str = '',
+                     after: Optional[int] = Query(None, ge=0, le=MAX_ROLL_ID),
+                     limit: Optional[int] = Query(None, ge=1)):
+        if kind not in SEARCH_KINDS:
+            raise HTTPException(status_code=404, detail=f"Loại tìm kiếm không hợp lệ: {kind}")
+        filters = {'tu_ngay': tu_ngay, 'den_ngay': den_ngay,
+                   'STYLE': style, 'MO': mo, 'LOT': lot, 'MAU': mau, 'VI_TRI': vi_tri}
+        return await read(store.search, kind, filters, nha_may, after, limit)
+
+    @app.get("/health")
+    async def health():
+        return {
+            'scan': latency['scan'].snapshot(),
+            'read': latency['read'].snapshot(),
+            'db': store.db_latency.snapshot(),
+            'writes': batcher.snapshot(),
+        }
+
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP cho máy quét cầm tay")
+    parser.add_argument("--sqlite", metavar="PATH", default=settings.LOCAL_DB_PATH,
+                        help="dùng cơ sở dữ liệu SQLite cục bộ thay cho SQL Server (mặc định LOCAL_DB_PATH)")
+    parser.add_argument("--host", default=settings.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVICE_PORT)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    store = open_store(args.sqlite)
+    try:
+        # Một tiến trình: lô ghi chỉ gom được khi mọi máy quét dùng chung một hàng đợi
+        uvicorn.run(create_app(store), host=args.host, port=args.port)
+    finally:
+        store.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from query_builder import build_search, parse_text_filter
+from table_models import build_result, HEADERS_TON_KHO, COT_ID, COT_SO_YARD
+
+# Cột trên bảng tồn kho của từng ô lọc (Style, MO, Lot, Màu, Vị trí)
+FILTER_COLUMNS = {'STYLE': 1, 'MO': 2, 'LOT': 5, 'MAU': 6, 'VI_TRI': 9}
+GRAM = 3                # độ dài n-gram của chỉ mục tìm chuỗi con
+LAST_CHAR = '\U0010ffff'  # lớn hơn mọi ký tự: cận trên khi tìm theo tiền tố
+
+def stock_query(nha_may):
+    """KeysetQuery toàn bộ tồn kho của nhà máy (không lọc chữ); dùng chung cho lần tải đầu và lấy thay đổi."""
+    return build_search('ton_kho', {}, nha_may)
+
+def normalize(value):
+    # So khớp không phân biệt hoa thường như collation của SQL Server
+    return '' if value is None else str(value).strip().upper()
+
+class ColumnIndex():
+    """Chỉ mục một cột chữ: mỗi dòng một mã trỏ vào mảng giá trị riêng biệt đã sắp xếp.
+
+    Điều kiện lọc chỉ được so trên các giá trị riêng biệt (ít hơn nhiều so với
+    số dòng): chính xác và bắt đầu bằng dùng tìm nhị phân, chứa dùng chỉ mục
+    n-gram. Mặt nạ theo dòng là một phép tra mảng hit[codes].
+    """
+    def __init__(self, codes, values, grams):
+        self.codes = codes
+        self.values = values
+        self.grams = grams
+
+    @classmethod
+    def build(cls, column):
+        codes, values = pd.factorize(pd.Series(column, dtype=object).map(normalize), sort=True)
+        values = np.asarray(values, dtype=object)
+        postings = {}
+        for code, value in enumerate(values):
+            for gram in {value[i:i + GRAM] for i in range(len(value) - GRAM + 1)}:
+                postings.setdefault(gram, []).append(code)
+        grams = {gram: np.array(members, dtype=np.int32) for gram, members in postings.items()}
+        return cls(codes.astype(np.int32), values, grams)
+
+    def take(self, rows):
+        """Chỉ mục của một phần các dòng (dùng chung giá trị và n-gram)."""
+        return ColumnIndex(self.codes[rows], self.values, self.grams)
+
+    def matches(self, mode, text):
+        """Mảng bool theo giá trị riêng biệt: giá trị nào khớp điều kiện (mode như parse_text_filter)."""
+        values = self.values
+        hit = np.zeros(len(values), dtype=bool)
+        if mode == 'exact':
+            index = int(np.searchsorted(values, text))
+            if index < len(values) and values[index] == text:
+                hit[index] = True
+        elif mode == 'prefix':
+            low, high = np.searchsorted(values, np.array([text, text + LAST_CHAR], dtype=object))
+            hit[low:high] = True
+        elif len(text) < GRAM:
+            hit[:] = np.fromiter((text in value for value in values), dtype=bool, count=len(values))
+        else:
+            # Giá trị chứa text phải chứa mọi n-gram của text; kiểm lại trên các ứng viên
+            postings = [self.grams.get(text[i:i + GRAM]) for i in range(len(text) - GRAM + 1)]
+            if any(posting is None for posting in postings):
+                return hit
+            candidates = reduce(np.intersect1d, sorted(postings, key=len))
+            hit[candidates] = np.fromiter((text in values[code] for code in candidates), dtype=bool,
+                                          count=len(candidates))
+        return hit
+
+    def mask(self, mode, text):
+        return self.matches(mode, text)[self.codes]
+
+class StockSnapshot():
+    """Tồn kho của một nhà máy trong bộ nhớ, lưu theo cột, để lọc ngay khi gõ.
+
+    Tải một lần (from_rows chạy ở luồng nền làm shape của truy vấn), sau đó
+    cập nhật theo thay đổi định kỳ (delta_refresh) bằng merged()/without().
+    filter() áp các ô lọc bằng mặt nạ NumPy trên chỉ mục từng cột, trả về các
+    dòng khớp cùng tổng số yard trong cùng một lượt. Mặt nạ của từng cột được
+    giữ lại nên khi gõ chỉ cột đang sửa phải tính lại. Một ảnh chụp không bị sửa
+    sau khi tạo (trừ row_version/nha_may) nên đọc được từ luồng nền.
+    """
+    def __init__(self, df, row_version=None, indexes=None):
+        self.df = df.reset_index(drop=True)
+        self.row_version = row_version  # mốc rowversion cho lần lấy thay đổi sau
+        self.nha_may = None
+        self.ids = pd.to_numeric(self.df.iloc[:, COT_ID]).to_numpy(dtype=np.int64)
+        self.yards = pd.to_numeric(self.df.iloc[:, COT_SO_YARD], errors='coerce').fillna(0).to_numpy(dtype=float)
+        if indexes is None:
+            indexes = {name: ColumnIndex.build(self.df.iloc[:, column].to_numpy())
+                       for name, column in FILTER_COLUMNS.items()}
+        self.indexes = indexes
+        self._masks = {}  # cột -> (điều kiện, mặt nạ) của lần lọc trước
+
+    @classmethod
+    def from_rows(cls, rows, row_version=None):
+        """Tạo ảnh chụp từ kết quả stock_query(...).all() (chạy ở luồng nền)."""
+        return cls(build_result(rows, HEADERS_TON_KHO)['df'], row_version)
+
+    def __len__(self):
+        return len(self.df)
+
+    def filter(self, filters):
+        """Áp bộ lọc {cột: nội dung ô lọc}, trả về (vị trí các dòng khớp, tổng số yard)."""
+        mask = None
+        for name, value in filters.items():
+            mode, text = parse_text_filter(value)
+            if mode is None or name not in self.indexes:
+                continue
+            condition = (mode, normalize(text))
+            cached = self._masks.get(name)
+            if cached is None or cached[0] != condition:
+                cached = self._masks[name] = (condition, self.indexes[name].mask(*condition))
+            mask = cached[1] if mask is None else mask & cached[1]
+        if mask is None:
+            return np.arange(len(self.df)), float(self.yards.sum())
+        rows = np.flatnonzero(mask)
+        return rows, float(self.yards[rows].sum())
+
+    def result(self, rows, tong_so_yards=0):
+        """Kết quả dạng build_result() của các dòng rows (để nạp vào RollTableModel)."""
+        df = self.df if len(rows) == len(self.df) else self.df.take(rows)
+        return {'df': df, 'highlight': None, 'tong_so_yards': tong_so_yards, 'row_version': self.row_version}
+
+    def merged(self, rows):
+        """Ảnh chụp mới sau khi gộp các dòng của delta_refresh.changes_query (cột cuối là cờ khớp).
+
+        Dùng làm shape của fetch_changes nên chạy ở luồng nền; dòng không còn
+        khớp (đã xả vải, xuất kho, đổi nhà máy) bị bỏ, dòng khớp được thay/thêm.
+        """
+        if not rows:
+            return self
+        changed = build_result(rows, HEADERS_TON_KHO)['df']
+        matches = np.array([bool(row[-1]) for row in rows], dtype=bool)
+        changed_ids = pd.to_numeric(changed.iloc[:, COT_ID]).to_numpy(dtype=np.int64)
+        df = pd.concat([self.df[~np.isin(self.ids, changed_ids)], changed[matches]], ignore_index=True)
+        ids = pd.to_numeric(df.iloc[:, COT_ID]).to_numpy(dtype=np.int64)
+        return StockSnapshot(df.take(np.argsort(ids, kind='stable')), self.row_version)
+
+    def without(self, ids):
+        """Ảnh chụp bỏ các cuộn có ID trong ids (đã xóa), giữ nguyên chỉ mục."""
+        keep = ~np.isin(self.ids, np.asarray(list(ids), dtype=np.int64))
+        if keep.all():
+            return self
+        return StockSnapshot(self.df[keep], self.row_version,
+                             {name: index.take(keep) for name, index in self.indexes.items()})
+
+    def snapshot(self):
+        return {'rolls': len(self.df), 'yards': round(float(self.yards.sum()), 2), 'row_version': self.row_version}
@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QBrush, QColor, QStandardItem, QStandardItemModel
+
+# Tiêu đề cột của các bảng kết quả
+HEADERS_NHAP_KHO = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID','Thời gian xả vải','Thời gian xuất kho','Trạng thái']
+HEADERS_XA_VAI = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID','Thời gian xả vải','Số giờ xả']
+HEADERS_XUAT_KHO = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID','Thời gian xả vải','Thời gian xuất kho']
+HEADERS_TON_KHO = ['Ngày nhận','Style','MO','Loại vải','ĐVT','Lot','Màu','Cuộn số','Số yard','Vị trí','ID']
+
+COT_SO_YARD = 8
+COT_ID = 10
+COT_TRANG_THAI = 13  # chỉ có trên bảng Nhập kho
+
+def build_result(rows, headers, hours_col=None, yard_col=None, row_version=None):
+    """Chuyển kết quả truy vấn thành DataFrame dạng cột (chạy ở luồng nền).
+
+    Dữ liệu giữ nguyên kiểu gốc (dtype=object), chỉ định dạng khi ô được vẽ.
+    hours_col: cột số giờ xả, các dòng >= 24 giờ được tô màu.
+    yard_col: cột số yard, cộng tổng để hiển thị.
+    row_version: mốc rowversion lúc truy vấn (xem delta_refresh.py).
+    """
+    width = len(headers)
+    df = pd.DataFrame([tuple(row)[:width] for row in rows], columns=headers, dtype=object)
+    highlight = None
+    if hours_col is not None:
+        highlight = (pd.to_numeric(df.iloc[:, hours_col], errors='coerce') >= 24).to_numpy()
+    tong_so_yards = 0
+    if yard_col is not None:
+        tong_so_yards = pd.to_numeric(df.iloc[:, yard_col], errors='coerce').sum()
+    return {'df': df, 'highlight': highlight, 'tong_so_yards': tong_so_yards, 'row_version': row_version}
+
+def _runs(rows):
+    """Các đoạn liên tiếp [dòng bắt đầu, số dòng] của danh sách vị trí đã sắp xếp."""
+    runs = []
+    for row in rows:
+        if runs and runs[-1][0] + runs[-1][1] == row:
+            runs[-1][1] += 1
+        else:
+            runs.append([int(row), 1])
+    return runs
+
+def _flags(highlight, length):
+    return highlight if highlight is not None else np.zeros(length, dtype=bool)
+
+class RollTableModel(QAbstractTableModel):
+    """Model cho bảng cuộn vải, dữ liệu lưu theo cột (mảng NumPy).
+
+    View chỉ hỏi dữ liệu của các ô đang hiển thị nên chi phí không phụ thuộc
+    vào số dòng kết quả. Khi có page_loader, view tự gọi fetchMore() để tải
+    trang tiếp theo lúc người dùng cuộn tới cuối bảng.
+    """
+    HIGHLIGHT_COLOR = "#008a10"
+
+    def __init__(self, headers, parent=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self._highlight_brush = QBrush(QColor(self.HIGHLIGHT_COLOR))
+        self.query = None          # truy vấn tạo ra dữ liệu hiện tại
+        self.total = None          # tổng số dòng của truy vấn (từ câu COUNT)
+        self.page_loader = None    # hàm tải trang tiếp theo (chạy nền)
+        self.row_version = None    # mốc rowversion của dữ liệu đang hiển thị
+        self.refresh_changes = None  # hàm lấy các dòng thay đổi kể từ row_version (chạy nền)
+        self._has_more = False
+        self._loading = False
+        self._set_frame(pd.DataFrame(columns=self.headers, dtype=object), None)
+
+    def _set_frame(self, df, highlight):
+        self._df = df.reset_index(drop=True)
+        self._columns = [self._df.iloc[:, i].to_numpy() for i in range(len(self.headers))]
+        self._highlight = highlight
+
+    # --- API của QAbstractTableModel ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._df)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            value = self._columns[index.column()][index.row()]
+            return "" if value is None else str(value)
+        if role == Qt.BackgroundRole and self._highlight is not None and self._highlight[index.row()]:
+            return self._highlight_brush
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return (not parent.isValid() and self._has_more and not self._loading
+                and self.page_loader is not None)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._loading = True
+            self.page_loader()
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if row < 0 or count <= 0 or row + count > len(self._df):
+            return False
+        keep = np.ones(len(self._df), dtype=bool)
+        keep[row:row + count] = False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        self._set_frame(self._df[keep], None if self._highlight is None else self._highlight[keep])
+        self.endRemoveRows()
+        return True
+
+    # --- Nạp và đọc dữ liệu ---
+    def set_result(self, result, has_more=False):
+        """Thay toàn bộ dữ liệu bằng kết quả từ build_result()."""
+        self.beginResetModel()
+        self._set_frame(result['df'], result.get('highlight'))
+        self.set_has_more(has_more)
+        self.endResetModel()
+
+    def append_result(self, result, has_more=False):
+        """Nối thêm một trang kết quả vào cuối bảng."""
+        df = result['df']
+        if len(df):
+            first = len(self._df)
+            self.beginInsertRows(QModelIndex(), first, first + len(df) - 1)
+            highlight = self._highlight
+            if highlight is not None or result.get('highlight') is not None:
+                old = highlight if highlight is not None else np.zeros(first, dtype=bool)
+                new = result.get('highlight')
+                new = new if new is not None else np.zeros(len(df), dtype=bool)
+                highlight = np.concatenate([old, new])
+            self._set_frame(pd.concat([self._df, df], ignore_index=True), highlight)
+            self.endInsertRows()
+        self.set_has_more(has_more)
+
+    def merge_changes(self, result, matches, deleted=()):
+        """Gộp các dòng đã thay đổi trên máy chủ vào bảng, giữ thứ tự theo ID.
+
+        result là kết quả build_result() của các dòng đã thay đổi, matches[i]
+        cho biết dòng i còn khớp bộ lọc hay không, deleted là ID các dòng đã bị
+        xóa. Dòng không còn khớp hoặc đã xóa được bỏ khỏi bảng, dòng đang hiển
+        thị được sửa tại chỗ, dòng mới được chèn đúng vị trí (vùng chọn và vị
+        trí cuộn được giữ nguyên). Khi còn trang chưa tải, dòng mới nằm sau
+        trang cuối được bỏ qua vì sẽ có khi tải trang đó.
+        Trả về (số dòng thêm, số dòng sửa, số dòng xóa).
+        """
+        df = result['df'].reset_index(drop=True)
+        new_highlight = result.get('highlight')
+        matches = np.asarray(matches, dtype=bool)
+        changed = df.iloc[:, COT_ID].to_numpy().astype(np.int64)
+
+        # Bỏ các dòng đã xóa hoặc không còn khớp bộ lọc
+        gone = np.concatenate([np.asarray(list(deleted), dtype=np.int64), changed[~matches]])
+        rows = np.flatnonzero(np.isin(self._columns[COT_ID].astype(np.int64), gone))
+        for start, count in reversed(_runs(rows)):
+            self.removeRows(start, count)
+
+        # Sửa tại chỗ các dòng đang hiển thị
+        ids = self._columns[COT_ID].astype(np.int64)
+        positions = np.searchsorted(ids, changed)
+        present = np.zeros(len(changed), dtype=bool)
+        if len(ids):
+            present = matches & (positions < len(ids)) & (ids[np.minimum(positions, len(ids) - 1)] == changed)
+        if present.any():
+            targets = positions[present]
+            frame = self._df.copy()
+            frame.iloc[targets] = df[present].to_numpy()
+            highlight = self._highlight
+            if highlight is not None or new_highlight is not None:
+                highlight = _flags(highlight, len(frame)).copy()
+                highlight[targets] = _flags(new_highlight, len(df))[present]
+            self._set_frame(frame, highlight)
+            self.dataChanged.emit(self.index(int(targets.min()), 0),
+                                  self.index(int(targets.max()), len(self.headers) - 1))
+
+        # Chèn dòng mới, mỗi cụm dòng cùng vị trí một lần (từ cuối lên để vị trí phía trên không đổi)
+        new = matches & ~present
+        if self._has_more:
+            new &= changed < (ids[-1] if len(ids) else 0)
+        order = np.flatnonzero(new)
+        order = order[np.argsort(changed[order], kind='stable')]
+        inserts = np.searchsorted(ids, changed[order])
+        for position in np.unique(inserts)[::-1]:
+            block = order[inserts == position]
+            position = int(position)
+            self.beginInsertRows(QModelIndex(), position, position + len(block) - 1)
+            highlight = self._highlight
+            if highlight is not None or new_highlight is not None:
+                highlight = _flags(highlight, len(self._df))
+                highlight = np.concatenate([highlight[:position], _flags(new_highlight, len(df))[block],
+                                            highlight[position:]])
+            self._set_frame(pd.concat([self._df.iloc[:position], df.iloc[block], self._df.iloc[position:]],
+                                      ignore_index=True), highlight)
+            self.endInsertRows()
+        return len(order), int(present.sum()), len(rows)
+
+    def set_has_more(self, has_more):
+        self._has_more = has_more
+        self._loading = False
+
+    def has_more(self):
+        """Còn trang chưa tải về hay không."""
+        return self._has_more
+
+    def last_value(self, column):
+        return self._columns[column][-1] if len(self._df) else None
+
+    def clear(self):
+        self.beginResetModel()
+        self._set_frame(pd.DataFrame(columns=self.headers, dtype=object), None)
+        self.set_has_more(False)
+        self.endResetModel()
+
+    def value(self, row, column):
+        return self._columns[column][row]
+
+    def text(self, row, column):
+        value = self._columns[column][row]
+        return "" if value is None else str(value)
+
+    def column_values(self, column):
+        return self._columns[column]
+
+    def column_sum(self, column):
+        return pd.to_numeric(pd.Series(self._columns[column]), errors='coerce').sum()
+
+class GroupItem(QStandardItem):
+    """Một nhóm trong cây tổng hợp; path là điều kiện {cột: giá trị} từ gốc tới nhóm."""
+    def __init__(self, text, path):
+        super().__init__(text)
+        self.path = path
+        self.loaded = False
+        self.setEditable(False)
+
+class StockSummaryModel(QStandardItemModel):
+    """Cây tổng hợp tồn kho theo nhiều cấp nhóm.
+
+    Mỗi nhóm hiện số cuộn và tổng số yard do máy chủ tính sẵn; nhóm con (hoặc
+    danh sách cuộn vải ở cấp cuối) chỉ được tải khi người dùng mở rộng nhóm.
+    """
+    HEADERS = ['Nhóm', 'Số cuộn', 'Số yard']
+    PLACEHOLDER = "Đang tải..."
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setHorizontalHeaderLabels(self.HEADERS)
+        self.levels = []
+        self.generation = 0  # tăng mỗi lần tải lại, dùng để bỏ kết quả cũ
+
+    def reset(self, levels):
+        self.generation += 1
+        self.levels = list(levels)
+        self.removeRows(0, self.rowCount())
+
+    def _number_item(self, text):
+        item = QStandardItem(text)
+        item.setEditable(False)
+        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        return item
+
+    def _take_placeholder(self, parent_item):
+        if parent_item is not None and parent_item.rowCount():
+            parent_item.removeRows(0, parent_item.rowCount())
+
+    def add_groups(self, parent_item, rows):
+        """Thêm các nhóm (kết quả aggregates.summary_rows) dưới parent_item (None là gốc)."""
+        self._take_placeholder(parent_item)
+        path = parent_item.path if parent_item is not None else {}
+        column = self.levels[len(path)]
+        root = parent_item if parent_item is not None else self.invisibleRootItem()
+        for row in rows:
+            value = row[column]
+            item = GroupItem("(trống)" if value in (None, '') else str(value), {**path, column: value})
+            # Con giả để cây hiện mũi tên mở rộng trước khi tải dữ liệu thật
+            item.appendRow(QStandardItem(self.PLACEHOLDER))
+            root.appendRow([item,
+                            self._number_item(f"{row['SO_CUON']:,}"),
+                            self._number_item(f"{row['SO_YARD'] or 0:,.2f}")])
+
+    def add_rolls(self, parent_item, df):
+        """Thêm danh sách cuộn vải (DataFrame theo HEADERS_TON_KHO) dưới nhóm cấp cuối."""
+        self._take_placeholder(parent_item)
+        ids = df.iloc[:, COT_ID].to_numpy()
+        cuon_so = df.iloc[:, 7].to_numpy()
+        vi_tri = df.iloc[:, 9].to_numpy()
+        yards = df.iloc[:, COT_SO_YARD].to_numpy()
+        for i in range(len(df)):
+            text = f"ID {ids[i]} - Cuộn {cuon_so[i]}"
+            if vi_tri[i]:
+                text += f" - {vi_tri[i]}"
+            item = QStandardItem(text)
+            item.setEditable(False)
+            parent_item.appendRow([item, self._number_item("1"),
+                                   self._number_item(f"{yards[i] or 0:,.2f}")])
+
+    def is_leaf_level(self, item):
+        return len(item.path) >= len(self.levels)
@@ -0,0 +1,189 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from config import settings
+
+class _NullSpan():
+    """Span khi tắt ghi vết: không đo, không ghi (chi phí chỉ là một lần gọi hàm)."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span():
+    """Một khoảng thời gian được đo (kèm số dòng và thuộc tính khác), lồng nhau theo từng luồng."""
+    __slots__ = ('tracer', 'name', 'attrs', 'parent', 'profile', 'start')
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.profile = self.tracer._start_profile(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self.start) * 1000
+        if self.profile is not None:
+            self.tracer._stop_profile(self.profile, self.name)
+        self.tracer._stack().pop()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.record(self.name, ms, parent=self.parent, **self.attrs)
+        return False
+
+class Tracer():
+    """Đo thời gian các thao tác (kết nối, truy vấn, lấy dữ liệu, hiển thị, xuất file, in tem, quét).
+
+    Mỗi span được ghi một dòng JSON vào file log xoay vòng và giữ các lần đo gần
+    nhất theo tên để xem p50/p95 trên tab chẩn đoán. Khi tắt (mặc định),
+    span() trả về NULL_SPAN dùng chung nên gần như không tốn gì trên các đường
+    nóng. profile_next(tên) bật cProfile cho đúng một lần chạy kế tiếp của span
+    đó (kể cả khi đang tắt ghi vết) và lưu kết quả cạnh file log.
+    """
+    def __init__(self, enabled=settings.TRACE_ENABLED, path=settings.TRACE_LOG_PATH,
+                 max_bytes=settings.TRACE_LOG_MB * 1024 * 1024, backups=settings.TRACE_LOG_BACKUPS, keep=500):
+        self.enabled = enabled
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._samples = {}  # tên -> deque[(ms, số dòng)]
+        self._logger = None
+        self._armed = None  # tên span sẽ được chạy cProfile ở lần kế tiếp
+        self.last_profile = None  # đường dẫn file kết quả cProfile gần nhất
+
+    def span(self, name, **attrs):
+        """Context manager đo một thao tác; span.set(rows=...) để ghi thêm số dòng."""
+        if not self.enabled and self._armed is None:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def annotate(self, **attrs):
+        """Gắn thuộc tính (vd. rows) vào span đang mở của luồng hiện tại."""
+        if self.enabled:
+            stack = self._stack()
+            if stack:
+                stack[-1].attrs.update(attrs)
+
+    def record(self, name, ms, parent=None, **attrs):
+        """Ghi một lần đo đã có sẵn thời gian (ms)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.keep)
+            samples.append((ms, attrs.get('rows')))
+        entry = {'time': datetime.now().isoformat(timespec='milliseconds'), 'span': name, 'ms': round(ms, 3),
+                 'parent': parent, 'thread': threading.current_thread().name}
+        entry.update(attrs)
+        self._log().info(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _log(self):
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups,
+                                                  encoding='utf-8', delay=True)
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger = logging.getLogger("Fb_Whs.trace")
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                    logger.addHandler(handler)
+                    self._logger = logger
+        return self._logger
+
+    # --- cProfile cho một thao tác ---
+    def profile_next(self, name):
+        """Chạy cProfile cho lần kế tiếp của span name (None để hủy)."""
+        with self._lock:
+            self._armed = name
+
+    @property
+    def armed(self):
+        return self._armed
+
+    def _start_profile(self, name):
+        if self._armed != name:
+            return None
+        with self._lock:
+            if self._armed != name:
+                return None
+            self._armed = None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # luồng này đang có profiler khác
+        return profile
+
+    def _stop_profile(self, profile, name):
+        profile.disable()
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(os.path.dirname(os.path.abspath(self.path)),
+                            f"profile_{name.replace('/', '_')}_{stamp}")
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        profile.dump_stats(f"{base}.prof")
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(40)
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+        self.last_profile = f"{base}.prof"
+
+    # --- Thống kê cho tab chẩn đoán ---
+    def names(self):
+        with self._lock:
+            return sorted(self._samples)
+
+    def stats(self):
+        """{tên: {'count', 'p50_ms', 'p95_ms', 'max_ms', 'rows'}} của các lần đo gần nhất (rows: trung vị)."""
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+        stats = {}
+        for name, samples in snapshot.items():
+            times = sorted(ms for ms, _ in samples)
+            rows = [count for _, count in samples if count is not None]
+            pick = lambda q: round(times[min(len(times) - 1, int(q * len(times)))], 1)
+            stats[name] = {'count': len(times), 'p50_ms': pick(0.5), 'p95_ms': pick(0.95),
+                           'max_ms': round(times[-1], 1), 'rows': int(statistics.median(rows)) if rows else None}
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+tracer = Tracer()
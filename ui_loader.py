@@ -0,0 +1,55 @@
+"""Biên dịch Fb_Whs.ui thành module Python Fb_Whs_ui.py để lúc khởi động không phải đọc XML.
+
+Chạy lại mỗi khi sửa Fb_Whs.ui (và trước khi đóng gói bằng PyInstaller).
+Module sinh ra ghi lại mã băm của file .ui; nếu file .ui đã thay đổi sau lần
+biên dịch, load_ui() tự quay về dùng loadUiType nên không bao giờ hiện giao
+diện cũ.
+
+    python ui_loader.py
+"""
+import hashlib
+import io
+import os
+import re
+import sys
+
+from config import get_resource_path
+
+UI_FILE = 'Fb_Whs.ui'
+UI_MODULE_FILE = 'Fb_Whs_ui.py'
+
+def ui_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def load_ui(ui_file=UI_FILE):
+    """Trả về lớp giao diện (có setupUi), ưu tiên module đã biên dịch sẵn."""
+    path = get_resource_path(ui_file)
+    try:
+        import Fb_Whs_ui
+    except ImportError:
+        Fb_Whs_ui = None
+    if Fb_Whs_ui is not None and (not os.path.exists(path) or Fb_Whs_ui.UI_HASH == ui_hash(path)):
+        return Fb_Whs_ui.FORM_CLASS
+    from PyQt5.uic import loadUiType
+    return loadUiType(path)[0]
+
+def compile_ui(ui_file=UI_FILE, module_file=UI_MODULE_FILE):
+    from PyQt5.uic import compileUi
+    code = io.StringIO()
+    with open(ui_file, encoding='utf-8') as f:
+        compileUi(f, code)
+    source = code.getvalue()
+    form_class = re.search(r'^class (Ui_\w+)\(', source, re.MULTILINE).group(1)
+    with open(module_file, 'w', encoding='utf-8') as f:
+        f.write(source)
+        f.write(f"\nFORM_CLASS = {form_class}\n")
+        f.write(f"UI_HASH = '{ui_hash(ui_file)}'\n")
+    return module_file
+
+def main():
+    print(f"Đã tạo {compile_ui()}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
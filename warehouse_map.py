@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import tempfile
+
+from PyQt5.QtCore import QUrl
+from PyQt5.QtWidgets import QComboBox, QHBoxLayout, QLabel, QVBoxLayout, QWidget
+
+from aggregates import summary_query, summary_rows
+
+# Thư mục chứa trang sơ đồ và file plotly.js dùng chung (ghi một lần)
+MAP_DIR = os.path.join(tempfile.gettempdir(), "Fb_Whs_map")
+DIV_ID = 'so_do_kho'
+METRICS = ['Số cuộn', 'Số yard']
+OTHER_ROW = 'Khác'
+# Mã vị trí: phần trước số cuối cùng là dãy (hàng trên sơ đồ), số cuối cùng là ô (cột)
+LOCATION_PATTERN = re.compile(r'^(.*?)(\d+)\D*$')
+
+def parse_location(code):
+    """Tách mã vị trí thành (dãy, số ô), ví dụ A01 -> (A, 1), K1-05 -> (K1, 5). None nếu không tách được."""
+    match = LOCATION_PATTERN.match(code)
+    if match is None:
+        return None
+    return match.group(1).rstrip('-_./ ') or '#', int(match.group(2))
+
+def location_query(nha_may):
+    """Một câu GROUP BY VI_TRI: số cuộn và tổng số yard tồn kho ở từng vị trí."""
+    return summary_query('ton_kho', {}, nha_may, ['VI_TRI'])
+
+def location_values(rows):
+    """{vị trí: (số cuộn, số yard)} từ kết quả location_query (chạy ở luồng nền); bỏ cuộn chưa có vị trí."""
+    values = {}
+    for row in summary_rows(rows, ['VI_TRI']):
+        code = (row['VI_TRI'] or '').strip()
+        if code:
+            count, yards = values.get(code, (0, 0.0))
+            values[code] = (count + row['SO_CUON'], yards + float(row['SO_YARD'] or 0))
+    return values
+
+class MapLayout():
+    """Vị trí (hàng, cột) của từng ô trên sơ đồ, tính một lần từ danh sách mã vị trí.
+
+    Ô đã có trên sơ đồ được giữ nguyên dù hết cuộn vải; chỉ khi xuất hiện mã vị
+    trí mới thì mới phải tính lại sơ đồ.
+    """
+    def __init__(self, codes):
+        self.codes = frozenset(codes)
+        parsed = {code: parse_location(code) for code in self.codes}
+        rows = sorted({p[0] for p in parsed.values() if p is not None})
+        columns = sorted({p[1] for p in parsed.values() if p is not None})
+        row_index = {row: i for i, row in enumerate(rows)}
+        column_index = {column: i for i, column in enumerate(columns)}
+        self.positions = {}
+        taken = set()
+        others = []
+        for code in sorted(self.codes):
+            p = parsed[code]
+            cell = None if p is None else (row_index[p[0]], column_index[p[1]])
+            if cell is None or cell in taken:
+                others.append(code)  # mã không theo quy ước hoặc trùng ô
+            else:
+                self.positions[code] = cell
+                taken.add(cell)
+        self.row_labels = rows
+        self.column_labels = [str(column) for column in columns]
+        if others:
+            self.row_labels.append(OTHER_ROW)
+            # Cột thêm cho hàng "Khác" đánh số tiếp sau số ô lớn nhất để không trùng
+            # nhãn (trục category của plotly gộp các cột cùng nhãn)
+            extra = (columns[-1] if columns else 0) + 1
+            while len(self.column_labels) < len(others):
+                self.column_labels.append(str(extra))
+                extra += 1
+            for i, code in enumerate(others):
+                self.positions[code] = (len(self.row_labels) - 1, i)
+
+    def covers(self, codes):
+        return self.codes.issuperset(codes)
+
+    def grids(self, values):
+        """Các mảng hai chiều của heatmap: số cuộn, số yard, mã vị trí và [số cuộn, số yard] khi rê chuột."""
+        shape = range(len(self.row_labels)), range(len(self.column_labels))
+        counts = [[None for _ in shape[1]] for _ in shape[0]]
+        yards = [[None for _ in shape[1]] for _ in shape[0]]
+        text = [['' for _ in shape[1]] for _ in shape[0]]
+        custom = [[None for _ in shape[1]] for _ in shape[0]]
+        for code, (r, c) in self.positions.items():
+            count, yard = values.get(code, (0, 0.0))
+            counts[r][c] = count
+            yards[r][c] = round(yard, 2)
+            text[r][c] = code
+            custom[r][c] = [count, round(yard, 2)]
+        return counts, yards, text, custom
+
+def changed_cells(layout, old, new):
+    """Các ô có số liệu thay đổi: [hàng, cột, số cuộn, số yard]."""
+    cells = []
+    for code in old.keys() | new.keys():
+        value = new.get(code, (0, 0.0))
+        if old.get(code, (0, 0.0)) != value:
+            r, c = layout.positions[code]
+            cells.append([r, c, value[0], round(value[1], 2)])
+    return cells
+
+# Cập nhật tại chỗ các ô thay đổi, không dựng lại cả biểu đồ
+UPDATE_SCRIPT = """
+var soDo = document.getElementById('{plot_id}');
+soDo.chiSo = 0;
+soDo.giaTri = [soDo.data[0].z, {yards}];
+window.chonChiSo = function(chiSo) {
+    soDo.chiSo = chiSo;
+    Plotly.restyle(soDo, {z: [soDo.giaTri[chiSo]]});
+};
+window.capNhatO = function(cells) {
+    var custom = soDo.data[0].customdata;
+    cells.forEach(function(o) {
+        soDo.giaTri[0][o[0]][o[1]] = o[2];
+        soDo.giaTri[1][o[0]][o[1]] = o[3];
+        custom[o[0]][o[1]] = [o[2], o[3]];
+    });
+    Plotly.restyle(soDo, {z: [soDo.giaTri[soDo.chiSo]], customdata: [custom]});
+};
+"""
+
+def write_page(token, report_progress, layout, values, title, path):
+    """Dựng trang HTML của sơ đồ bằng plotly và ghi ra path (chạy trong TaskManager)."""
+    import plotly
+    import plotly.graph_objects as go
+    counts, yards, text, custom = layout.grids(values)
+    token.check()
+    # Chỉ nạp thư viện plotly.js từ file cạnh trang (ghi một lần cho mỗi phiên bản)
+    script = f"plotly-{plotly.__version__}.min.js"
+    script_path = os.path.join(os.path.dirname(path), script)
+    if not os.path.exists(script_path):
+        from plotly.offline import get_plotlyjs
+        with open(f"{script_path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+        os.replace(f"{script_path}.tmp", script_path)
+    heatmap = go.Heatmap(
+        z=counts, x=layout.column_labels, y=layout.row_labels, text=text, customdata=custom,
+        colorscale='YlOrRd', xgap=2, ygap=2, hoverongaps=False,
+        hovertemplate="%{text}<br>Số cuộn: %{customdata[0]}<br>Số yard: %{customdata[1]:,.2f}<extra></extra>",
+    )
+    figure = go.Figure(heatmap)
+    figure.update_layout(title=title, template='plotly_dark', margin=dict(l=60, r=20, t=50, b=40),
+                         yaxis=dict(autorange='reversed', type='category'), xaxis=dict(type='category'))
+    token.check()
+    # Số yard của từng ô được giữ trong trang để đổi chỉ số không cần hỏi lại máy chủ
+    html = figure.to_html(include_plotlyjs=script, div_id=DIV_ID, config={'displaylogo': False},
+                          post_script=UPDATE_SCRIPT.replace('{yards}', json.dumps(yards)))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    report_progress(100)
+    return path
+
+class WarehouseMapView(QWidget):
+    """Sơ đồ kho dạng heatmap (số cuộn / số yard theo vị trí).
+
+    Sơ đồ (vị trí các ô) được tính một lần và chỉ tính lại khi có mã vị trí
+    mới; các lần làm mới sau chỉ gửi các ô thay đổi sang trang đang hiển thị.
+    Trang được dựng ở luồng nền qua task_manager.
+    """
+    def __init__(self, task_manager, key, title, parent=None):
+        super().__init__(parent)
+        self.task_manager = task_manager
+        self.key = key
+        self.title = title
+        self.layout_map = None
+        self.values = {}   # số liệu mới nhất từ máy chủ
+        self.shown = None  # số liệu trang đang hiển thị (None khi trang chưa sẵn sàng)
+        self._building = {}  # số liệu của trang đang dựng
+        self.path = os.path.join(MAP_DIR, f"{key}.html")
+        self.metric = QComboBox(self)
+        self.metric.addItems(METRICS)
+        self.status = QLabel(self)
+        toolbar = QHBoxLayout()
+        toolbar.addWidget(self.metric)
+        toolbar.addWidget(self.status, 1)
+        box = QVBoxLayout(self)
+        box.setContentsMargins(0, 0, 0, 0)
+        box.addLayout(toolbar)
+        try:
+            from PyQt5.QtWebEngineWidgets import QWebEngineView
+        except ImportError:
+            self.view = None
+            box.addWidget(QLabel("Cần cài đặt PyQtWebEngine để xem sơ đồ kho!", self), 1)
+        else:
+            self.view = QWebEngineView(self)
+            self.view.loadFinished.connect(self._page_loaded)
+            box.addWidget(self.view, 1)
+        self.metric.currentIndexChanged.connect(self._choose_metric)
+
+    def set_values(self, values):
+        """Hiển thị số liệu mới: dựng lại trang nếu có vị trí mới, nếu không chỉ cập nhật các ô thay đổi."""
+        self.values = values
+        so_cuon = sum(count for count, _ in values.values())
+        self.status.setText(f"{len(values)} vị trí có vải, {so_cuon:,} cuộn")
+        if self.view is None:
+            return
+        if self.layout_map is None or not self.layout_map.covers(values):
+            codes = set(values) | (self.layout_map.codes if self.layout_map is not None else set())
+            self.layout_map = MapLayout(codes)
+            self.shown = None
+            self._building = dict(values)
+            os.makedirs(MAP_DIR, exist_ok=True)
+            self.task_manager.submit(f"{self.key}_trang", write_page, self.layout_map, self._building, self.title,
+                                     self.path, on_result=self._show_page, on_error=self._page_error)
+            return
+        if self.shown is None:
+            return  # trang đang dựng, cập nhật khi tải xong
+        cells = changed_cells(self.layout_map, self.shown, values)
+        if cells:
+            self.view.page().runJavaScript(f"capNhatO({json.dumps(cells)});")
+            self.shown = dict(values)
+
+    def _show_page(self, path):
+        self.view.load(QUrl.fromLocalFile(path))
+
+    def _page_loaded(self, ok):
+        if not ok:
+            self.status.setText("Không thể hiển thị sơ đồ kho!")
+            return
+        self.shown = self._building
+        if self.metric.currentIndex():
+            self._choose_metric(self.metric.currentIndex())
+        # Số liệu mới đến trong lúc dựng trang
+        self.set_values(self.values)
+
+    def _page_error(self, e):
+        self.layout_map = None
+        self.status.setText(f"Không thể dựng sơ đồ kho: {e}")
+
+    def _choose_metric(self, index):
+        if self.view is not None and self.shown is not None:
+            self.view.page().runJavaScript(f"chonChiSo({int(index)});")
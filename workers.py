@@ -0,0 +1,171 @@
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from database import ket_noi_db
+from tracing import tracer
+
+FETCH_BATCH = 2000  # số dòng lấy về mỗi lần fetchmany
+
+class CancelledError(Exception):
+    """Tác vụ đã bị hủy (thường do có lượt tìm kiếm mới hơn trên cùng tab)."""
+
+class CancelToken():
+    """Cờ hủy dùng chung giữa luồng giao diện và luồng nền."""
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._cursor = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        # Hủy luôn câu lệnh SQL đang chạy trên máy chủ (nếu có)
+        with self._lock:
+            cursor = self._cursor
+        if cursor is not None:
+            try:
+                cursor.cancel()
+            except Exception:
+                pass
+
+    def attach(self, cursor):
+        with self._lock:
+            self._cursor = cursor
+
+    def check(self):
+        if self._event.is_set():
+            raise CancelledError()
+
+class WorkerSignals(QObject):
+    progress = pyqtSignal(int)
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    finished = pyqtSignal()
+
+class Worker(QRunnable):
+    """Chạy hàm fn(token, report_progress, *args) trên QThreadPool, trả kết quả qua signal."""
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.name = getattr(fn, '__name__', 'task')
+        self.args = args
+        self.kwargs = kwargs
+        self.token = CancelToken()
+        self.signals = WorkerSignals()
+
+    def report_progress(self, value):
+        if not self.token.cancelled:
+            self.signals.progress.emit(int(value))
+
+    def run(self):
+        try:
+            with tracer.span(f"task.{self.name}"):
+                result = self.fn(self.token, self.report_progress, *self.args, **self.kwargs)
+            if not self.token.cancelled:
+                self.signals.result.emit(result)
+        except CancelledError:
+            pass
+        except Exception as e:
+            if not self.token.cancelled:
+                traceback.print_exc()
+                self.signals.error.emit(e)
+        finally:
+            self.signals.finished.emit()
+
+class TaskManager(QObject):
+    """Quản lý tác vụ nền theo khóa (mỗi tab một khóa).
+
+    Gửi tác vụ mới với cùng khóa sẽ hủy tác vụ cũ đang chạy, kết quả của
+    tác vụ cũ bị bỏ qua.
+    """
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self._running = {}
+        self._alive = set()  # giữ tham chiếu tới worker cho tới khi chạy xong
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None, on_progress=None, on_finished=None, **kwargs):
+        self.cancel(key)
+        worker = Worker(fn, *args, **kwargs)
+        worker.name = key
+        if on_result:
+            # Bỏ qua kết quả đã nằm trong hàng đợi sự kiện của tác vụ vừa bị hủy
+            worker.signals.result.connect(lambda result: None if worker.token.cancelled else on_result(result))
+        if on_error:
+            worker.signals.error.connect(on_error)
+        if on_progress:
+            worker.signals.progress.connect(on_progress)
+        if on_finished:
+            worker.signals.finished.connect(on_finished)
+        worker.signals.finished.connect(lambda: self._done(key, worker))
+        self._running[key] = worker
+        self._alive.add(worker)
+        self.pool.start(worker)
+        return worker
+
+    def cancel(self, key):
+        worker = self._running.pop(key, None)
+        if worker is not None:
+            worker.token.cancel()
+
+    def cancel_all(self):
+        for key in list(self._running):
+            self.cancel(key)
+
+    def is_running(self, key):
+        return key in self._running
+
+    def _done(self, key, worker):
+        self._alive.discard(worker)
+        if self._running.get(key) is worker:
+            del self._running[key]
+
+def run_query(token, report_progress, sql, params=(), shape=None):
+    """Chạy câu truy vấn trên kết nối từ pool, lấy dữ liệu theo lô và xử lý kết quả ở luồng nền.
+
+    Tiến độ: 10% khi có kết nối, 40% khi máy chủ trả lời, 40-90% trong lúc
+    lấy dữ liệu, 100% khi xử lý xong. shape(rows) (nếu có) chạy ngay trong
+    luồng nền để giao diện chỉ việc hiển thị.
+    """
+    with ket_noi_db() as connection:
+        if connection is None:
+            raise ConnectionError("Không thể kết nối tới cơ sở dữ liệu!")
+        token.check()
+        report_progress(10)
+        cursor = connection.cursor()
+        token.attach(cursor)
+        try:
+            with tracer.span("db.execute"):
+                if params:
+                    cursor.execute(sql, params)
+                else:
+                    cursor.execute(sql)
+            token.check()
+            report_progress(40)
+            rows = []
+            fetched = 0
+            with tracer.span("db.fetch") as span:
+                while True:
+                    batch = cursor.fetchmany(FETCH_BATCH)
+                    token.check()
+                    if not batch:
+                        break
+                    rows.extend(batch)
+                    fetched += 1
+                    # Chưa biết tổng số dòng, tiến độ tiệm cận 90% theo số lô đã lấy
+                    report_progress(40 + 50 * fetched / (fetched + 1))
+                span.set(rows=len(rows))
+        finally:
+            token.attach(None)
+            cursor.close()
+    report_progress(90)
+    with tracer.span("shape", rows=len(rows)):
+        result = shape(rows) if shape else rows
+    token.check()
+    report_progress(100)
+    return result